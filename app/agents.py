@@ -1,25 +1,29 @@
 from langchain.chat_models import init_chat_model
 from langgraph.func import entrypoint
-from langgraph.store.memory import InMemoryStore
-from langmem import create_memory_store_manager
+from langmem import create_memory_manager, create_memory_store_manager
+from app.vector_store import PersistentVectorStore
 
-# 1. In-memory vector store, using Gemini embedding model
-store = InMemoryStore(
+# 1. Persistent vector store (SQLite + per-caller HNSW), using Gemini embedding model
+store = PersistentVectorStore(
     index={
         "dims": 1536,
-        "embedding_model": "gemini-embedding-exp-03-07",
+        "embed": "google_genai:models/gemini-embedding-exp-03-07",
     }
 )
 
 # 2. Use Gemini 2.5 Pro as your chat model
 llm = init_chat_model("google:gemini-2.5-pro")
 
-# 3. Memory manager: extracts/stores memories from every incoming message
+# 3. Memory manager: extracts/stores memories per caller ("phone_number" in the run config)
 memory_manager = create_memory_store_manager(
     "google:gemini-2.5-pro",
-    namespace=("memories",),
+    namespace=("memories", "{phone_number}"),
+    store=store,  # Bound explicitly, so it also works outside an entrypoint
 )
 
+# 4. Extraction only: the background ingestion worker de-duplicates its memories, then writes them to the store
+memory_extractor = create_memory_manager("google:gemini-2.5-pro")
+
 @entrypoint(store=store)
 async def chat(message: str):
     # save the user’s message
@@ -28,4 +32,4 @@ async def chat(message: str):
     result = await llm.ainvoke(message)
     return result.content
 
-__all__ = ["memory_manager", "chat"]
+__all__ = ["store", "memory_manager", "memory_extractor", "chat"]
@@ -1,62 +1,72 @@
 # app/ai.py
 import asyncio
-import io
-import base64
 import uuid
+from contextlib import aclosing
+from typing import Optional, Tuple
 from fastapi import WebSocket
-from app.clients import ElevenLabsClient, GroqClient, SupabaseClient
-from app.utils import split_into_sentences
-from app.redis_manager import RedisManager
+from app.clients import GroqClient
+from app.persistence import PersistenceWorker, column
+from app.pipeline import SpeechPipeline
+from app.approval import ApprovalQueue
+from app.utils import SentenceAggregator
+from app.conversation import Conversation
+from app.metrics import TurnTimer
+from app.response_cache import ResponseCache
 from app.logger import logger  # Consistent logging
-from app.agents import memory_manager
 
-async def generate_text_stream(user_message: str, groq_client: GroqClient, elevenlabs_client: ElevenLabsClient,
-                              supabase_client: SupabaseClient, websocket: WebSocket, stream_sid: str,
-                              transcription_id: int, redis_client: RedisManager, human_in_loop: bool):
-    """Generates text using Groq, streams to ElevenLabs, handles DB."""
+async def generate_text_stream(user_message: str, groq_client: GroqClient, pipeline: SpeechPipeline,
+                              websocket: WebSocket, stream_sid: str,
+                              transcription_ref: asyncio.Future, conversation: Conversation,
+                              approvals: Optional[ApprovalQueue] = None, timer: Optional[TurnTimer] = None,
+                              response_cache: Optional[ResponseCache] = None, script: Optional[str] = None):
+    """Generates text using Groq and feeds sentences to the call's TTS pipeline.
+
+    With human-in-the-loop on (``approvals`` given), each sentence is drafted
+    for supervisor review and plays only once approved. ``timer`` is the
+    turn's timer; it is marked at the first token and passed down the pipeline.
+
+    With a ``response_cache`` and the call's ``script``, a cached reply to
+    the turn is played instead, and a generated one is cached once fully
+    synthesized. Drafts under review are never cached or served from cache.
+    """
     try:
-        system_prompt = await redis_client.hget(f"call_state:{stream_sid}", "system_prompt")
-        if system_prompt is None:
-            raise ValueError(f"system_prompt not found in Redis for stream: {stream_sid}")
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message},
-        ]
-        try:
-            memory_manager.add_memory(user_message)
-        except Exception:
-            pass
+        cache_key = None
+        if response_cache is not None and script is not None and approvals is None:
+            cache_key = response_cache.key(script, conversation, user_message)
+        cached = await response_cache.get(cache_key) if cache_key is not None else None
+        # Static prefix + budgeted history + the new message; no per-turn Redis reads
+        messages = conversation.build_messages(user_message) if cached is None else None
+        await conversation.add("user", user_message)  # Also queues it for memory extraction
+        if cached is not None:
+            if timer is not None:
+                timer.mark("first_token")
+            for text, audio in cached:
+                await pipeline.submit(text, transcription_ref, None, timer, audio=audio)
+            return
+
         full_response_text = ""  # Accumulate the full response
-        async for chunk in await groq_client.generate_text_stream(messages):
-            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-                text_chunk = chunk.choices[0].delta.content
-                full_response_text += text_chunk  # Add to the full response
-
-                if human_in_loop:
-                    await websocket.send_json({
-                        "event": "partial_response",
-                        "text": full_response_text,  # Send accumulated text
-                        "stream_sid": stream_sid
-                    })
-
-                    # Wait for approval or modification
-                    try:
-                        response = await asyncio.wait_for(websocket.receive_json(), timeout=60)  # Adjust timeout as needed
-                        if response.get("event") == "override":
-                            full_response_text = response.get("text")  # Use the overridden text
-                            # Reset to send the FULL overridden text as a single sentence.
-                            await process_text_chunk(full_response_text, elevenlabs_client, supabase_client, websocket, stream_sid, transcription_id, redis_client, is_override=True)
-                            return  # Exit after processing the override
-
-                    except asyncio.TimeoutError:
-                        logger.warning("Human-in-the-loop response timed out. Continuing with generated text.")
-                        #Proceed
-                    except Exception as e:
-                        logger.error(f"Error getting human in the loop response {e}")
-                        #Proceed
-
-                await process_text_chunk(text_chunk, elevenlabs_client, supabase_client, websocket, stream_sid, transcription_id, redis_client)
+        aggregator = SentenceAggregator()  # Buffers deltas so TTS gets whole sentences/clauses
+        segments = []  # (text, synthesis task) of the reply, when it's to be cached
+        keep_audio = cache_key is not None
+        # aclosing() closes the upstream Groq stream as soon as this task is cancelled
+        async with aclosing(groq_client.generate_text_stream(messages)) as text_chunks, \
+                aclosing(_aggregate(text_chunks, aggregator)) as ready:
+            async for text_chunk, ready_segments in ready:
+                if text_chunk:
+                    if timer is not None:
+                        timer.mark("first_token")
+                    full_response_text += text_chunk  # Add to the full response
+                for segment in ready_segments:
+                    segments.append(await process_text_chunk(segment, pipeline, transcription_ref, approvals,
+                                                             timer, keep_audio))
+
+        for segment in aggregator.flush():
+            segments.append(await process_text_chunk(segment, pipeline, transcription_ref, approvals,
+                                                     timer, keep_audio))
+
+        segments = [segment for segment in segments if segment is not None]
+        if keep_audio and segments:
+            await response_cache.put(cache_key, segments)
 
     except Exception as e:
         logger.error(f"AI generation error for stream {stream_sid}: {e}")
@@ -64,66 +74,81 @@ async def generate_text_stream(user_message: str, groq_client: GroqClient, eleve
         await websocket.close(code=1011) #Close
 
 
-async def process_text_chunk(text_chunk: str, elevenlabs_client: ElevenLabsClient,
-                             supabase_client: SupabaseClient, websocket: WebSocket,
-                             stream_sid: str, transcription_id: int, redis_client: RedisManager, is_override: bool = False):
-    """Processes a chunk of text, splitting into sentences, and streaming."""
-    #If Override, send all at once, not just chunks
-    if is_override:
-        sentences = {"complete": [text_chunk], "remainder": ""}
-    else:
-        sentences = split_into_sentences(text_chunk)
-
-    for sentence in sentences["complete"] + ([sentences["remainder"].strip()] if sentences["remainder"].strip() else []):
-        logger.info(f"Sending to TTS: {sentence}")
-        try:
-            await stream_to_elevenlabs_and_db(sentence, elevenlabs_client, supabase_client, websocket, stream_sid, transcription_id, redis_client)
+async def _aggregate(text_chunks, aggregator: SentenceAggregator):
+    """Yields (delta, segments ready for TTS) from the Groq stream.
+
+    While the stream stalls, buffered text is still released once it has
+    waited ``max_wait_ms`` (yielded with an empty delta), rather than only
+    when the next delta arrives.
+    """
+    chunks = text_chunks.__aiter__()
+    next_chunk = None
+    try:
+        while True:
+            if next_chunk is None:
+                next_chunk = asyncio.ensure_future(chunks.__anext__())
+            # Not wait_for: a timeout must not cancel the read that's in flight
+            done, _ = await asyncio.wait({next_chunk}, timeout=aggregator.time_left())
+            if not done:
+                yield "", aggregator.push("")
+                continue
+            finished, next_chunk = next_chunk, None
             try:
-                memory_manager.add_memory(sentence)
-            except Exception:
-                pass
-        except Exception as e:
-            logger.error(f"Error in process_text_chunk: {e}")  # Log the specific error
-            await websocket.send_json({"event": "error", "message": "Error processing text chunk."}) # Notify User
-            await websocket.close(code=1011) # Close connection
-            return  # Important: Stop processing if TTS fails
-
-async def stream_to_elevenlabs_and_db(text: str, elevenlabs_client: ElevenLabsClient,
-                                     supabase_client: SupabaseClient, websocket: WebSocket,
-                                     stream_sid: str, transcription_id: int, redis_client: RedisManager):
-    """Streams TTS, sends to client, saves to Supabase."""
+                text_chunk = finished.result()
+            except StopAsyncIteration:
+                return
+            yield text_chunk, aggregator.push(text_chunk)
+    finally:
+        if next_chunk is not None:  # Interrupted mid-read: stop it before the Groq stream is closed
+            next_chunk.cancel()
+            await asyncio.gather(next_chunk, return_exceptions=True)
+
+
+async def process_text_chunk(text_chunk: str, pipeline: SpeechPipeline, transcription_ref: asyncio.Future,
+                             approvals: Optional[ApprovalQueue] = None, timer: Optional[TurnTimer] = None,
+                             keep_audio: bool = False) -> Optional[Tuple[str, asyncio.Task]]:
+    """Queues one aggregated segment (or a full override) for TTS and playback.
+
+    Drafts under review are synthesized speculatively; the pipeline holds
+    their audio until a supervisor decides. Returns the segment's text and
+    synthesis task (None for an empty segment).
+    """
+    sentence = text_chunk.strip()
+    if not sentence:
+        return None
+
+    logger.info(f"Sending to TTS: {sentence}")
+    gate = await approvals.draft(sentence) if approvals is not None else None
+    # Waits only while the prefetch window is full
+    return sentence, await pipeline.submit(sentence, transcription_ref, gate, timer, keep_audio=keep_audio)
+
+async def save_generated_audio(text: str, transcription_ref: asyncio.Future, audio_data: bytes,
+                               persistence: PersistenceWorker, websocket: WebSocket, stream_sid: str,
+                               conversation: Conversation, interrupted: bool = False):
+    """Records a played segment in the conversation, queues it for persistence
+    and reports it to the client.
+
+    Interrupted (barged-in) segments carry only the text and audio the caller heard.
+    """
     try:
-        # Get the http_client from the app's lifespan (passed as a dependency to the route)
-        audio_stream = await elevenlabs_client.stream_tts(text, http_client=websocket.app.state.http_client)  # Access http_client correctly
-        audio_data = io.BytesIO()
-        async for chunk in audio_stream:
-            audio_data.write(chunk)
-            encoded_chunk = base64.b64encode(chunk).decode("utf-8")
-            await websocket.send_json({
-                "event": "media",
-                "streamSid": stream_sid,
-                "media": {"payload": encoded_chunk},
-            })
-
-        audio_data.seek(0)  # Rewind for Supabase upload
-        unique_filename = f"generated_audio_{stream_sid}_{transcription_id}_{uuid.uuid4()}.ulaw"
-        audio_url = await supabase_client.upload_file(audio_data.read(), unique_filename)
-
-        # Insert into Supabase *and* send transcription event *within* this function
-        await supabase_client.insert("generated_texts", {
-            "transcription_id": transcription_id,
+        await conversation.add("assistant", text)
+
+        audio_path = None  # Audio isn't kept when ARCHIVE_GENERATED_AUDIO is off
+        if audio_data:
+            audio_path = persistence.upload(audio_data, f"generated_audio_{stream_sid}_{uuid.uuid4()}.ulaw")
+        persistence.insert("generated_texts", {
+            "transcription_id": column(transcription_ref, "id"),
             "text": text,
-            "audio_path": audio_url
+            "audio_path": audio_path
         })
-        # Send after successful TTS *and* Supabase upload
+        # Sent as soon as the audio has played; the DB write happens behind
         await websocket.send_json({
             "event": "transcription",
             "stream_sid": stream_sid,
             "text": text,
-            "role": "ai"
+            "role": "ai",
+            "interrupted": interrupted
         })
 
     except Exception as e:
-        logger.error(f"ElevenLabs/Supabase error for stream {stream_sid}: {e}")
-        await websocket.send_json({"event": "error", "message": "ElevenLabs/Supabase error."})
-        await websocket.close(code=1011)  # Internal error.  Close the connection.
\ No newline at end of file
+        logger.error(f"Error saving generated audio for stream {stream_sid}: {e}")
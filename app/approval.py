@@ -0,0 +1,79 @@
+# app/approval.py
+import asyncio
+import itertools
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from app.config import settings
+from app.logger import logger
+
+ACTIONS = ("approve", "edit", "reject")
+
+
+class ApprovalQueue:
+    """Sentence drafts of one call awaiting a supervisor's decision.
+
+    Each draft gets a gate future that resolves to the text to speak: the
+    draft itself when approved, the supervisor's text when edited, or None
+    when rejected. The speech pipeline synthesizes drafts while they wait and
+    holds their playback on the gate, so an approved sentence plays at once.
+    Drafts left undecided for ``timeout_s`` get ``timeout_action``.
+    """
+
+    def __init__(self, publish: Callable[[dict], Awaitable[None]],
+                 timeout_s: float = settings.HITL_APPROVAL_TIMEOUT_S,
+                 timeout_action: str = settings.HITL_TIMEOUT_ACTION):
+        if timeout_action not in ("approve", "reject"):
+            raise ValueError(f"Unknown HITL timeout action: {timeout_action}")
+        self.publish = publish  # Sends events to the call's supervisors
+        self.timeout_s = timeout_s
+        self.timeout_action = timeout_action
+        self._ids = itertools.count(1)
+        self._pending: Dict[str, Tuple[str, asyncio.Future, asyncio.TimerHandle]] = {}
+
+    async def draft(self, text: str) -> asyncio.Future:
+        """Registers a draft, announces it to supervisors and returns its gate."""
+        draft_id = str(next(self._ids))
+        gate = asyncio.get_running_loop().create_future()
+        timer = asyncio.get_running_loop().call_later(self.timeout_s, self._expire, draft_id)
+        self._pending[draft_id] = (text, gate, timer)
+        await self.publish({"event": "draft", "draft_id": draft_id, "text": text})
+        return gate
+
+    def decide(self, draft_id: str, action: str, text: Optional[str] = None) -> bool:
+        """Applies a supervisor decision; False if the draft is no longer pending."""
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown approval action: {action}")
+        pending = self._pending.pop(str(draft_id), None)
+        if pending is None:
+            return False
+        draft_text, gate, timer = pending
+        timer.cancel()
+        if action == "approve":
+            result = draft_text
+        elif action == "edit":
+            result = (text or "").strip() or None  # An edit to nothing is a rejection
+        else:
+            result = None
+        if not gate.done():
+            gate.set_result(result)
+        asyncio.get_running_loop().create_task(
+            self.publish({"event": "draft_decided", "draft_id": str(draft_id), "action": action, "text": result}))
+        return True
+
+    def approve_pending(self):
+        """Approves every undecided draft (human-in-the-loop was switched off)."""
+        for draft_id in list(self._pending):
+            self.decide(draft_id, "approve")
+
+    def cancel_pending(self):
+        """Withdraws every undecided draft (the reply was interrupted)."""
+        for draft_id in list(self._pending):
+            _, gate, timer = self._pending.pop(draft_id)
+            timer.cancel()
+            gate.cancel()
+            asyncio.get_running_loop().create_task(
+                self.publish({"event": "draft_withdrawn", "draft_id": draft_id}))
+
+    def _expire(self, draft_id: str):
+        if draft_id in self._pending:
+            logger.warning(f"Draft {draft_id} not reviewed in {self.timeout_s}s; applying {self.timeout_action}")
+            self.decide(draft_id, self.timeout_action)
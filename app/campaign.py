@@ -0,0 +1,402 @@
+# app/campaign.py
+import asyncio
+import csv
+import io
+import json
+import time
+import uuid
+from typing import Dict, List, Tuple
+from app.clients import SupabaseClient
+from app.config import settings
+from app.redis_manager import RedisManager
+from app.logger import logger
+
+CONTACT_FIELDS = ("phone_number", "system_prompt", "instructions", "context")
+RETRY_STATUSES = ("busy", "no-answer")  # Final Twilio call statuses worth dialing again
+FINAL_STATUSES = ("completed", "busy", "no-answer", "failed", "canceled")
+
+_STATUS_CHANNEL = "campaign_status:{campaign_id}"
+_PROGRESS_KEY = "campaign:{campaign_id}"
+
+
+class InvalidCampaign(ValueError):
+    """The upload has no usable contacts or is too large."""
+
+
+def parse_contacts(data: bytes, filename: str = "") -> Tuple[List[dict], List[str]]:
+    """Contacts from a CSV (with a header row) or JSONL upload, and per-row errors.
+
+    Each row needs ``phone_number``; ``system_prompt``, ``instructions`` and
+    ``context`` override the campaign defaults for that contact.
+    """
+    text = data.decode("utf-8-sig")
+    if filename.endswith(".jsonl") or filename.endswith(".ndjson") or text.lstrip().startswith("{"):
+        rows = []
+        for line_no, line in enumerate(text.splitlines(), 1):
+            if line.strip():
+                try:
+                    rows.append((line_no, json.loads(line)))
+                except ValueError:
+                    rows.append((line_no, None))
+    else:
+        rows = list(enumerate(csv.DictReader(io.StringIO(text)), 2))  # Line 1 is the header
+
+    contacts, errors = [], []
+    for line_no, row in rows:
+        if not isinstance(row, dict):
+            errors.append(f"line {line_no}: not a JSON object")
+            continue
+        number = str(row.get("phone_number") or "").strip()
+        if not number.lstrip("+").isdigit():
+            errors.append(f"line {line_no}: invalid phone_number {number!r}")
+            continue
+        contact = {field: str(row[field]) for field in CONTACT_FIELDS[1:] if row.get(field)}
+        contact["phone_number"] = number
+        contacts.append(contact)
+    if len(contacts) > settings.CAMPAIGN_MAX_CONTACTS:
+        raise InvalidCampaign(f"At most {settings.CAMPAIGN_MAX_CONTACTS} contacts per campaign")
+    if not contacts:
+        raise InvalidCampaign("No valid contacts: " + "; ".join(errors[:5]) if errors else "No contacts")
+    return contacts, errors
+
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second on average, bursting to ``burst``.
+
+    Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _Campaign:
+    def __init__(self, campaign_id: str, contacts: List[dict], defaults: dict, base_url: str):
+        self.id = campaign_id
+        self.defaults = defaults  # system_prompt / instructions / context for rows that don't set them
+        self.base_url = base_url  # Public origin Twilio calls back (TwiML and status callbacks)
+        self.contacts = contacts
+        self.calls: Dict[str, dict] = {}  # Call SID -> contact, while the call is live
+        self.retry_handles = set()  # Scheduled redials
+        self.outstanding = len(contacts)  # Contacts without a final outcome yet
+        self.queued = 0  # Contacts in the dial queue or being dialed
+        self.started_at = time.time()
+        self.cancelled = False
+        self.counts = {"total": len(contacts), "dialed": 0, "active": 0, "completed": 0, "busy": 0,
+                       "no-answer": 0, "failed": 0, "canceled": 0, "retries": 0, "dial_errors": 0}
+
+    def progress(self) -> dict:
+        state = "cancelled" if self.cancelled else ("done" if self.outstanding == 0 else "running")
+        return {"campaign_id": self.id, "state": state, "outstanding": self.outstanding,
+                "started_at": self.started_at, **self.counts}
+
+
+class CampaignDialer:
+    """Dials outbound campaigns through a rate-limited worker pool.
+
+    Contacts from every campaign on this worker share one queue. Dial workers
+    take a contact once an active-call slot is free (``max_active`` is sized
+    to TTS/LLM capacity). They then wait on a token bucket matched to Twilio's
+    calls-per-second limit before creating the call. Dialed calls are written
+    in batches: one multi-row ``calls`` insert plus one Redis pipeline for
+    their call state. A slot is freed by the call's final status callback,
+    which any worker receives and publishes to the campaign's channel. Busy
+    and unanswered contacts are redialed later, up to ``max_attempts``
+    times. Progress is mirrored to ``campaign:{id}`` in Redis, so any worker
+    can report it.
+
+    The limits are per process: with several Uvicorn workers, divide the
+    account's CPS between them.
+    """
+
+    def __init__(self, twilio_client_factory, supabase_client: SupabaseClient,
+                 rate: float = settings.CAMPAIGN_DIAL_RATE, burst: int = settings.CAMPAIGN_DIAL_BURST,
+                 max_active: int = settings.CAMPAIGN_MAX_ACTIVE_CALLS, workers: int = settings.CAMPAIGN_DIAL_WORKERS,
+                 max_attempts: int = settings.CAMPAIGN_MAX_ATTEMPTS,
+                 retry_delay_s: float = settings.CAMPAIGN_RETRY_DELAY_S,
+                 write_batch: int = settings.CAMPAIGN_WRITE_BATCH,
+                 flush_interval_ms: int = settings.CAMPAIGN_FLUSH_INTERVAL_MS,
+                 call_timeout_s: float = settings.CAMPAIGN_CALL_TIMEOUT_S):
+        self.twilio_client_factory = twilio_client_factory  # Twilio's SDK is built lazily (see ClientRegistry)
+        self.supabase_client = supabase_client
+        self.bucket = TokenBucket(rate, burst)
+        self.max_active = max(max_active, 1)
+        self.workers = max(workers, 1)
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_delay = retry_delay_s
+        self.write_batch = max(write_batch, 1)
+        self.flush_interval = flush_interval_ms / 1000
+        self.call_timeout = call_timeout_s
+        self._campaigns: Dict[str, _Campaign] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()  # (campaign, contact)
+        self._dialed: asyncio.Queue = asyncio.Queue()  # (campaign, contact, call_sid) awaiting their writes
+        self._slots = asyncio.Semaphore(self.max_active)
+        self._timeouts: Dict[str, asyncio.TimerHandle] = {}  # Call SID -> slot release if no callback arrives
+        self._tasks = []
+        self._saves = set()  # Progress writes started from timer callbacks
+        self._pubsub = None
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._pubsub = RedisManager.get_client().pubsub()
+        await self._pubsub.psubscribe(_STATUS_CHANNEL.format(campaign_id="*"))
+        self._tasks = [asyncio.create_task(self._dial_worker()) for _ in range(self.workers)]
+        self._tasks += [asyncio.create_task(self._flush_writes()), asyncio.create_task(self._listen())]
+        logger.info(f"Campaign dialer started ({self.workers} dialers, {self.max_active} active calls max).")
+
+    async def close(self):
+        if not self._tasks:
+            return
+        for campaign in self._campaigns.values():
+            for handle in campaign.retry_handles:
+                handle.cancel()
+        for handle in self._timeouts.values():
+            handle.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._saves, return_exceptions=True)
+        await self._pubsub.close()
+        self._tasks = []
+        logger.info("Campaign dialer stopped.")
+
+    async def submit(self, contacts: List[dict], defaults: dict, base_url: str) -> str:
+        """Queues a campaign; returns its id."""
+        campaign = _Campaign(uuid.uuid4().hex, contacts, defaults, base_url.rstrip("/"))
+        self._campaigns[campaign.id] = campaign
+        for contact in contacts:
+            contact["attempts"] = 0
+            self._enqueue(campaign, contact)
+        await self._save_progress(campaign)
+        logger.info(f"Campaign {campaign.id} queued with {len(contacts)} contacts.")
+        return campaign.id
+
+    async def cancel(self, campaign_id: str):
+        """Stops dialing a campaign from whichever worker runs it (live calls continue)."""
+        await self.publish_status(campaign_id, {"event": "cancel"})
+
+    @staticmethod
+    async def publish_status(campaign_id: str, event: dict):
+        await RedisManager.get_client().publish(_STATUS_CHANNEL.format(campaign_id=campaign_id), json.dumps(event))
+
+    @staticmethod
+    async def progress(campaign_id: str) -> dict:
+        state = await RedisManager.hgetall(_PROGRESS_KEY.format(campaign_id=campaign_id))
+        return {key: _number(value) for key, value in state.items()}
+
+    def _enqueue(self, campaign: _Campaign, contact: dict):
+        campaign.queued += 1
+        self._queue.put_nowait((campaign, contact))
+
+    async def _dial_worker(self):
+        while True:
+            campaign, contact = await self._queue.get()
+            try:
+                if campaign.cancelled:
+                    continue
+                await self._slots.acquire()
+                await self.bucket.acquire()
+                if campaign.cancelled:
+                    self._slots.release()
+                    continue
+                await self._dial(campaign, contact)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Campaign {campaign.id} dial worker error: {e}")
+            finally:
+                campaign.queued -= 1  # Dialed or skipped
+                self._forget_if_cancelled(campaign)
+                self._queue.task_done()
+
+    async def _dial(self, campaign: _Campaign, contact: dict):
+        contact["attempts"] += 1
+        try:
+            call = await self.twilio_client_factory().make_call(
+                contact["phone_number"], f"{campaign.base_url}/twiml",
+                status_callback=f"{campaign.base_url}/campaigns/{campaign.id}/status")
+        except Exception as e:
+            self._slots.release()
+            campaign.counts["dial_errors"] += 1
+            status = getattr(e, "status", None)
+            # Rate limited or a Twilio outage: try again later; anything else (bad number...) is final
+            retryable = status == 429 or (isinstance(status, int) and status >= 500)
+            logger.warning(f"Campaign {campaign.id}: dialing {contact['phone_number']} failed ({e})")
+            self._finish(campaign, contact, "failed", retryable)
+            await self._save_progress(campaign)
+            return
+        campaign.counts["dialed"] += 1
+        campaign.counts["active"] += 1
+        campaign.calls[call.sid] = contact
+        self._timeouts[call.sid] = asyncio.get_running_loop().call_later(
+            self.call_timeout, self._on_timeout, campaign, call.sid)
+        self._dialed.put_nowait((campaign, contact, call.sid))
+
+    async def _next_writes(self) -> list:
+        batch = [await self._dialed.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+        while len(batch) < self.write_batch:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._dialed.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush_writes(self):
+        """Writes dialed calls in batches: one ``calls`` insert, one Redis pipeline.
+
+        Twilio only requests the TwiML (and opens the media stream) once the
+        call is answered, by which time its state is in Redis.
+        """
+        while True:
+            batch = await self._next_writes()
+            try:
+                rows = []
+                for campaign, contact, call_sid in batch:
+                    rows.append({
+                        "twilio_sid": call_sid,
+                        "from_number": settings.TWILIO_NUMBER,
+                        "to_number": contact["phone_number"],
+                        "status": "initiated",
+                        "campaign_id": campaign.id,
+                        **{field: self._field(campaign, contact, field) for field in CONTACT_FIELDS[1:]},
+                    })
+                inserted = await self.supabase_client.insert_many("calls", rows)
+                async with RedisManager.pipeline(transaction=False) as pipe:
+                    for (campaign, contact, call_sid), record in zip(batch, inserted):
+                        key = f"call_state:{call_sid}"
+                        pipe.hset(key, mapping={
+                            "call_db_id": str(record["id"]),
+                            "to_number": contact["phone_number"],
+                            "human_in_loop": "false",
+                            "campaign_id": campaign.id,
+                            **{field: self._field(campaign, contact, field) for field in CONTACT_FIELDS[1:]},
+                        })
+                        pipe.expire(key, settings.CALL_STATE_TTL_S)
+                    for campaign in {campaign for campaign, _, _ in batch}:
+                        self._queue_progress(pipe, campaign)
+                    await pipe.execute()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Without call state the media stream is refused, so these calls end on their own
+                logger.error(f"Campaign write of {len(batch)} calls failed: {e}")
+
+    @staticmethod
+    def _field(campaign: _Campaign, contact: dict, field: str) -> str:
+        return contact.get(field) or campaign.defaults.get(field, "")
+
+    async def _listen(self):
+        prefix = _STATUS_CHANNEL.format(campaign_id="")
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    campaign = self._campaigns.get(message["channel"][len(prefix):])
+                    if campaign is None:
+                        continue  # Run by another worker
+                    event = json.loads(message["data"])
+                    if event.get("event") == "cancel":
+                        self._cancel(campaign)
+                    elif event.get("call_status") in FINAL_STATUSES:
+                        self._on_final_status(campaign, event.get("call_sid"), event["call_status"])
+                    await self._save_progress(campaign)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Campaign status listener error: {e}")
+                await asyncio.sleep(1)
+
+    def _on_timeout(self, campaign: _Campaign, call_sid: str):
+        """No final status arrived for the call: free its slot and count it as failed."""
+        self._timeouts.pop(call_sid, None)
+        self._on_final_status(campaign, call_sid, "failed")
+        task = asyncio.create_task(self._save_progress(campaign))
+        self._saves.add(task)
+        task.add_done_callback(self._saves.discard)
+
+    def _on_final_status(self, campaign: _Campaign, call_sid: str, status: str):
+        contact = campaign.calls.pop(call_sid, None)
+        if contact is None:
+            return  # Duplicate callback, or the timeout already fired
+        timeout = self._timeouts.pop(call_sid, None)
+        if timeout is not None:
+            timeout.cancel()
+        self._slots.release()
+        campaign.counts["active"] -= 1
+        self._finish(campaign, contact, status, status in RETRY_STATUSES)
+        self._forget_if_cancelled(campaign)
+
+    def _finish(self, campaign: _Campaign, contact: dict, status: str, retryable: bool):
+        if retryable and contact["attempts"] < self.max_attempts and not campaign.cancelled:
+            campaign.counts["retries"] += 1
+            handle = None
+
+            def redial():
+                campaign.retry_handles.discard(handle)
+                self._enqueue(campaign, contact)
+
+            handle = asyncio.get_running_loop().call_later(self.retry_delay, redial)
+            campaign.retry_handles.add(handle)
+            return
+        campaign.counts[status] = campaign.counts.get(status, 0) + 1
+        campaign.outstanding -= 1
+        if campaign.outstanding == 0:
+            logger.info(f"Campaign {campaign.id} finished: {campaign.counts}")
+            asyncio.get_running_loop().call_later(settings.CALL_STATE_TTL_S, self._campaigns.pop, campaign.id, None)
+
+    def _cancel(self, campaign: _Campaign):
+        campaign.cancelled = True
+        for handle in campaign.retry_handles:
+            handle.cancel()
+        campaign.retry_handles.clear()
+        logger.info(f"Campaign {campaign.id} cancelled with {campaign.outstanding} contacts outstanding.")
+        self._forget_if_cancelled(campaign)
+
+    def _forget_if_cancelled(self, campaign: _Campaign):
+        """Drops a cancelled campaign (and its contact list) once its queued contacts
+        are skipped and its live calls have ended; its progress stays in Redis."""
+        if campaign.cancelled and campaign.queued == 0 and not campaign.calls:
+            self._campaigns.pop(campaign.id, None)
+
+    def _queue_progress(self, pipe, campaign: _Campaign):
+        key = _PROGRESS_KEY.format(campaign_id=campaign.id)
+        pipe.hset(key, mapping={name: str(value) for name, value in campaign.progress().items()})
+        pipe.expire(key, settings.CALL_STATE_TTL_S)
+
+    async def _save_progress(self, campaign: _Campaign):
+        try:
+            async with RedisManager.pipeline(transaction=False) as pipe:
+                self._queue_progress(pipe, campaign)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error saving progress of campaign {campaign.id}: {e}")
+
+
+def _number(value: str):
+    """Progress hash values back to numbers where they are numbers."""
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
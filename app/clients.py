@@ -1,84 +1,162 @@
 # app/clients.py
 import httpx
-from twilio.rest import Client  # Still synchronous, but we'll handle it
-from groq import Groq
-from supabase import create_client, Client as SupabaseClientType
-from google.cloud import aiplatform
-from google.oauth2 import service_account
 import json
 from app.config import settings
 from app.logger import logger  # Use the application logger
+from app.tts_cache import TtsCache
 import asyncio
+from typing import Optional
+
+# Provider SDKs are imported when a client is built (see ClientRegistry), not with this module
 
 class TwilioClient:
     def __init__(self):
+        from twilio.rest import Client  # Still synchronous, but we'll handle it
         self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
         self.twilio_number = settings.TWILIO_NUMBER
 
-    async def make_call(self, to_number, twiml_url):
+    async def make_call(self, to_number, twiml_url, status_callback: Optional[str] = None):
         # Wrap synchronous call in asyncio.to_thread
-        return await asyncio.to_thread(self.client.calls.create, to=to_number, from_=self.twilio_number, url=twiml_url, method="POST")
+        callback = {}
+        if status_callback:  # Twilio POSTs the final CallStatus (completed, busy, no-answer, ...) here
+            callback = {"status_callback": status_callback, "status_callback_event": ["completed"],
+                        "status_callback_method": "POST"}
+        return await asyncio.to_thread(self.client.calls.create, to=to_number, from_=self.twilio_number, url=twiml_url,
+                                       method="POST", **callback)
 
     async def send_sms(self, to_number, message):
         # Wrap synchronous call in asyncio.to_thread
         return await asyncio.to_thread(self.client.messages.create, to=to_number, from_=self.twilio_number, body=message)
 
+    async def hangup(self, call_sid):
+        # Completing the call makes Twilio send "stop" on its media stream
+        return await asyncio.to_thread(self.client.calls(call_sid).update, status="completed")
+
 class SupabaseClient:
+    """Async PostgREST/Storage client that runs on the shared httpx connection pool."""
+
     def __init__(self, http_client: httpx.AsyncClient):
-        self.client: SupabaseClientType = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-        self.bucket = settings.SUPABASE_BUCKET
         self.http_client = http_client  # Use the injected client
+        self.bucket = settings.SUPABASE_BUCKET
+        base_url = settings.SUPABASE_URL.rstrip("/")
+        self.rest_url = f"{base_url}/rest/v1"
+        self.storage_url = f"{base_url}/storage/v1"
+        self.headers = {
+            "apikey": settings.SUPABASE_KEY,
+            "Authorization": f"Bearer {settings.SUPABASE_KEY}",
+        }
 
     async def insert(self, table_name, data):
-        # Use asyncio.to_thread for synchronous Supabase operations
-        result = await asyncio.to_thread(self.client.table(table_name).insert(data).execute)
-        return result.data[0]  # Access data correctly
+        return (await self.insert_many(table_name, [data]))[0]
+
+    async def insert_many(self, table_name: str, rows: list) -> list:
+        """Inserts several rows in one request; returns the inserted records in order."""
+        response = await self.http_client.post(
+            f"{self.rest_url}/{table_name}", json=rows,
+            headers={**self.headers, "Prefer": "return=representation"})
+        response.raise_for_status()
+        return response.json()
 
     async def update(self, table_name, data, key_column, key_value):
-        result = await asyncio.to_thread(self.client.table(table_name).update(data).eq(key_column, key_value).execute)
-        return result.data #Correct return
+        response = await self.http_client.patch(
+            f"{self.rest_url}/{table_name}", json=data, params={key_column: f"eq.{key_value}"},
+            headers={**self.headers, "Prefer": "return=representation"})
+        response.raise_for_status()
+        return response.json()
 
     async def get(self, table_name, key_column, key_value):
-        result = await asyncio.to_thread(self.client.table(table_name).select("*").eq(key_column, key_value).execute)
-        return result.data[0] if result.data else None
+        response = await self.http_client.get(
+            f"{self.rest_url}/{table_name}", params={"select": "*", key_column: f"eq.{key_value}", "limit": "1"},
+            headers=self.headers)
+        response.raise_for_status()
+        rows = response.json()
+        return rows[0] if rows else None
+
+    async def select(self, table_name: str, columns: str = "*", filters: Optional[dict] = None,
+                     order: Optional[str] = None, limit: Optional[int] = None) -> list:
+        """Rows filtered, ordered and limited by PostgREST (``filters`` are raw
+        PostgREST params, e.g. ``{"status": "eq.completed"}``)."""
+        params = {"select": columns, **(filters or {})}
+        if order:
+            params["order"] = order
+        if limit is not None:
+            params["limit"] = str(limit)
+        response = await self.http_client.get(f"{self.rest_url}/{table_name}", params=params, headers=self.headers)
+        response.raise_for_status()
+        return response.json()
+
     async def get_all(self, table_name: str) -> list:
         """Retrieves all records from the specified table."""
         try:
-            result = await asyncio.to_thread(self.client.table(table_name).select("*").execute)
-            return result.data
+            response = await self.http_client.get(
+                f"{self.rest_url}/{table_name}", params={"select": "*"}, headers=self.headers)
+            response.raise_for_status()
+            return response.json()
         except Exception as e:
             logger.error(f"Error retrieving all records from table {table_name}: {e}")
             return []
 
-
     async def upload_file(self, data: bytes, filename: str) -> str:
         """Uploads a file to Supabase Storage and returns the public URL."""
         try:
-            # Use the Supabase client's upload method (more robust)
-            await asyncio.to_thread(self.client.storage.from_(self.bucket).upload, path=filename, file=data)
-            public_url = self.client.storage.from_(self.bucket).get_public_url(filename)
-            return public_url
+            response = await self.http_client.post(
+                f"{self.storage_url}/object/{self.bucket}/{filename}", content=data,
+                headers={**self.headers, "Content-Type": "application/octet-stream"})
+            response.raise_for_status()
+            return f"{self.storage_url}/object/public/{self.bucket}/{filename}"
         except Exception as e:
             logger.error(f"Supabase file upload error: {e}")
             raise  # Re-raise the exception to be handled upstream
 
 
 class GroqClient:
-    def __init__(self):
-        self.client = Groq(api_key=settings.GROQ_API_KEY)
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        from groq import AsyncGroq
+        # Async SDK on the shared pool: token reads never block the event loop
+        self.client = AsyncGroq(api_key=settings.GROQ_API_KEY, http_client=http_client, base_url=settings.GROQ_BASE_URL,
+                                timeout=settings.GROQ_TIMEOUT_S, max_retries=0)
         self.model = settings.GROQ_MODEL
 
-    async def generate_text_stream(self, messages, max_tokens=300):
-        return self.client.chat.completions.create(messages=messages, model=self.model, stream=True, max_tokens=max_tokens)
+    async def generate_text_stream(self, messages, max_tokens=300, timeout: Optional[float] = None):
+        """Yields text deltas. The upstream stream is closed when the consumer
+        stops early or its task is cancelled (e.g. on barge-in)."""
+        stream = await self.client.chat.completions.create(
+            messages=messages, model=self.model, stream=True, max_tokens=max_tokens,
+            timeout=timeout or settings.GROQ_TIMEOUT_S)
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
 
 class ElevenLabsClient:
+    OUTPUT_FORMAT = "ulaw_8000"
+
     def __init__(self):
         self.api_key = settings.ELEVENLABS_API_KEY
         self.voice_id = settings.VOICE_ID
         self.model = settings.ELEVENLABS_MODEL
         self.base_url = settings.ELEVENLABS_API_BASE_URL
+        self.cache = None  # Repeated segments skip the API when on
+        if settings.TTS_CACHE_ENABLED:
+            try:
+                self.cache = TtsCache()
+            except OSError as e:  # E.g. an unwritable TTS_CACHE_DIR; synthesize everything instead
+                logger.error(f"TTS cache disabled: {e}")
+
+    def cache_key(self, text: str) -> str:
+        return self.cache.key(text, self.voice_id, self.model, self.OUTPUT_FORMAT)
 
     async def stream_tts(self, text, http_client: httpx.AsyncClient):  # Inject httpx
+        key = None
+        if self.cache is not None:
+            key = self.cache_key(text)
+            cached = self.cache.get(key)
+            if cached is not None:
+                async for chunk in cached:
+                    yield chunk
+                return
         url = f"{self.base_url}/text-to-speech/{self.voice_id}/stream"
         headers = {
             "Accept": "audio/ulaw",
@@ -88,20 +166,27 @@ class ElevenLabsClient:
         data = {
             "text": text,
             "model_id": self.model,
-            "output_format": "ulaw_8000"
+            "output_format": self.OUTPUT_FORMAT
         }
+        audio = bytearray() if key is not None else None
         try:
             async with http_client.stream("POST", url, headers=headers, json=data) as response:
                 response.raise_for_status()  # Raise HTTP errors
                 async for chunk in response.aiter_bytes():
+                    if audio is not None:
+                        audio.extend(chunk)
                     yield chunk
         except httpx.HTTPError as e:
             logger.error(f"ElevenLabs API error: {e}")
             raise  # Re-raise to handle upstream
+        if audio is not None:
+            self.cache.put(key, bytes(audio))  # Only complete audio; a cancelled stream never gets here
 
 class GoogleClient:
     def __init__(self):
         # Use the Vertex AI SDK for a cleaner approach
+        from google.cloud import aiplatform
+        from google.oauth2 import service_account
 
         credentials = service_account.Credentials.from_service_account_info(json.loads(settings.GOOGLE_API_KEY))
         aiplatform.init(project=credentials.project_id, credentials=credentials, location="us-central1") # Initialize client
@@ -109,8 +194,14 @@ class GoogleClient:
 
 
     async def generate_text(self, messages, max_tokens=300):
+        """Replies to the last message; system messages become the chat context
+        and the turns in between its history."""
+        from vertexai.language_models import ChatMessage
         try:
-            chat = self.model.start_chat(context=messages[0]['content']) #Correct
+            context = "\n\n".join(message["content"] for message in messages if message["role"] == "system")
+            history = [ChatMessage(content=message["content"], author="user" if message["role"] == "user" else "bot")
+                       for message in messages[:-1] if message["role"] != "system"]
+            chat = self.model.start_chat(context=context, message_history=history)
             parameters = {
                 "max_output_tokens": max_tokens,
                 "temperature": 0.7,
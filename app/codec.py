@@ -0,0 +1,80 @@
+# app/codec.py
+import struct
+import numpy as np
+
+SAMPLE_RATE = 8000  # Twilio media streams are 8 kHz mono mu-law
+SAMPLE_WIDTH = 2  # 16-bit linear PCM
+WAV_HEADER_SIZE = 44
+
+_BIAS = 0x84
+_ENCODE_BIAS = _BIAS >> 2  # The encoder works on 14-bit magnitudes
+_ENCODE_CLIP = 8159
+
+def _build_decode_table() -> np.ndarray:
+    """G.711 mu-law byte -> 16-bit linear sample, one entry per code."""
+    table = np.empty(256, dtype="<i2")
+    for code in range(256):
+        u = ~code & 0xFF
+        exponent = (u >> 4) & 0x07
+        sample = (((u & 0x0F) << 3) + _BIAS) << exponent
+        sample -= _BIAS
+        table[code] = -sample if u & 0x80 else sample
+    return table
+
+
+def _build_segment_table() -> np.ndarray:
+    """Segment lookup indexed by the biased 14-bit magnitude >> 6."""
+    table = np.zeros(256, dtype=np.int32)
+    for value in range(1, 256):
+        table[value] = value.bit_length()
+    return table
+
+
+ULAW_DECODE_TABLE = _build_decode_table()
+_SEGMENT_TABLE = _build_segment_table()
+
+
+def ulaw_decode(ulaw: bytes) -> np.ndarray:
+    """Decodes mu-law bytes to an int16 PCM array."""
+    return ULAW_DECODE_TABLE[np.frombuffer(ulaw, dtype=np.uint8)]
+
+
+def ulaw_encode(pcm: np.ndarray) -> bytes:
+    """Encodes 16-bit PCM samples to mu-law bytes (bit-exact with the G.711 reference)."""
+    samples = np.asarray(pcm, dtype=np.int32) >> 2
+    mask = np.where(samples < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(samples), _ENCODE_CLIP) + _ENCODE_BIAS
+    segment = _SEGMENT_TABLE[magnitude >> 6]
+    code = (np.minimum(segment, 7) << 4) | ((magnitude >> (segment + 1)) & 0x0F)
+    code = np.where(segment > 7, 0x7F, code)
+    return (code ^ mask).astype(np.uint8).tobytes()
+
+
+def rms(ulaw: bytes) -> float:
+    """Root-mean-square energy of a mu-law frame on the 16-bit PCM scale."""
+    if not ulaw:
+        return 0.0
+    pcm = ulaw_decode(ulaw).astype(np.float32)
+    return float(np.sqrt(np.mean(pcm * pcm)))
+
+
+def write_wav_header(buffer: bytearray, data_size: int, sample_rate: int = SAMPLE_RATE,
+                     channels: int = 1, sample_width: int = SAMPLE_WIDTH, offset: int = 0) -> None:
+    """Writes a 44-byte PCM WAV header into ``buffer`` at ``offset``."""
+    struct.pack_into(
+        "<4sI4s4sIHHIIHH4sI", buffer, offset,
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate,
+        sample_rate * channels * sample_width, channels * sample_width, sample_width * 8,
+        b"data", data_size,
+    )
+
+
+def ulaw_to_wav(ulaw: bytes, sample_rate: int = SAMPLE_RATE) -> bytearray:
+    """Decodes mu-law audio straight into a preallocated 16-bit PCM WAV buffer."""
+    data_size = len(ulaw) * SAMPLE_WIDTH
+    buffer = bytearray(WAV_HEADER_SIZE + data_size)
+    write_wav_header(buffer, data_size, sample_rate)
+    pcm = np.frombuffer(buffer, dtype="<i2", offset=WAV_HEADER_SIZE)
+    np.take(ULAW_DECODE_TABLE, np.frombuffer(ulaw, dtype=np.uint8), out=pcm)
+    return buffer
@@ -1,5 +1,6 @@
 # app/config.py
 import os
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -14,11 +15,102 @@ class Settings(BaseSettings):
     SUPABASE_KEY: str
     SUPABASE_BUCKET: str
     WHISPER_API_URL: str = "http://127.0.0.1:9000/v1/audio/transcriptions"  # Default
+    WHISPER_STREAM_RESPONSE: bool = False  # Ask the Whisper server for SSE segments (partial hypotheses)
+    TRANSCRIPTION_BACKEND: str = "http"  # Chunked multipart upload to WHISPER_API_URL
     REDIS_URL: str = "redis://localhost:6379/0"  # Default
     GROQ_MODEL: str = "llama3-70b-8192"  # Default
+    GROQ_TIMEOUT_S: float = 15.0  # Per-request timeout for a completion stream
+    GROQ_BASE_URL: Optional[str] = None  # Override the Groq API origin (e.g. a local stand-in); SDK default if unset
     ELEVENLABS_MODEL: str = "eleven_turbo_v2"  # Default
     ELEVENLABS_API_BASE_URL: str = "https://api.elevenlabs.io/v1"  # Elevenlabs URL
     GOOGLE_MODEL: str = "gemini-1.0-pro"  # Default.  Changed to a valid model name.
+    HTTP_TIMEOUT_S: float = 10.0
+    HTTP_MAX_CONNECTIONS: int = 200  # Shared pool across all HTTP providers
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 50
+    HTTP_KEEPALIVE_EXPIRY_S: float = 60.0
+    HTTP2_ENABLED: bool = True
+    LOOP_LAG_SAMPLE_INTERVAL_MS: int = 100  # How often event-loop lag is sampled for /metrics
+    CLIENT_WARMUP: bool = True  # Open provider connections during startup
+    CLIENT_WARMUP_TIMEOUT_S: float = 3.0
+    TTS_FIRST_SEGMENT_MIN_CHARS: int = 12  # First TTS segment of a reply may be this short (time-to-first-audio)
+    TTS_SEGMENT_MIN_CHARS: int = 40  # Later segments combine short sentences up to this length
+    TTS_CLAUSE_MIN_CHARS: int = 80  # Split long sentences at a clause boundary past this length
+    TTS_SEGMENT_MAX_WAIT_MS: int = 600  # Release buffered text at a word boundary after this long
+    TTS_PREFETCH_SEGMENTS: int = 2  # Segments synthesized ahead of the one currently playing
+    PERSIST_QUEUE_MAXSIZE: int = 10000  # Pending write-behind jobs before the overflow policy applies
+    PERSIST_OVERFLOW_POLICY: str = "drop_oldest"  # "drop_oldest" or "drop_newest"; enqueueing never blocks
+    PERSIST_BATCH_SIZE: int = 100  # Max jobs flushed together
+    PERSIST_FLUSH_INTERVAL_MS: int = 200  # How long a batch waits to fill up
+    PERSIST_MAX_RETRIES: int = 5
+    PERSIST_RETRY_BACKOFF_MS: int = 200  # Doubled on every retry
+    PERSIST_DRAIN_TIMEOUT_S: float = 10.0  # Time allowed to flush pending jobs on shutdown
+    PLAYBACK_LEAD_MS: int = 300  # Audio kept queued at Twilio ahead of the playback clock
+    ARCHIVE_GENERATED_AUDIO: bool = True  # Upload generated audio to storage (holds one segment in memory)
+    BARGE_IN_ENABLED: bool = True  # Caller speech cuts off the assistant's audio
+    BARGE_IN_MIN_SPEECH_MS: int = 200  # Voiced audio needed before a barge-in triggers
+    HITL_APPROVAL_TIMEOUT_S: float = 60.0  # Undecided drafts get HITL_TIMEOUT_ACTION after this
+    HITL_TIMEOUT_ACTION: str = "approve"  # "approve" or "reject"
+    MEMORY_BATCH_TURNS: int = 6  # Turns per memory extraction batch (the rest go at call end)
+    MEMORY_CONCURRENCY: int = 2  # Extractions running at once
+    MEMORY_QUEUE_MAXSIZE: int = 1000  # Batches waiting; the oldest is dropped beyond this
+    MEMORY_EXISTING_LIMIT: int = 10  # Caller's related memories shown to extraction, to update rather than repeat
+    MEMORY_DRAIN_TIMEOUT_S: float = 10.0  # Shutdown wait for pending extractions
+    MEMORY_STORE_PATH: str = "memory.sqlite3"  # Persistent long-term memory store
+    MEMORY_TTL_S: Optional[float] = 180 * 86400  # Memories expire after this (None keeps them)
+    MEMORY_MAX_ITEMS_PER_NAMESPACE: int = 10000  # Per caller; least recently updated are evicted
+    MEMORY_EMBEDDING_CACHE_SIZE: int = 10000  # Embeddings kept in process (all are kept on disk)
+    MEMORY_SWEEP_INTERVAL_S: float = 600.0  # How often expired memories are deleted
+    MEMORY_HNSW_M: int = 16
+    MEMORY_HNSW_EF_CONSTRUCTION: int = 100
+    MEMORY_HNSW_EF_SEARCH: int = 64
+    MEMORY_HNSW_PERSIST_MIN_ITEMS: int = 5000  # Larger namespace indexes are saved to disk, not rebuilt
+    MEMORY_RECALL_LIMIT: int = 5  # Memories of a repeat caller added to the call's context
+    HISTORY_PAGE_SIZE: int = 50  # Rows per history page (HTML view and API default)
+    HISTORY_MAX_PAGE_SIZE: int = 500
+    HISTORY_EXPORT_BATCH: int = 1000  # Rows fetched per request while streaming an export
+    CAMPAIGN_DIAL_RATE: float = 1.0  # Calls created per second, per worker (Twilio's default CPS is 1)
+    CAMPAIGN_DIAL_BURST: int = 1
+    CAMPAIGN_MAX_ACTIVE_CALLS: int = 20  # Concurrent campaign calls per worker; size to TTS/LLM capacity
+    CAMPAIGN_DIAL_WORKERS: int = 4  # Concurrent calls.create requests
+    CAMPAIGN_MAX_ATTEMPTS: int = 3  # Dials per contact when busy / not answered
+    CAMPAIGN_RETRY_DELAY_S: float = 300.0
+    CAMPAIGN_WRITE_BATCH: int = 50  # Dialed calls written per DB insert / Redis pipeline
+    CAMPAIGN_FLUSH_INTERVAL_MS: int = 500  # Calls ring for seconds before the media stream needs their state
+    CAMPAIGN_CALL_TIMEOUT_S: float = 3600.0  # Free a call's slot if its final status never arrives
+    CAMPAIGN_MAX_CONTACTS: int = 100000
+    CALL_STATE_TTL_S: int = 86400  # Lifetime of per-call Redis keys
+    TTS_CACHE_ENABLED: bool = True  # Reuse synthesized audio of identical segments (per voice/model/format)
+    TTS_CACHE_DIR: str = "tts_cache"  # Disk tier, shared by the workers of a host
+    TTS_CACHE_MEMORY_BYTES: int = 64 * 1024 * 1024  # Per-worker LRU tier
+    TTS_CACHE_DISK_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    TTS_CACHE_PRUNE_EVERY_WRITES: int = 200  # Disk usage is checked after this many new files
+    TTS_PHRASE_LIBRARY: Optional[str] = None  # File of fixed phrases (one per line) pre-rendered at startup
+    TTS_PRERENDER_CONCURRENCY: int = 4  # Concurrent ElevenLabs requests while pre-rendering
+    RESPONSE_CACHE_ENABLED: bool = True  # Replay cached replies (text + audio) to short, common caller turns
+    RESPONSE_CACHE_MAX_WORDS: int = 8  # Longer caller turns are neither looked up nor cached
+    RESPONSE_CACHE_TTL_S: int = 7 * 86400  # Entries unused for this long expire
+    RESPONSE_CACHE_MAX_ENTRIES: int = 5000  # Least recently used are evicted beyond this
+    RESPONSE_CACHE_MAX_AUDIO_BYTES: int = 160000  # 20 s of mu-law; longer replies aren't cached
+    SMS_COALESCE_WINDOW_MS: int = 2000  # Reply once the sender has been quiet this long...
+    SMS_COALESCE_MAX_WAIT_MS: int = 8000  # ...or this long after their first unanswered message
+    SMS_REPLY_WORKERS: int = 8  # Concurrent SMS replies per worker
+    SMS_POLL_INTERVAL_MS: int = 200
+    SMS_REPLY_LOCK_TTL_S: int = 120  # Frees a number if the worker replying to it dies
+    SMS_REPLY_MAX_ATTEMPTS: int = 5  # Replies tried per message before it's given up on
+    SMS_REPLY_RETRY_DELAY_S: float = 30.0  # Doubled on every failed attempt
+    SMS_IDEMPOTENCY_TTL_S: int = 86400  # How long a MessageSid is remembered (Twilio retries within this)
+    SMS_THREAD_TTL_S: int = 7 * 86400  # SMS threads outlive calls; a reply days later keeps its context
+    SMS_THREAD_MAX_TURNS: int = 20
+    CALL_STATE_CACHE_MAX: int = 10000  # call_state hashes cached per process
+    CONVERSATION_MAX_TURNS: int = 50  # Rolling window of turns kept in Redis per call
+    PROMPT_TOKEN_BUDGET: int = 3000  # Estimated prompt tokens per turn (prefix + history + message)
+    PROMPT_SUMMARY_TURN_CHARS: int = 120  # Characters kept from each turn folded into the summary
+    PROMPT_SUMMARY_MAX_CHARS: int = 800
+    VAD_ENERGY_THRESHOLD: int = 500  # RMS of 16-bit PCM above which a frame counts as speech
+    VAD_MIN_SPEECH_MS: int = 60  # Consecutive voiced audio needed to start an utterance
+    VAD_SILENCE_MS: int = 700  # Trailing silence that ends an utterance
+    VAD_MAX_UTTERANCE_MS: int = 15000  # Force an utterance to end after this much audio
+    VAD_PREROLL_MS: int = 200  # Audio kept from before the onset so first syllables aren't clipped
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore", env_file_encoding='utf-8')
 
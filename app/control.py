@@ -0,0 +1,120 @@
+# app/control.py
+import asyncio
+import json
+from typing import AsyncIterator, Awaitable, Callable, Dict
+from app.redis_manager import RedisManager
+from app.logger import logger
+
+COMMANDS = ("toggle_human_in_loop", "override", "hangup", "inject_speech", "decide")
+# Fields each command carries; anything else in a request or supervisor message is dropped
+COMMAND_FIELDS = {
+    "toggle_human_in_loop": ("enabled",),
+    "override": ("text",),
+    "hangup": (),
+    "inject_speech": ("text",),
+    "decide": ("draft_id", "action", "text"),
+}
+
+_COMMAND_CHANNEL = "call_control:{call_sid}"
+_TRANSCRIPT_CHANNEL = "call_transcript:{call_sid}"
+
+
+def command_args(command: str, fields: dict) -> dict:
+    """The fields ``command`` takes, picked out of ``fields``."""
+    return {name: fields[name] for name in COMMAND_FIELDS[command] if name in fields}
+
+
+class ControlPlane:
+    """Cross-worker call control over Redis pub/sub, keyed by Twilio call SID.
+
+    The worker that owns a call's media stream registers a command handler
+    for it; any worker can then ``send`` commands to that call. Every worker
+    pattern-subscribes to all command channels through one connection and
+    dispatches only the calls it owns, so registering a call costs no Redis
+    round-trip. Live transcript events go out on a per-call channel that
+    supervisors subscribe to with ``transcripts``.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable[[dict], Awaitable[None]]] = {}
+        self._commands = set()  # Running command handlers
+        self._pubsub = None
+        self._listener = None
+
+    async def start(self):
+        self._pubsub = RedisManager.get_client().pubsub()
+        await self._pubsub.psubscribe(_COMMAND_CHANNEL.format(call_sid="*"))
+        self._listener = asyncio.create_task(self._listen())
+        logger.info("Call control plane started.")
+
+    async def close(self):
+        if self._listener is None:
+            return
+        self._listener.cancel()
+        await asyncio.gather(self._listener, *self._commands, return_exceptions=True)
+        await self._pubsub.close()
+        self._listener = None
+        logger.info("Call control plane stopped.")
+
+    def register(self, call_sid: str, handler: Callable[[dict], Awaitable[None]]):
+        """Routes commands for ``call_sid`` to ``handler`` (on this worker)."""
+        self._handlers[call_sid] = handler
+
+    def unregister(self, call_sid: str):
+        self._handlers.pop(call_sid, None)
+
+    async def send(self, call_sid: str, command: str, **args):
+        """Publishes a command to whichever worker owns the call."""
+        if command not in COMMANDS:
+            raise ValueError(f"Unknown call command: {command}")
+        await RedisManager.get_client().publish(
+            _COMMAND_CHANNEL.format(call_sid=call_sid), json.dumps({"command": command, **args}))
+
+    async def publish_transcript(self, call_sid: str, event: dict):
+        """Sends a live transcript event to the call's supervisors (best effort)."""
+        try:
+            await RedisManager.get_client().publish(_TRANSCRIPT_CHANNEL.format(call_sid=call_sid), json.dumps(event))
+        except Exception as e:
+            logger.error(f"Error publishing transcript for call {call_sid}: {e}")
+
+    async def transcripts(self, call_sid: str) -> AsyncIterator[dict]:
+        """Yields the call's transcript events until the consumer stops."""
+        pubsub = RedisManager.get_client().pubsub()
+        await pubsub.subscribe(_TRANSCRIPT_CHANNEL.format(call_sid=call_sid))
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    yield json.loads(message["data"])
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.close()
+
+    async def _listen(self):
+        prefix = _COMMAND_CHANNEL.format(call_sid="")
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    call_sid = message["channel"][len(prefix):]
+                    handler = self._handlers.get(call_sid)
+                    if handler is None:
+                        continue  # Owned by another worker
+                    self._dispatch(call_sid, handler, json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Call control listener error: {e}")
+                await asyncio.sleep(1)
+
+    def _dispatch(self, call_sid: str, handler, command: dict):
+        async def run():
+            try:
+                await handler(command)
+            except Exception as e:
+                logger.error(f"Error handling {command.get('command')} for call {call_sid}: {e}")
+
+        # Handlers run concurrently so a slow one can't hold up other calls' commands
+        task = asyncio.create_task(run())
+        self._commands.add(task)
+        task.add_done_callback(self._commands.discard)
@@ -0,0 +1,118 @@
+# app/conversation.py
+import json
+from typing import Optional
+from app.config import settings
+from app.logger import logger
+from app.prompts import DEFAULT_SYSTEM_PROMPT
+from app.redis_manager import RedisManager
+from app.memory import MemoryIngestionWorker
+
+_LATEST_MESSAGE_NOTE = "(The recipient's latest response is the final user message in this conversation.)"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) plus per-message overhead."""
+    return len(text) // 4 + 4
+
+
+def build_static_prefix(system_prompt: str, instructions: str, context: str) -> str:
+    """Builds the per-call persona + instructions + context prefix once.
+
+    A system prompt that contains the template placeholders is filled in
+    directly; a custom one is followed by the filled default template.
+    """
+    template = system_prompt if "{INSTRUCTIONS}" in system_prompt else f"{system_prompt}\n\n{DEFAULT_SYSTEM_PROMPT}"
+    return (template.replace("{INSTRUCTIONS}", instructions)
+            .replace("{CONTEXT}", context)
+            .replace("{USER_MESSAGE}", _LATEST_MESSAGE_NOTE))
+
+
+class Conversation:
+    """Per-call conversation history kept in Redis next to ``call_state:{sid}``.
+
+    Turns are appended to the ``call_history:{sid}`` list (a rolling window of
+    ``CONVERSATION_MAX_TURNS``) and mirrored in memory, so assembling a prompt
+    costs no Redis round-trips. Prompts are assembled under a token budget:
+    the oldest turns that don't fit are folded into a short running summary.
+    New turns are also handed to the memory ingestion worker, if given.
+    SMS threads reuse it with their own ``key`` and ``ttl``.
+    """
+
+    def __init__(self, call_sid: str, static_prefix: str,
+                 token_budget: int = settings.PROMPT_TOKEN_BUDGET,
+                 max_turns: int = settings.CONVERSATION_MAX_TURNS,
+                 memory: Optional[MemoryIngestionWorker] = None, caller: Optional[str] = None,
+                 key: Optional[str] = None, ttl: int = settings.CALL_STATE_TTL_S):
+        self.call_sid = call_sid
+        self.caller = caller  # Phone number the call's memories are filed under
+        self.key = key or f"call_history:{call_sid}"
+        self.ttl = ttl
+        self.memory = memory
+        self.static_prefix = static_prefix
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.turns = []  # {"role": ..., "content": ...}, consecutive roles merged
+        self.summary = ""  # Condensed turns that no longer fit the budget
+        self._prefix_tokens = estimate_tokens(static_prefix)
+
+    async def load(self):
+        """Restores history written earlier in the call (e.g. by another worker)."""
+        for raw in await RedisManager.lrange(self.key, 0, -1):
+            try:
+                turn = json.loads(raw)
+            except ValueError:
+                continue
+            self._append_local(turn["role"], turn["content"])
+
+    async def add(self, role: str, content: str):
+        """Records a user or assistant turn."""
+        content = content.strip()
+        if not content:
+            return
+        self._append_local(role, content)
+        if self.memory is not None:
+            self.memory.add_turn(self.call_sid, role, content, self.caller)  # Extraction happens in the background
+        try:
+            await RedisManager.rpush_window(self.key, json.dumps({"role": role, "content": content}),
+                                            self.max_turns, self.ttl)
+        except Exception as e:
+            logger.error(f"Could not persist conversation turn for {self.key}: {e}")
+
+    def _append_local(self, role: str, content: str):
+        if self.turns and self.turns[-1]["role"] == role:
+            self.turns[-1]["content"] += f" {content}"  # Assistant speech arrives one segment at a time
+        else:
+            self.turns.append({"role": role, "content": content})
+
+    def build_messages(self, user_message: str) -> list:
+        """Assembles the prompt for the next reply within the token budget."""
+        available = self.token_budget - self._prefix_tokens - estimate_tokens(user_message)
+        available -= estimate_tokens(self.summary) if self.summary else 0
+        kept, used = [], 0
+        for turn in reversed(self.turns):
+            cost = estimate_tokens(turn["content"])
+            if used + cost > available:
+                break
+            kept.append(turn)
+            used += cost
+        kept.reverse()
+
+        dropped = self.turns[:len(self.turns) - len(kept)]
+        if dropped:
+            self._summarize(dropped)
+            self.turns = kept  # Dropped turns now live in the summary
+
+        messages = [{"role": "system", "content": self.static_prefix}]
+        if self.summary:
+            messages.append({"role": "system", "content": f"Earlier in this conversation: {self.summary}"})
+        messages.extend(kept)
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def _summarize(self, turns: list):
+        """Folds turns into the running summary, keeping its most recent part."""
+        limit = settings.PROMPT_SUMMARY_TURN_CHARS
+        lines = [f'{"Caller" if turn["role"] == "user" else "You"}: "{turn["content"][:limit]}"' for turn in turns]
+        summary = " ".join(filter(None, [self.summary, *lines]))
+        max_chars = settings.PROMPT_SUMMARY_MAX_CHARS
+        self.summary = summary if len(summary) <= max_chars else "…" + summary[-max_chars:]
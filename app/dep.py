@@ -1,31 +1,69 @@
 # app/dependencies.py
 import httpx
+from typing import Optional
 from app.clients import SupabaseClient, TwilioClient, GroqClient, ElevenLabsClient, GoogleClient
 from app.redis_manager import RedisManager
 from app.config import settings
-from typing import AsyncGenerator
-from fastapi import Depends
+from fastapi import HTTPException
+from starlette.requests import HTTPConnection
+from app.persistence import PersistenceWorker
+from app.control import ControlPlane
+from app.memory import MemoryIngestionWorker
+from app.campaign import CampaignDialer
+from app.sms import SmsReplyWorker
+from app.response_cache import ResponseCache
 
-async def get_http_client() -> AsyncGenerator[httpx.AsyncClient, None]:
-    """Dependency for getting an httpx AsyncClient (managed by lifespan)."""
-    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0)) as client: #Added timeout
-        yield client
+async def get_http_client(connection: HTTPConnection) -> httpx.AsyncClient:
+    """Dependency for the shared httpx AsyncClient (managed by lifespan)."""
+    return connection.app.state.clients.http_client
 
-async def get_supabase_client(http_client: httpx.AsyncClient = Depends(get_http_client)) -> SupabaseClient:
-    """Dependency for getting a SupabaseClient (using the shared http_client)."""
-    return SupabaseClient(http_client)
+async def get_supabase_client(connection: HTTPConnection) -> SupabaseClient:
+    """Dependency for the process-wide SupabaseClient (created in lifespan on the shared http_client)."""
+    return connection.app.state.clients.supabase
 
-async def get_twilio_client() -> TwilioClient:
-    return TwilioClient()
+def _available(client, name: str):
+    """Lazily built providers are None when they failed to initialize."""
+    if client is None:
+        raise HTTPException(status_code=503, detail=f"{name} client unavailable")
+    return client
 
-async def get_groq_client() -> GroqClient:
-    return GroqClient()
+async def get_twilio_client(connection: HTTPConnection) -> TwilioClient:
+    return _available(connection.app.state.clients.twilio, "Twilio")
 
-async def get_elevenlabs_client() -> ElevenLabsClient:
-    return ElevenLabsClient()
+async def get_groq_client(connection: HTTPConnection) -> GroqClient:
+    return _available(connection.app.state.clients.groq, "Groq")
+
+async def get_elevenlabs_client(connection: HTTPConnection) -> ElevenLabsClient:
+    return _available(connection.app.state.clients.elevenlabs, "ElevenLabs")
 
 async def get_redis_client() -> RedisManager:
-    return RedisManager.get_client()
+    return RedisManager  # Helpers are classmethods over the shared connection
+
+async def get_google_client(connection: HTTPConnection) -> GoogleClient:
+    return _available(connection.app.state.clients.google, "Google")
+
+async def get_persistence_worker(connection: HTTPConnection) -> PersistenceWorker:
+    """Dependency for the app-wide write-behind persistence worker (managed by lifespan)."""
+    return connection.app.state.persistence
+
+async def get_control_plane(connection: HTTPConnection) -> ControlPlane:
+    """Dependency for the cross-worker call control plane (managed by lifespan)."""
+    return connection.app.state.control
+
+async def get_memory_worker(connection: HTTPConnection) -> MemoryIngestionWorker:
+    """Dependency for the background memory ingestion worker (managed by lifespan)."""
+    return connection.app.state.memory
+
+
+async def get_campaign_dialer(connection: HTTPConnection) -> CampaignDialer:
+    """Dependency for the outbound campaign dialer (managed by lifespan)."""
+    return connection.app.state.campaigns
+
+async def get_sms_worker(connection: HTTPConnection) -> SmsReplyWorker:
+    """Dependency for the inbound SMS reply worker (managed by lifespan)."""
+    return connection.app.state.sms
+
 
-async def get_google_client() -> GoogleClient:
-    return GoogleClient()
\ No newline at end of file
+async def get_response_cache(connection: HTTPConnection) -> Optional[ResponseCache]:
+    """Dependency for the reply cache (None when RESPONSE_CACHE_ENABLED is off)."""
+    return connection.app.state.response_cache
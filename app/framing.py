@@ -0,0 +1,107 @@
+# app/framing.py
+import asyncio
+import base64
+import json
+import time
+from typing import Optional
+from fastapi import WebSocket
+from app.config import settings
+
+FRAME_BYTES = 160  # 20 ms of 8 kHz mu-law, the frame size Twilio uses
+FRAME_MS = 20
+ULAW_SILENCE = 0xFF
+
+
+class OutboundFramer:
+    """Re-chunks TTS audio into 20 ms Twilio frames and sends them in real time.
+
+    Whole frames are cut from each incoming chunk as memoryview slices; only a
+    partial frame is carried over, in one reusable 160-byte buffer, so memory
+    per call stays constant however long the reply is. Media messages are
+    built from a JSON prefix/suffix serialized once per stream.
+
+    Frames are paced against a playback clock, keeping at most ``lead_ms`` of
+    audio queued at Twilio. When TTS falls behind the clock within a segment,
+    the shortfall is counted in ``underrun_ms``.
+    """
+
+    def __init__(self, websocket: WebSocket, stream_sid: str, lead_ms: int = settings.PLAYBACK_LEAD_MS):
+        self.websocket = websocket
+        self.lead = lead_ms / 1000
+        prefix, suffix = json.dumps({"event": "media", "streamSid": stream_sid,
+                                     "media": {"payload": "\0"}}).split("\\u0000")
+        self._prefix, self._suffix = prefix, suffix
+        self._carry = bytearray(FRAME_BYTES)
+        self._carry_len = 0
+        self.frames_sent = 0  # Frames on the playback timeline (20 ms each)
+        self.underrun_ms = 0.0  # Time playback starved mid-segment because audio arrived late
+        self._clock_start: Optional[float] = None  # Monotonic time frame 0 starts playing
+        self._segment_start = True  # Next frame begins a segment (idle gaps aren't lag)
+
+    @property
+    def sent_ms(self) -> int:
+        """Position of the next frame on the playback timeline."""
+        return self.frames_sent * FRAME_MS
+
+    def played_ms(self) -> float:
+        """How far along the playback timeline Twilio should be by now."""
+        if self._clock_start is None:
+            return 0.0
+        return min((time.monotonic() - self._clock_start) * 1000, self.sent_ms)
+
+    def buffered_ms(self) -> float:
+        """Audio sent but not yet played."""
+        return self.sent_ms - self.played_ms()
+
+    async def write(self, chunk: bytes):
+        """Sends every whole frame in ``chunk``; keeps a trailing partial frame."""
+        view = memoryview(chunk)
+        if self._carry_len:
+            take = min(FRAME_BYTES - self._carry_len, len(view))
+            self._carry[self._carry_len:self._carry_len + take] = view[:take]
+            self._carry_len += take
+            view = view[take:]
+            if self._carry_len < FRAME_BYTES:
+                return
+            await self._send_frame(self._carry)
+            self._carry_len = 0
+        while len(view) >= FRAME_BYTES:
+            await self._send_frame(view[:FRAME_BYTES])
+            view = view[FRAME_BYTES:]
+        if len(view):
+            self._carry[:len(view)] = view
+            self._carry_len = len(view)
+
+    async def flush(self):
+        """Pads and sends any partial frame; marks the end of a segment."""
+        if self._carry_len:
+            self._carry[self._carry_len:] = bytes([ULAW_SILENCE]) * (FRAME_BYTES - self._carry_len)
+            await self._send_frame(self._carry)
+            self._carry_len = 0
+        self._segment_start = True
+
+    def drop_partial(self):
+        """Discards a partial frame of an abandoned segment."""
+        self._carry_len = 0
+        self._segment_start = True
+
+    def reset(self):
+        """Forgets queued audio, e.g. after Twilio's buffer was cleared."""
+        self._carry_len = 0
+        self._clock_start = None
+        self.frames_sent = 0
+        self._segment_start = True
+
+    async def _send_frame(self, frame):
+        now = time.monotonic()
+        due = None if self._clock_start is None else self._clock_start + self.frames_sent * FRAME_MS / 1000
+        if due is None or now > due:
+            # Twilio has run out of audio: restart the clock from now
+            if due is not None and not self._segment_start:
+                self.underrun_ms += (now - due) * 1000
+            self._clock_start = now - self.frames_sent * FRAME_MS / 1000
+        elif due - now > self.lead:
+            await asyncio.sleep(due - now - self.lead)
+        self._segment_start = False
+        self.frames_sent += 1
+        await self.websocket.send_text(f"{self._prefix}{base64.b64encode(frame).decode('ascii')}{self._suffix}")
@@ -0,0 +1,136 @@
+# app/history.py
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Optional, Tuple
+from app.clients import SupabaseClient
+
+
+class InvalidHistoryQuery(ValueError):
+    """An unknown table or column, a malformed date or a bad cursor."""
+
+
+# Per table: columns returned by default, others that may be requested, and what ``status`` filters on.
+# Pages are read newest first with a keyset on (created_at, id), so each table wants
+#   create index on <table> (created_at desc, id desc);
+# and number filters want indexes on from_number and to_number.
+TABLES = {
+    "calls": {
+        "columns": ("id", "created_at", "twilio_sid", "from_number", "to_number", "status", "end_time"),
+        "extra_columns": ("system_prompt", "instructions", "context", "turn_timings"),
+        "status_column": "status",
+    },
+    "sms_messages": {
+        "columns": ("id", "created_at", "twilio_sid", "from_number", "to_number", "direction", "body"),
+        "extra_columns": ("response_text",),
+        "status_column": "direction",
+    },
+}
+_ORDER = "created_at.desc,id.desc"
+
+
+@dataclass
+class HistoryQuery:
+    """Filters and projection of a history listing (all optional)."""
+    table: str
+    number: Optional[str] = None  # Either party of the call/message
+    since: Optional[datetime] = None  # created_at >= since
+    until: Optional[datetime] = None  # created_at < until (the day after, for a date-only until)
+    status: Optional[str] = None  # Call status, or SMS direction
+    columns: Tuple[str, ...] = ()
+
+    @classmethod
+    def parse(cls, table: str, number: Optional[str] = None, since: Optional[str] = None,
+              until: Optional[str] = None, status: Optional[str] = None, columns: Optional[str] = None):
+        """Validates raw query-string values."""
+        if table not in TABLES:
+            raise InvalidHistoryQuery(f"Unknown history table: {table}")
+        spec = TABLES[table]
+        selected = tuple(name.strip() for name in columns.split(",") if name.strip()) if columns else spec["columns"]
+        unknown = set(selected) - set(spec["columns"]) - set(spec["extra_columns"])
+        if unknown:
+            raise InvalidHistoryQuery(f"Unknown columns for {table}: {', '.join(sorted(unknown))}")
+        # The keyset needs both, whatever was asked for
+        selected += tuple(name for name in ("created_at", "id") if name not in selected)
+        until_at = _parse_date(until, "until")
+        if until_at is not None and _is_date(until):
+            until_at += timedelta(days=1)  # A bare date (the HTML form's) means up to the end of that day
+        return cls(table, number or None, _parse_date(since, "since"), until_at, status or None, selected)
+
+    def filters(self, after: Optional[Tuple[str, int]] = None) -> dict:
+        """PostgREST params for the query, continuing after the (created_at, id) keyset."""
+        conditions = []
+        if self.number:
+            conditions.append(f"or(from_number.eq.{_quote(self.number)},to_number.eq.{_quote(self.number)})")
+        if self.since:
+            conditions.append(f"created_at.gte.{_quote(self.since.isoformat())}")
+        if self.until:
+            conditions.append(f"created_at.lt.{_quote(self.until.isoformat())}")
+        if self.status:
+            conditions.append(f"{TABLES[self.table]['status_column']}.eq.{_quote(self.status)}")
+        if after is not None:
+            created_at, row_id = after
+            conditions.append(f"or(created_at.lt.{_quote(created_at)},"
+                              f"and(created_at.eq.{_quote(created_at)},id.lt.{int(row_id)}))")
+        return {"and": f"({','.join(conditions)})"} if conditions else {}
+
+
+def _parse_date(value: Optional[str], name: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidHistoryQuery(f"{name} must be an ISO 8601 date or datetime")
+
+
+def _is_date(value: str) -> bool:
+    try:
+        date.fromisoformat(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _quote(value: str) -> str:
+    """Double-quotes a value for a PostgREST logic tree (commas, parentheses and all)."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def encode_cursor(row: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([row["created_at"], row["id"]]).encode()).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(created_at), int(row_id)
+    except (ValueError, TypeError, binascii.Error, UnicodeEncodeError):
+        raise InvalidHistoryQuery("Invalid cursor")
+
+
+async def fetch_page(client: SupabaseClient, query: HistoryQuery, limit: int,
+                     cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+    """One page, newest first, and the cursor of the next page (None on the last one).
+
+    Each page is one indexed range read, however deep into the history it is.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    rows = await client.select(query.table, ",".join(query.columns), query.filters(after), _ORDER, limit + 1)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1])
+
+
+async def iter_rows(client: SupabaseClient, query: HistoryQuery, batch: int) -> AsyncIterator[dict]:
+    """Every matching row, fetched ``batch`` at a time."""
+    cursor = None
+    while True:
+        rows, cursor = await fetch_page(client, query, batch, cursor)
+        for row in rows:
+            yield row
+        if cursor is None:
+            return
@@ -1,33 +1,83 @@
 # app/main.py
-import httpx
+import time
+_import_start = time.perf_counter()
+
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.templating import Jinja2Templates
 from app.config import settings
 from app.routes import router
 from app.redis_manager import RedisManager
-from app.dep import get_http_client  # Import dependency functions
+from app.registry import ClientRegistry
+from app.persistence import PersistenceWorker
+from app.control import ControlPlane
+from app.memory import MemoryIngestionWorker
+from app.campaign import CampaignDialer
+from app.sms import SmsReplyWorker
+from app.response_cache import ResponseCache
+from app.startup import StartupReport
+from app.metrics import LoopLagMonitor, metrics
 from app.logger import logger
-# Initialize Logging
-logger = logger.getLogger(__name__)
 
 # Load templates
 templates = Jinja2Templates(directory="app/templates")
 
+startup_report = StartupReport()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Handles startup and shutdown events."""
+    """Handles startup and shutdown events.
+
+    Only what the first request needs is awaited here; provider SDKs and the
+    memory agents are loaded in the background (see ``startup_report``).
+    """
     # Startup logic
-    await RedisManager.initialize()
-    http_client = httpx.AsyncClient(timeout=httpx.Timeout(10.0))  # Create http_client
-    app.state.http_client = http_client  # Store in app.state
-    logger.info("Application startup complete.")
+    app.state.startup_report = startup_report
+    app.state.loop_lag = LoopLagMonitor(settings.LOOP_LAG_SAMPLE_INTERVAL_MS)  # Exported on /metrics
+    app.state.loop_lag.start()
+    with startup_report.measure("redis"):
+        await RedisManager.initialize()
+    with startup_report.measure("control plane"):
+        app.state.control = ControlPlane()  # Routes call commands to the worker owning the stream
+        await app.state.control.start()
+    clients = ClientRegistry(startup_report)  # Every provider client is built once, on one shared pool
+    await clients.start()
+    app.state.clients = clients
+    app.state.http_client = clients.http_client  # Store in app.state
+    app.state.supabase_client = clients.supabase
+    with startup_report.measure("persistence"):
+        app.state.persistence = PersistenceWorker(app.state.supabase_client)  # Write-behind DB/storage queue
+        app.state.persistence.start()
+    with startup_report.measure("campaign dialer"):
+        app.state.campaigns = CampaignDialer(lambda: clients.twilio, clients.supabase)  # Outbound campaigns
+        await app.state.campaigns.start()
+    with startup_report.measure("sms worker"):
+        app.state.sms = SmsReplyWorker(lambda: clients.google, lambda: clients.twilio, app.state.persistence)
+        app.state.sms.start()  # Inbound SMS are answered off the webhook path
+    # Shared by every worker through Redis; None turns it off
+    app.state.response_cache = ResponseCache() if settings.RESPONSE_CACHE_ENABLED else None
+    with startup_report.measure("memory worker"):
+        app.state.memory = MemoryIngestionWorker(report=startup_report)  # Long-term memory extraction, off the voice path
+        app.state.memory.start()
+    metrics.gauge("persistence_queue_depth", "Supabase writes waiting in the write-behind queue.",
+                  app.state.persistence.qsize)
+    metrics.gauge("persistence_dropped_writes", "Writes dropped because the persistence queue was full.",
+                  lambda: app.state.persistence.dropped)
+    metrics.gauge("memory_queue_depth", "Conversation batches waiting for memory extraction.",
+                  lambda: app.state.memory.metrics()["queue_depth"])
+    startup_report.log("Application startup complete")
 
     yield  # This is where the application runs
 
     # Shutdown logic
+    await app.state.campaigns.close()
+    await app.state.sms.close()
+    await app.state.memory.close()
+    await app.state.persistence.close()  # Drain pending writes before closing connections
+    await app.state.control.close()
     await RedisManager.close()
-    await app.state.http_client.aclose()  # Close http_client
+    await app.state.clients.close()  # Close provider clients and the shared pool
+    await app.state.loop_lag.close()
     logger.info("Application shutdown complete.")
 
 app = FastAPI(lifespan=lifespan)  # Create FastAPI instance *once* with lifespan
@@ -37,4 +87,6 @@ app.include_router(router)  # Add routes
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
     logger.exception(f"Unhandled exception: {exc}")  # Log the exception
-    return templates.TemplateResponse("error.html", {"request": request, "error_message": "An unexpected error occurred."})
\ No newline at end of file
+    return templates.TemplateResponse("error.html", {"request": request, "error_message": "An unexpected error occurred."})
+
+startup_report.record("import app.main", time.perf_counter() - _import_start)
@@ -0,0 +1,219 @@
+# app/memory.py
+import asyncio
+import hashlib
+import importlib
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+from app.config import settings
+from app.logger import logger
+from app.startup import StartupReport
+
+
+def _fingerprint(content: str) -> str:
+    return hashlib.sha1(" ".join(content.lower().split()).encode()).hexdigest()
+
+
+def memory_text(value: dict) -> str:
+    """The text of a stored langmem memory (``{"kind": ..., "content": {"content": ...}}``)."""
+    content = value.get("content", value)
+    if isinstance(content, dict):
+        content = content.get("content", content)
+    return content if isinstance(content, str) else str(content)
+
+
+class _Batch:
+    __slots__ = ("call_sid", "caller", "messages", "enqueued_at")
+
+    def __init__(self, call_sid: str, caller: str, messages: list):
+        self.call_sid = call_sid
+        self.caller = caller  # Memories are namespaced per caller phone number
+        self.messages = messages
+        self.enqueued_at = time.monotonic()
+
+
+class MemoryIngestionWorker:
+    """Feeds call turns to long-term memory extraction in the background.
+
+    Turns are buffered per call and handed to ``extractor`` (a langmem memory
+    manager) as one batch every ``batch_turns`` turns and when the call ends,
+    along with the caller's related memories so it can update them. Extracted
+    memories repeating one already stored for the caller, or another from the
+    same batch, are dropped; the rest are written to ``store``. At most
+    ``concurrency`` extractions run at once; when the queue is full the oldest
+    batch is dropped. Nothing here is awaited by the voice path.
+
+    Memories are namespaced per caller, and ``recall`` reads a repeat
+    caller's most recent ones back from ``store`` without an embedding call.
+    The LLM-backed extractor and store (``app.agents``) are loaded in the
+    background on ``start``; until then recall returns nothing.
+    """
+
+    def __init__(self, extractor: Any = None, store: Any = None,
+                 batch_turns: int = settings.MEMORY_BATCH_TURNS,
+                 concurrency: int = settings.MEMORY_CONCURRENCY,
+                 maxsize: int = settings.MEMORY_QUEUE_MAXSIZE,
+                 report: Optional[StartupReport] = None):
+        self.extractor = extractor  # Resolved from app.agents on start if not given
+        self.store = store
+        self.report = report
+        self._ready: Optional[asyncio.Task] = None  # Loads app.agents in the background
+        self.batch_turns = max(batch_turns, 1)
+        self.concurrency = max(concurrency, 1)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._queued_at = deque()  # enqueued_at of the queued batches, oldest first (for lag)
+        self._calls: Dict[str, dict] = {}  # call_sid -> {"turns": [...], "last": (role, content), "caller": ...}
+        self._workers = []
+        self.in_flight = 0
+        self.batches = 0
+        self.turns_ingested = 0
+        self.memories_written = 0
+        self.duplicates_skipped = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_lag_s = 0.0  # Enqueue-to-stored time of the most recent batch
+
+    def start(self):
+        if self._workers:
+            return
+        self._ready = asyncio.create_task(self._load_agents())
+        self._workers = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+        logger.info(f"Memory ingestion worker started ({self.concurrency} extractors).")
+
+    async def _load_agents(self):
+        if self.extractor is not None and self.store is not None:
+            return
+        start = time.perf_counter()
+        error = None
+        try:
+            # Importing app.agents builds the store and chat models; keep it off the event loop
+            agents = await asyncio.to_thread(importlib.import_module, "app.agents")
+            self.extractor = self.extractor or agents.memory_extractor
+            self.store = self.store or agents.store
+        except Exception as e:
+            error = e
+            logger.error(f"Long-term memory unavailable: {e}")
+        if self.report is not None:
+            self.report.record("memory agents (background)", time.perf_counter() - start, error)
+            self.report.log("Memory agents ready", ["memory agents (background)"])
+
+    async def recall(self, caller: Optional[str], limit: int = settings.MEMORY_RECALL_LIMIT) -> list:
+        """Texts of the caller's most recently updated memories."""
+        if not caller or self.store is None:
+            return []
+        try:
+            items = await self.store.asearch(("memories", caller), limit=limit)
+        except Exception as e:
+            logger.error(f"Memory recall failed for {caller}: {e}")
+            return []
+        return [memory_text(item.value) for item in items]
+
+    def add_turn(self, call_sid: str, role: str, content: str, caller: Optional[str] = None):
+        """Buffers a turn; queues a batch once ``batch_turns`` complete turns have accumulated."""
+        call = self._calls.setdefault(call_sid, {"turns": [], "last": None, "caller": caller or "unknown"})
+        if call["last"] == (role, content):
+            return  # The same segment delivered twice; a caller saying "yes" again is a new turn
+        call["last"] = (role, content)
+        turns = call["turns"]
+        if turns and turns[-1]["role"] == role:
+            turns[-1]["content"] += f" {content}"  # Assistant speech arrives one segment at a time
+            return
+        if len(turns) >= self.batch_turns:
+            self._enqueue(call_sid, call)  # The previous turn is complete; batch before starting another
+        call["turns"].append({"role": role, "content": content})
+
+    def end_call(self, call_sid: str):
+        """Queues whatever is left of a finished call and forgets it."""
+        call = self._calls.pop(call_sid, None)
+        if call is not None:
+            self._enqueue(call_sid, call)
+
+    def _enqueue(self, call_sid: str, call: dict):
+        if not call["turns"]:
+            return
+        batch = _Batch(call_sid, call["caller"], call["turns"])
+        call["turns"] = []
+        self._queued_at.append(batch.enqueued_at)
+        try:
+            self._queue.put_nowait(batch)
+        except asyncio.QueueFull:
+            victim = self._queue.get_nowait()
+            self._queued_at.popleft()
+            self._queue.task_done()
+            self._queue.put_nowait(batch)
+            self.dropped += 1
+            logger.warning(f"Memory queue full; dropped {len(victim.messages)} turns of call {victim.call_sid}")
+
+    async def _run(self):
+        await asyncio.shield(self._ready)
+        while True:
+            batch = await self._queue.get()
+            self._queued_at.popleft()
+            self.in_flight += 1
+            try:
+                if self.extractor is None or self.store is None:
+                    raise RuntimeError("memory extractor failed to load")
+                await self._extract(batch)
+                self.batches += 1
+                self.turns_ingested += len(batch.messages)
+                self.last_lag_s = time.monotonic() - batch.enqueued_at
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Memory extraction failed for call {batch.call_sid}: {e}")
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    async def _extract(self, batch: _Batch):
+        """Extracts the batch's memories and stores those that aren't already known."""
+        namespace = ("memories", batch.caller)
+        existing = await self.store.asearch(namespace, query=" ".join(turn["content"] for turn in batch.messages),
+                                            limit=settings.MEMORY_EXISTING_LIMIT)
+        extracted = await self.extractor.ainvoke({
+            "messages": batch.messages,
+            "existing": [(item.key, memory_text(item.value)) for item in existing],
+        })
+        known = {_fingerprint(memory_text(item.value)): item.key for item in existing}
+        for memory_id, content in extracted:
+            value = {"kind": type(content).__name__,
+                     "content": content.model_dump(mode="json") if hasattr(content, "model_dump") else content}
+            fingerprint = _fingerprint(memory_text(value))
+            if fingerprint in known:  # Already stored (or unchanged), or extracted twice from this batch
+                self.duplicates_skipped += 1
+                continue
+            known[fingerprint] = memory_id
+            await self.store.aput(namespace, memory_id, value)
+            self.memories_written += 1
+
+    def metrics(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "buffered_turns": sum(len(call["turns"]) for call in self._calls.values()),
+            "in_flight": self.in_flight,
+            "lag_s": time.monotonic() - self._queued_at[0] if self._queued_at else 0.0,
+            "last_lag_s": self.last_lag_s,
+            "batches": self.batches,
+            "turns_ingested": self.turns_ingested,
+            "memories_written": self.memories_written,
+            "duplicates_skipped": self.duplicates_skipped,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+    async def close(self, timeout: float = settings.MEMORY_DRAIN_TIMEOUT_S):
+        """Queues every open call, drains (up to ``timeout`` seconds) and stops."""
+        if not self._workers:
+            return
+        for call_sid in list(self._calls):
+            self.end_call(call_sid)
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Memory drain timed out with {self._queue.qsize()} batches pending.")
+        for task in (self._ready, *self._workers):
+            task.cancel()
+        await asyncio.gather(self._ready, *self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Memory ingestion worker stopped.")
@@ -0,0 +1,196 @@
+# app/metrics.py
+import asyncio
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+# Seconds; dense below 1 s where the latency SLO lives
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Histogram:
+    """A Prometheus histogram with optional labels (cumulative buckets, sum, count)."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[Tuple[str, str], ...], list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """A Prometheus counter with optional labels."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._series: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def samples(self) -> Dict[Tuple[Tuple[str, str], ...], float]:
+        """A snapshot of every series: labels -> value."""
+        with self._lock:
+            return dict(self._series)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return "\n".join(lines)
+
+
+class MetricsRegistry:
+    """Histograms and counters, plus gauges that are read from live objects at scrape time.
+
+    Metrics are per process; with several Uvicorn workers each one exposes
+    its own series.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, Counter] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(name, help, labelnames, buckets)
+        return self.histograms[name]
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        if name not in self.counters:
+            self.counters[name] = Counter(name, help, labelnames)
+        return self.counters[name]
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]):
+        """Registers (or replaces) a gauge whose value comes from ``read()``."""
+        self._gauges[name] = (help, read)
+
+    def render(self) -> str:
+        parts = [histogram.render() for histogram in self.histograms.values()]
+        parts += [counter.render() for counter in self.counters.values()]
+        for name, (help, read) in self._gauges.items():
+            try:
+                value = float(read())
+            except Exception:
+                continue  # The subsystem isn't up (yet); leave the gauge out
+            parts.append(f"# HELP {name} {help}\n# TYPE {name} gauge\n{name} {value}")
+        return "\n".join(parts) + "\n"
+
+
+metrics = MetricsRegistry()
+
+TURN_SPANS = metrics.histogram(
+    "voice_turn_span_seconds",
+    "Time spent in each stage of a conversational turn (mouth_to_ear: end of caller speech to first reply frame).",
+    ("span",))
+PERSISTENCE_SECONDS = metrics.histogram(
+    "persistence_write_seconds", "Duration of Supabase writes and storage uploads, including retries.", ("kind",))
+LOOP_LAG_SECONDS = metrics.histogram(
+    "event_loop_lag_seconds", "How late the event loop ran a timer; audio pacing slips by as much.",
+    buckets=LOOP_LAG_BUCKETS)
+
+# (span name, start mark, end mark), in turn order
+_SPANS = (
+    ("speech_end_to_transcript", "speech_end", "transcript"),
+    ("transcript_to_first_token", "transcript", "first_token"),
+    ("first_token_to_first_tts_byte", "first_token", "first_tts_byte"),
+    ("first_tts_byte_to_first_frame", "first_tts_byte", "first_frame"),
+    ("mouth_to_ear", "speech_end", "first_frame"),
+)
+
+
+class TurnTimer:
+    """Timing marks of one conversational turn.
+
+    Each stage of the turn calls ``mark`` as it happens (only the first call
+    per mark counts); a span is observed in ``voice_turn_span_seconds`` as
+    soon as both of its ends are known.
+    """
+
+    def __init__(self, speech_end: Optional[float] = None):
+        self.marks: Dict[str, float] = {}
+        if speech_end is not None:
+            self.mark("speech_end", speech_end)
+
+    def mark(self, name: str, at: Optional[float] = None):
+        if name in self.marks:
+            return
+        self.marks[name] = time.monotonic() if at is None else at
+        for span, start, end in _SPANS:
+            if name in (start, end) and start in self.marks and end in self.marks:
+                TURN_SPANS.observe(self.marks[end] - self.marks[start], span=span)
+
+    def spans(self) -> Dict[str, float]:
+        """Span durations known so far, in milliseconds (for the call record)."""
+        return {span: round((self.marks[end] - self.marks[start]) * 1000, 1)
+                for span, start, end in _SPANS if start in self.marks and end in self.marks}
+
+
+class LoopLagMonitor:
+    """Samples event-loop lag: how much later than scheduled a sleep wakes up.
+
+    Every frame sent to Twilio is paced by the loop, so sustained lag here is
+    heard as choppy audio long before CPU usage looks alarming.
+    """
+
+    def __init__(self, interval_ms: int):
+        self.interval = interval_ms / 1000
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            LOOP_LAG_SECONDS.observe(max(time.monotonic() - start - self.interval, 0.0))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,253 @@
+# app/persistence.py
+import asyncio
+import time
+from typing import Any, Optional
+from app.clients import SupabaseClient
+from app.config import settings
+from app.logger import logger
+from app.metrics import PERSISTENCE_SECONDS
+
+
+class PersistenceQueueFull(Exception):
+    """Raised (on the job's future) when a job is dropped by the overflow policy."""
+
+
+def column(future: asyncio.Future, name: str) -> asyncio.Future:
+    """A future for one column of the row an ``insert`` future resolves to."""
+    derived = _new_future()
+
+    def _copy(parent: asyncio.Future):
+        if derived.done():
+            return
+        if parent.cancelled():
+            derived.cancel()
+        elif parent.exception() is not None:
+            derived.set_exception(parent.exception())
+        else:
+            derived.set_result(parent.result()[name])
+
+    future.add_done_callback(_copy)
+    return derived
+
+
+def resolved(value) -> asyncio.Future:
+    """An already-completed future, for rows that reference a value known up front."""
+    future = _new_future()
+    future.set_result(value)
+    return future
+
+
+def _new_future() -> asyncio.Future:
+    future = asyncio.get_running_loop().create_future()
+    # Callers are free to ignore results; don't log unretrieved exceptions for them
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    return future
+
+
+class _Job:
+    __slots__ = ("kind", "target", "payload", "future")
+
+    def __init__(self, kind: str, target: str, payload: Any):
+        self.kind = kind  # "insert", "update" or "upload"
+        self.target = target  # Table name or storage filename
+        self.payload = payload
+        self.future = _new_future()
+
+
+class PersistenceWorker:
+    """Write-behind queue that keeps Supabase latency off the voice path.
+
+    Records and audio blobs are enqueued without waiting and flushed in the
+    background: inserts into the same table within a batch become one
+    multi-row insert, uploads run concurrently, and failures are retried with
+    exponential backoff. Row values may be futures returned by earlier jobs
+    (e.g. an upload's URL or an inserted row's id); they are resolved at
+    flush time.
+    """
+
+    def __init__(self, supabase_client: SupabaseClient,
+                 maxsize: int = settings.PERSIST_QUEUE_MAXSIZE,
+                 batch_size: int = settings.PERSIST_BATCH_SIZE,
+                 flush_interval_ms: int = settings.PERSIST_FLUSH_INTERVAL_MS,
+                 max_retries: int = settings.PERSIST_MAX_RETRIES,
+                 retry_backoff_ms: int = settings.PERSIST_RETRY_BACKOFF_MS,
+                 overflow_policy: str = settings.PERSIST_OVERFLOW_POLICY):
+        if overflow_policy not in ("drop_oldest", "drop_newest"):
+            raise ValueError(f"Unknown persistence overflow policy: {overflow_policy}")
+        self.supabase_client = supabase_client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff_ms / 1000
+        self.overflow_policy = overflow_policy
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Persistence worker started.")
+
+    def insert(self, table_name: str, row: dict) -> asyncio.Future:
+        """Enqueues a row; the future resolves to the inserted record."""
+        return self._enqueue(_Job("insert", table_name, row))
+
+    def update(self, table_name: str, data: dict, key_column: str, key_value) -> asyncio.Future:
+        """Enqueues an update of the rows where ``key_column == key_value``."""
+        return self._enqueue(_Job("update", table_name, (data, key_column, key_value)))
+
+    def upload(self, data: bytes, filename: str) -> asyncio.Future:
+        """Enqueues a storage upload; the future resolves to the public URL."""
+        return self._enqueue(_Job("upload", filename, data))
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _enqueue(self, job: _Job) -> asyncio.Future:
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.overflow_policy == "drop_newest":
+                victim = job
+            else:
+                victim = self._queue.get_nowait()
+                self._queue.task_done()
+                self._queue.put_nowait(job)
+            logger.warning(f"Persistence queue full; dropping {victim.kind} for {victim.target}")
+            victim.future.set_exception(PersistenceQueueFull(victim.target))
+        return job.future
+
+    async def _next_batch(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            except asyncio.CancelledError:
+                for job in batch:
+                    if not job.future.done():
+                        job.future.cancel()
+                raise
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: list):
+        # Uploads have no dependencies, so they go first and concurrently
+        await asyncio.gather(*(self._flush_one(job) for job in batch if job.kind == "upload"))
+
+        # Inserts go in rounds: every row whose referenced jobs have finished is
+        # written with one multi-row insert per table
+        pending = [job for job in batch if job.kind == "insert"]
+        while pending:
+            ready = [job for job in pending if self._references_done(job.payload)]
+            if not ready:
+                # Derived futures (see ``column``) complete one loop iteration later
+                references = {value for job in pending for value in job.payload.values()
+                              if isinstance(value, asyncio.Future) and not value.done()}
+                done, _ = await asyncio.wait(references, timeout=1.0, return_when=asyncio.FIRST_COMPLETED)
+                if not done:  # Only possible if a reference was never enqueued
+                    for job in pending:
+                        job.future.set_exception(RuntimeError(f"Unresolvable reference in {job.target} row"))
+                    break
+                continue
+            tables = {}
+            for job in ready:
+                tables.setdefault(job.target, []).append(job)
+            await asyncio.gather(*(self._flush_inserts(table, jobs) for table, jobs in tables.items()))
+            pending = [job for job in pending if not job.future.done()]
+
+        # Updates last and in order (e.g. marking a call completed after its rows)
+        for job in batch:
+            if job.kind == "update":
+                await self._flush_one(job)
+
+    @staticmethod
+    def _references_done(row: dict) -> bool:
+        return all(value.done() for value in row.values() if isinstance(value, asyncio.Future))
+
+    @staticmethod
+    def _resolve(row: dict) -> dict:
+        return {key: (value.result() if isinstance(value, asyncio.Future) else value) for key, value in row.items()}
+
+    async def _flush_inserts(self, table_name: str, jobs: list):
+        ready, rows = [], []
+        for job in jobs:
+            try:
+                rows.append(self._resolve(job.payload))
+                ready.append(job)
+            except (Exception, asyncio.CancelledError) as e:  # A referenced job failed or was dropped
+                job.future.set_exception(e if isinstance(e, Exception) else RuntimeError("Referenced job cancelled"))
+        if not rows:
+            return
+        try:
+            inserted = await self._with_retry("insert", lambda: self.supabase_client.insert_many(table_name, rows))
+        except Exception as e:
+            logger.error(f"Giving up inserting {len(rows)} rows into {table_name}: {e}")
+            for job in ready:
+                job.future.set_exception(e)
+            return
+        for job, record in zip(ready, inserted):
+            job.future.set_result(record)
+
+    async def _flush_one(self, job: _Job):
+        try:
+            if job.kind == "upload":
+                result = await self._with_retry("upload", lambda: self.supabase_client.upload_file(job.payload, job.target))
+            else:
+                data, key_column, key_value = job.payload
+                data = self._resolve(data)
+                result = await self._with_retry(
+                    "update", lambda: self.supabase_client.update(job.target, data, key_column, key_value))
+        except Exception as e:
+            logger.error(f"Giving up on {job.kind} for {job.target}: {e}")
+            job.future.set_exception(e)
+            return
+        job.future.set_result(result)
+
+    async def _with_retry(self, kind: str, operation):
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await operation()
+                PERSISTENCE_SECONDS.observe(time.perf_counter() - start, kind=kind)
+                return result
+            except Exception as e:
+                if attempt == self.max_retries:
+                    PERSISTENCE_SECONDS.observe(time.perf_counter() - start, kind=f"{kind}_failed")
+                    raise
+                delay = self.retry_backoff * (2 ** attempt)
+                logger.warning(f"Persistence attempt {attempt + 1} failed ({e}); retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def close(self, timeout: float = settings.PERSIST_DRAIN_TIMEOUT_S):
+        """Drains queued jobs (up to ``timeout`` seconds) and stops the worker."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Persistence drain timed out with {self._queue.qsize()} jobs pending.")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logger.info("Persistence worker stopped.")
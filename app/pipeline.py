@@ -0,0 +1,265 @@
+# app/pipeline.py
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Optional
+from fastapi import WebSocket
+from app.clients import ElevenLabsClient
+from app.config import settings
+from app.framing import OutboundFramer
+from app.logger import logger
+from app.metrics import TurnTimer
+
+_END_OF_SEGMENT = None
+_ULAW_BYTES_PER_MS = 8  # 8 kHz mu-law
+
+
+async def _replay(audio: bytes):
+    yield audio  # The framer splits it into paced Twilio frames
+
+
+class _SentSegment:
+    """A segment whose audio has (at least partly) been sent to Twilio."""
+    __slots__ = ("text", "transcription_ref", "audio", "audio_len", "start_ms", "mark")
+
+    def __init__(self, text: str, transcription_ref: asyncio.Future, start_ms: int):
+        self.text = text
+        self.transcription_ref = transcription_ref
+        # Kept only for archiving; without it memory per call doesn't grow with the reply
+        self.audio = bytearray() if settings.ARCHIVE_GENERATED_AUDIO else None
+        self.audio_len = 0
+        self.start_ms = start_ms  # Position on the framer's playback timeline
+        self.mark = None  # Mark name, once all of the segment's audio is sent
+
+
+class SpeechPipeline:
+    """Per-call TTS synthesis and ordered playback to the Twilio socket.
+
+    The generator submits text segments; each one starts synthesizing at once
+    into its own chunk queue, up to ``prefetch`` segments ahead of the one
+    that is playing. The playback stage drains those queues strictly in
+    submission order, so audio frames leave in order while the next sentences
+    are already being synthesized.
+
+    A segment may carry an approval gate (see ``app.approval``): it is still
+    synthesized right away, but its audio is held until the gate resolves to
+    the text to speak, and re-synthesized if that text was edited.
+
+    Segments may carry the ``TurnTimer`` of their turn, which gets the time of
+    the first TTS byte and of the first frame sent to Twilio.
+
+    Every segment is followed by a Twilio ``mark``. A segment counts as played
+    (and is handed to ``on_segment_played``) only once Twilio echoes its mark,
+    so on barge-in the pipeline knows how much audio the caller actually heard.
+    """
+
+    def __init__(self, websocket: WebSocket, stream_sid: str, elevenlabs_client: ElevenLabsClient,
+                 on_segment_played: Callable[..., Awaitable[None]],
+                 prefetch: int = settings.TTS_PREFETCH_SEGMENTS):
+        self.websocket = websocket
+        self.stream_sid = stream_sid
+        self.elevenlabs_client = elevenlabs_client
+        self.on_segment_played = on_segment_played
+        self.prefetch = max(prefetch, 0)
+        self.played_bytes = 0  # Audio confirmed played by Twilio marks
+        self.framer = OutboundFramer(websocket, stream_sid)
+        self._mark_seq = 0
+        self._unacked = deque()  # Sent segments awaiting their mark
+        self._background = set()  # Post-playback work (persistence) still running
+        self._start()
+
+    def _start(self):
+        self._slots = asyncio.Semaphore(self.prefetch + 1)  # Playing segment + prefetched ones
+        self._segments: asyncio.Queue = asyncio.Queue()
+        self._tts_tasks = set()
+        self._sending: Optional[_SentSegment] = None
+        self._playback_task = asyncio.create_task(self._playback(self._segments, self._slots))
+
+    @property
+    def is_speaking(self) -> bool:
+        """True while audio sent to Twilio may still be playing."""
+        return self._sending is not None or bool(self._unacked)
+
+    async def submit(self, text: str, transcription_ref: asyncio.Future, gate: Optional[asyncio.Future] = None,
+                     timer: Optional[TurnTimer] = None, audio: Optional[bytes] = None,
+                     keep_audio: bool = False) -> asyncio.Task:
+        """Queues a segment for synthesis; waits while the prefetch window is full.
+
+        ``audio`` is the segment's already synthesized audio (e.g. a cached
+        reply), played without a TTS request. With ``keep_audio`` the returned
+        synthesis task results in the segment's audio.
+        """
+        slots, segments = self._slots, self._segments
+        await slots.acquire()
+        chunks, task = self._start_synthesis(text, timer, audio, keep_audio)
+        segments.put_nowait((text, transcription_ref, chunks, task, gate, timer))
+        return task
+
+    def _start_synthesis(self, text: str, timer: Optional[TurnTimer] = None, audio: Optional[bytes] = None,
+                         keep_audio: bool = False):
+        chunks: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self._synthesize(text, chunks, timer, audio, keep_audio))
+        self._tts_tasks.add(task)
+        task.add_done_callback(self._tts_tasks.discard)
+        return chunks, task
+
+    async def _synthesize(self, text: str, chunks: asyncio.Queue, timer: Optional[TurnTimer] = None,
+                          audio: Optional[bytes] = None, keep_audio: bool = False) -> Optional[bytes]:
+        kept = bytearray() if keep_audio else None
+        try:
+            if audio is not None:
+                audio_stream = _replay(audio)
+            else:
+                audio_stream = self.elevenlabs_client.stream_tts(text, http_client=self.websocket.app.state.http_client)
+            async for chunk in audio_stream:
+                if timer is not None:
+                    timer.mark("first_tts_byte")  # Only the turn's first byte counts
+                chunks.put_nowait(chunk)
+                if kept is not None:
+                    kept.extend(chunk)
+            chunks.put_nowait(_END_OF_SEGMENT)
+            return bytes(kept) if kept is not None else None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            chunks.put_nowait(e)  # Surfaced by the playback stage, in order
+            return None
+
+    async def _playback(self, segments: asyncio.Queue, slots: asyncio.Semaphore):
+        while True:
+            text, transcription_ref, chunks, synthesis, gate, timer = await segments.get()
+            try:
+                if gate is not None:
+                    await asyncio.wait([gate])  # Audio keeps synthesizing meanwhile
+                    approved = None if gate.cancelled() else gate.result()
+                    if approved != text:
+                        synthesis.cancel()
+                        if approved is None:  # Rejected or withdrawn
+                            continue
+                        text = approved
+                        chunks, synthesis = self._start_synthesis(text, timer)
+                while (chunk := await chunks.get()) is not _END_OF_SEGMENT:
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    if self._sending is None:
+                        self._sending = _SentSegment(text, transcription_ref, self.framer.sent_ms)
+                    if self._sending.audio is not None:
+                        self._sending.audio.extend(chunk)
+                    self._sending.audio_len += len(chunk)
+                    frames_sent = self.framer.frames_sent
+                    await self.framer.write(chunk)  # Paced, Twilio-sized frames
+                    if timer is not None and self.framer.frames_sent != frames_sent:
+                        timer.mark("first_frame")
+                if self._sending is not None:
+                    await self.framer.flush()
+                    if timer is not None:
+                        timer.mark("first_frame")  # A segment shorter than one frame goes out here
+                    await self._send_mark(self._finish_sending())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"ElevenLabs error for stream {self.stream_sid}: {e}")
+                await self.websocket.send_json({"event": "error", "message": "ElevenLabs/Supabase error."})
+                await self.websocket.close(code=1011)  # Internal error.  Close the connection.
+                return
+            finally:
+                segments.task_done()
+                slots.release()
+
+    def _finish_sending(self) -> str:
+        """Moves the segment being sent to the unacknowledged list; returns its mark name."""
+        self._mark_seq += 1
+        self._sending.mark = str(self._mark_seq)
+        self._unacked.append(self._sending)
+        self._sending = None
+        return str(self._mark_seq)
+
+    async def _send_mark(self, name: str):
+        await self.websocket.send_json({"event": "mark", "streamSid": self.stream_sid, "mark": {"name": name}})
+
+    def on_mark(self, name: str):
+        """Handles a ``mark`` echoed by Twilio: everything up to it has played."""
+        if not any(segment.mark == name for segment in self._unacked):
+            return  # Stale mark from before an interruption
+        while self._unacked:
+            segment = self._unacked.popleft()
+            self._played(segment)
+            if segment.mark == name:
+                break
+
+    def _played(self, segment: _SentSegment, text: Optional[str] = None, audio_bytes: Optional[int] = None):
+        audio_bytes = segment.audio_len if audio_bytes is None else audio_bytes
+        audio = bytes(segment.audio[:audio_bytes]) if segment.audio is not None else b""
+        self.played_bytes += audio_bytes
+        interrupted = text is not None
+        self._spawn(self.on_segment_played(segment.text if text is None else text,
+                                           segment.transcription_ref, audio, interrupted=interrupted))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def wait_played(self):
+        """Waits until every submitted segment has been sent."""
+        await self._segments.join()
+
+    def _record_heard(self):
+        """Records the segments the caller heard before an interruption.
+
+        The framer's playback clock says how far along the timeline Twilio
+        has played; a partly heard segment is recorded with its text cut at
+        the matching word.
+        """
+        outstanding = list(self._unacked) + ([self._sending] if self._sending is not None else [])
+        played_ms = self.framer.played_ms()
+        for segment in outstanding:
+            heard_ms = played_ms - segment.start_ms
+            segment_ms = segment.audio_len / _ULAW_BYTES_PER_MS
+            if heard_ms >= segment_ms:
+                self._played(segment)
+                continue
+            if heard_ms > 0:
+                words = segment.text.split()
+                heard_text = " ".join(words[:round(len(words) * heard_ms / segment_ms)])
+                self._played(segment, text=f"{heard_text}—", audio_bytes=int(heard_ms * _ULAW_BYTES_PER_MS))
+            break
+
+    async def barge_in(self) -> bool:
+        """Stops playback because the caller started speaking.
+
+        Clears Twilio's audio buffer, records what was actually heard and
+        cancels in-flight synthesis. Returns False if nothing was playing.
+        """
+        if not self.is_speaking:
+            return False
+        await self.websocket.send_json({"event": "clear", "streamSid": self.stream_sid})
+        self._playback_task.cancel()
+        self._record_heard()
+        self._sending = None
+        self._unacked.clear()
+        self.framer.reset()
+        self.interrupt()
+        return True
+
+    def interrupt(self):
+        """Drops queued and in-flight segments and starts an empty pipeline.
+
+        Audio already sent keeps playing (use ``barge_in`` to cut it off) and
+        is still recorded once Twilio confirms it.
+        """
+        self._playback_task.cancel()
+        for task in list(self._tts_tasks):
+            task.cancel()
+        if self._sending is not None:
+            self.framer.drop_partial()
+            self._spawn(self._send_mark(self._finish_sending()))
+        self._start()
+
+    async def aclose(self):
+        """Stops playback and waits for outstanding post-playback work."""
+        self._playback_task.cancel()
+        for task in list(self._tts_tasks):
+            task.cancel()
+        await asyncio.gather(self._playback_task, *self._tts_tasks, return_exceptions=True)
+        self._record_heard()  # The stream is over; keep whatever reached the caller
+        await asyncio.gather(*self._background, return_exceptions=True)
@@ -1,29 +1,120 @@
 # app/redis_manager.py
 import aioredis
+import asyncio
 import json
 import logging
+import uuid
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+CALL_STATE_INVALIDATION_CHANNEL = "call_state_invalidate"
+
+
 class RedisManager:
-    """Handles Redis connection and provides helper functions."""
+    """Handles Redis connection and provides helper functions.
+
+    ``call_state:{sid}`` hashes are served from a per-process read-through
+    cache. Writes made through ``update_call_state`` are published on
+    ``CALL_STATE_INVALIDATION_CHANNEL`` so other workers drop their copy.
+    """
 
     _client = None
+    _call_state_cache = {}  # key -> hash, insertion-ordered for eviction
+    _origin = uuid.uuid4().hex  # Identifies this process's own invalidation messages
+    _pubsub = None
+    _listener = None
 
     @classmethod
     async def initialize(cls):
         if cls._client is None:
             cls._client = aioredis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+            cls._pubsub = cls._client.pubsub()
+            await cls._pubsub.subscribe(CALL_STATE_INVALIDATION_CHANNEL)
+            cls._listener = asyncio.create_task(cls._listen_for_invalidations())
             logger.info("Redis connection initialized.")
 
     @classmethod
     async def close(cls):
         if cls._client:
+            cls._listener.cancel()
+            await asyncio.gather(cls._listener, return_exceptions=True)
+            await cls._pubsub.close()
             await cls._client.close()
             cls._client = None
+            cls._call_state_cache.clear()
             logger.info("Redis connection closed.")
 
+    @classmethod
+    async def _listen_for_invalidations(cls):
+        while True:
+            try:
+                async for message in cls._pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    payload = json.loads(message["data"])
+                    if payload.get("origin") != cls._origin:
+                        cls._call_state_cache.pop(payload["key"], None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Can't trust the cache while disconnected from the channel
+                cls._call_state_cache.clear()
+                logger.error(f"Redis invalidation listener error: {e}")
+                await asyncio.sleep(1)
+
+    @classmethod
+    def pipeline(cls, transaction: bool = True):
+        """A pipeline (MULTI/EXEC when ``transaction``) for batching commands into one round-trip."""
+        return cls._client.pipeline(transaction=transaction)
+
+    @classmethod
+    async def hset_with_ttl(cls, key: str, mapping: dict, ttl: int):
+        """Atomically store a hash and set its expiry in one round-trip."""
+        try:
+            async with cls.pipeline() as pipe:
+                await pipe.hset(key, mapping=mapping).expire(key, ttl).execute()
+        except Exception as e:
+            logger.error(f"Redis error storing hash at {key}: {e}")
+            raise
+
+    @classmethod
+    async def get_call_state(cls, call_sid: str) -> dict:
+        """Read-through cached ``call_state:{sid}`` hash (a copy; don't mutate the cache)."""
+        key = f"call_state:{call_sid}"
+        state = cls._call_state_cache.get(key)
+        if state is None:
+            state = await cls.hgetall(key)
+            if state:
+                cls._cache_call_state(key, state)
+        return dict(state)
+
+    @classmethod
+    async def update_call_state(cls, call_sid: str, mapping: dict):
+        """Update fields of a call's state and invalidate other workers' cached copies."""
+        key = f"call_state:{call_sid}"
+        try:
+            async with cls.pipeline() as pipe:
+                await (pipe.hset(key, mapping=mapping)
+                       .publish(CALL_STATE_INVALIDATION_CHANNEL, json.dumps({"key": key, "origin": cls._origin}))
+                       .execute())
+        except Exception as e:
+            logger.error(f"Redis error updating call state {key}: {e}")
+            raise
+        if key in cls._call_state_cache:
+            cls._call_state_cache[key].update(mapping)
+
+    @classmethod
+    def forget_call_state(cls, call_sid: str):
+        """Drop a finished call from the local cache."""
+        cls._call_state_cache.pop(f"call_state:{call_sid}", None)
+
+    @classmethod
+    def _cache_call_state(cls, key: str, state: dict):
+        while len(cls._call_state_cache) >= settings.CALL_STATE_CACHE_MAX:
+            cls._call_state_cache.pop(next(iter(cls._call_state_cache)))  # Evict the oldest entry
+        cls._call_state_cache[key] = state
+
     @classmethod
     def get_client(cls) -> aioredis.Redis:
         if cls._client is None:
@@ -66,6 +157,25 @@ class RedisManager:
             logger.error(f"Redis error setting expire on {key}: {e}")
             return {}
 
+    @classmethod
+    async def rpush_window(cls, key: str, value: str, max_length: int, ttl: int):
+        """Append to a list, keeping only its last ``max_length`` items, and refresh its TTL."""
+        try:
+            async with cls.pipeline() as pipe:
+                await pipe.rpush(key, value).ltrim(key, -max_length, -1).expire(key, ttl).execute()
+        except Exception as e:
+            logger.error(f"Redis error appending to list {key}: {e}")
+            raise
+
+    @classmethod
+    async def lrange(cls, key: str, start: int, end: int) -> list:
+        """Retrieve a range of a list from Redis."""
+        try:
+            return await cls._client.lrange(key, start, end)
+        except Exception as e:
+            logger.error(f"Redis error retrieving list {key}: {e}")
+            return []
+
     @classmethod
     async def delete(cls, key: str):
         """Delete from Redis."""
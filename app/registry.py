@@ -0,0 +1,127 @@
+# app/registry.py
+import asyncio
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+import httpx
+from app.clients import SupabaseClient, TwilioClient, GroqClient, ElevenLabsClient, GoogleClient
+from app.config import settings
+from app.logger import logger
+from app.startup import StartupReport
+from app.tts_cache import load_phrases, prerender
+
+
+class ClientRegistry:
+    """Provider clients built once per process and shared by every request.
+
+    All HTTP-based providers run on one tuned ``httpx.AsyncClient`` pool
+    (keep-alive, HTTP/2 where offered). SDK-backed providers (Twilio, Groq,
+    Google) are built lazily: ``start`` only creates the pool and schedules a
+    background warm-up that imports and constructs them off the event loop,
+    and any provider a request needs first is built on the spot. A provider
+    that fails to build (e.g. missing Google credentials) is None rather than
+    taking the app down. Torn down with ``close``.
+    """
+
+    _FACTORIES = {
+        "twilio": lambda registry: TwilioClient(),
+        "groq": lambda registry: GroqClient(registry.http_client),
+        "elevenlabs": lambda registry: ElevenLabsClient(),
+        "google": lambda registry: GoogleClient(),
+    }
+
+    def __init__(self, report: Optional[StartupReport] = None):
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.supabase: Optional[SupabaseClient] = None
+        self.report = report or StartupReport()
+        self._providers = {}  # Name -> client, or None if it failed to build
+        self._locks = {name: threading.Lock() for name in self._FACTORIES}
+        self._warm_up_task: Optional[asyncio.Task] = None
+
+    @property
+    def twilio(self) -> TwilioClient:
+        return self._provider("twilio")
+
+    @property
+    def groq(self) -> GroqClient:
+        return self._provider("groq")
+
+    @property
+    def elevenlabs(self) -> ElevenLabsClient:
+        return self._provider("elevenlabs")
+
+    @property
+    def google(self) -> Optional[GoogleClient]:
+        return self._provider("google")
+
+    def _provider(self, name: str):
+        if name in self._providers:
+            return self._providers[name]
+        with self._locks[name]:  # The warm-up thread may be building it right now
+            if name not in self._providers:
+                start = time.perf_counter()
+                try:
+                    self._providers[name] = self._FACTORIES[name](self)
+                    self.report.record(f"client:{name}", time.perf_counter() - start)
+                except Exception as e:
+                    self._providers[name] = None
+                    self.report.record(f"client:{name}", time.perf_counter() - start, e)
+                    logger.error(f"{name} client unavailable: {e}")
+            return self._providers[name]
+
+    async def start(self):
+        with self.report.measure("http pool"):
+            self.http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.HTTP_TIMEOUT_S),
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_S,
+                ),
+                http2=settings.HTTP2_ENABLED,
+            )
+            self.supabase = SupabaseClient(self.http_client)
+        self._warm_up_task = asyncio.create_task(self._background_warm_up())
+
+    async def _background_warm_up(self):
+        start = time.perf_counter()
+        # SDK imports and Vertex AI model loading are blocking; keep them off the event loop
+        await asyncio.gather(*(asyncio.to_thread(self._provider, name) for name in self._FACTORIES))
+        if settings.CLIENT_WARMUP:
+            with self.report.measure("connection warm-up"):
+                await self.warm_up()
+        if settings.TTS_PHRASE_LIBRARY and self.elevenlabs is not None and self.elevenlabs.cache is not None:
+            try:
+                with self.report.measure("tts phrase library"):
+                    result = await prerender(self.elevenlabs, self.http_client, load_phrases(settings.TTS_PHRASE_LIBRARY))
+                logger.info(f"TTS phrase library: {result}")
+            except Exception as e:
+                logger.error(f"Could not pre-render the TTS phrase library: {e}")
+        self.report.record("client warm-up (background)", time.perf_counter() - start)
+        self.report.log("Provider clients ready",
+                        [*(f"client:{name}" for name in self._FACTORIES), "connection warm-up",
+                         "tts phrase library", "client warm-up (background)"])
+
+    async def warm_up(self):
+        """Opens pooled connections (DNS, TCP, TLS) to each provider ahead of the first call."""
+        urls = {settings.ELEVENLABS_API_BASE_URL, settings.SUPABASE_URL, settings.WHISPER_API_URL,
+                settings.GROQ_BASE_URL or "https://api.groq.com"}
+        origins = {f"{parts.scheme}://{parts.netloc}" for parts in map(urlsplit, urls) if parts.netloc}
+
+        async def touch(origin: str):
+            try:
+                await self.http_client.head(origin, timeout=settings.CLIENT_WARMUP_TIMEOUT_S)
+            except httpx.HTTPError as e:
+                logger.warning(f"Warm-up of {origin} failed: {e}")
+
+        await asyncio.gather(*(touch(origin) for origin in origins))
+
+    async def close(self):
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+            await asyncio.gather(self._warm_up_task, return_exceptions=True)
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+        logger.info("Provider clients closed.")
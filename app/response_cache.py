@@ -0,0 +1,137 @@
+# app/response_cache.py
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import time
+from typing import List, Optional, Tuple
+from app.config import settings
+from app.conversation import Conversation
+from app.metrics import metrics
+from app.redis_manager import RedisManager
+from app.logger import logger
+
+_ENTRY_KEY = "response_cache_entry:{entry_id}"  # JSON segments, with their audio
+_LRU = "response_cache_lru"  # Sorted set: entry id -> last used
+
+_FILLERS = {"um", "uh", "er", "erm", "hmm", "mm"}  # Sounds only; words like "like" or "well" carry meaning
+
+RESPONSE_CACHE_LOOKUPS = metrics.counter(
+    "response_cache_lookups_total", "Replies looked up in the response cache, by call script and result.",
+    ("script", "result"))
+
+
+def script_id(system_prompt: str, instructions: str, context: str) -> str:
+    """Identifies a call script: calls sharing prompt, instructions and context share cached replies."""
+    digest = hashlib.sha1("\0".join((system_prompt, instructions, context)).encode()).hexdigest()
+    return digest[:12]
+
+
+def normalize(utterance: str) -> str:
+    """Lowercased words without punctuation or filler sounds ("Um, yes!" -> "yes")."""
+    words = re.findall(r"[a-z0-9']+", utterance.lower())
+    return " ".join(word for word in words if word not in _FILLERS)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+class ResponseCache:
+    """Replies (text and synthesized mu-law audio) to short, common caller turns.
+
+    A reply is cached under its call script, everything said in the call so
+    far and the caller's turn, so it is only ever replayed where it was
+    generated from the same input: "yes" is answered per question asked, and
+    a reply drawing on details one caller gave earlier never reaches another.
+    Utterances must match exactly after ``normalize``; near matches are
+    misses, since one word ("not", "can't", "Tuesday") can flip the meaning.
+    A hit is played straight from Redis, with no Groq or ElevenLabs request.
+
+    Entries expire after ``ttl_s`` without use; past ``max_entries`` the
+    least recently used are evicted. Only turns of up to ``max_words`` are
+    cached, since longer ones rarely repeat.
+    """
+
+    def __init__(self, max_words: int = settings.RESPONSE_CACHE_MAX_WORDS,
+                 ttl_s: int = settings.RESPONSE_CACHE_TTL_S,
+                 max_entries: int = settings.RESPONSE_CACHE_MAX_ENTRIES,
+                 max_audio_bytes: int = settings.RESPONSE_CACHE_MAX_AUDIO_BYTES):
+        self.max_words = max_words
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.max_audio_bytes = max_audio_bytes
+
+    def key(self, script: str, conversation: Conversation, user_message: str) -> Optional[Tuple[str, str]]:
+        """The cache key of a reply (script, entry id), or None if the turn shouldn't be cached."""
+        utterance = normalize(user_message)
+        if not utterance or len(utterance.split()) > self.max_words:
+            return None
+        history = [conversation.summary] + [f'{turn["role"]}: {normalize(turn["content"])}'
+                                            for turn in conversation.turns]
+        return script, _digest("\0".join([script, *history, utterance]))
+
+    async def get(self, key: Tuple[str, str]) -> Optional[List[Tuple[str, bytes]]]:
+        """The cached reply segments (text, audio) for the key, if any."""
+        script, entry_id = key
+        segments = None
+        try:
+            raw = await RedisManager.get_client().get(_ENTRY_KEY.format(entry_id=entry_id))
+            if raw is not None:
+                segments = [(text, base64.b64decode(audio)) for text, audio in json.loads(raw)]
+                async with RedisManager.pipeline(transaction=False) as pipe:
+                    await (pipe.zadd(_LRU, {entry_id: time.time()})
+                           .expire(_ENTRY_KEY.format(entry_id=entry_id), self.ttl_s)
+                           .execute())
+        except Exception as e:
+            logger.error(f"Response cache lookup failed for script {script}: {e}")
+        RESPONSE_CACHE_LOOKUPS.inc(script=script, result="hit" if segments else "miss")
+        return segments
+
+    async def put(self, key: Tuple[str, str], segments: List[Tuple[str, asyncio.Task]]):
+        """Caches a reply once all of its segments are synthesized.
+
+        ``segments`` pairs each text with the pipeline task synthesizing it
+        (see ``SpeechPipeline.submit``); nothing is cached if any of them
+        failed or was cancelled.
+        """
+        tasks = [task for _, task in segments]
+        await asyncio.wait(tasks)  # Unlike gather, doesn't cancel them if this reply is interrupted
+        if any(task.cancelled() or task.exception() is not None or task.result() is None for task in tasks):
+            return
+        audio = [task.result() for task in tasks]
+        if sum(map(len, audio)) > self.max_audio_bytes:
+            return
+        script, entry_id = key
+        payload = json.dumps([(text, base64.b64encode(data).decode("ascii"))
+                              for (text, _), data in zip(segments, audio)])
+        try:
+            async with RedisManager.pipeline() as pipe:
+                results = await (pipe.set(_ENTRY_KEY.format(entry_id=entry_id), payload, ex=self.ttl_s)
+                                 .zadd(_LRU, {entry_id: time.time()})
+                                 .zcard(_LRU)
+                                 .execute())
+            if results[-1] > self.max_entries:
+                await self._evict(results[-1] - self.max_entries)
+        except Exception as e:
+            logger.error(f"Could not cache reply for script {script}: {e}")
+
+    async def _evict(self, count: int):
+        """Drops the least recently used entries."""
+        client = RedisManager.get_client()
+        evicted = await client.zpopmin(_LRU, count)
+        if evicted:
+            await client.delete(*(_ENTRY_KEY.format(entry_id=entry_id) for entry_id, _ in evicted))
+
+    @staticmethod
+    def stats() -> dict:
+        """Lookups, hits and hit rate per script, in this process."""
+        scripts = {}
+        for labels, value in RESPONSE_CACHE_LOOKUPS.samples().items():
+            labels = dict(labels)
+            counts = scripts.setdefault(labels["script"], {"hits": 0, "misses": 0})
+            counts["hits" if labels["result"] == "hit" else "misses"] += int(value)
+        for counts in scripts.values():
+            counts["hit_rate"] = round(counts["hits"] / (counts["hits"] + counts["misses"]), 4)
+        return scripts
@@ -1,23 +1,39 @@
 # app/routes.py
 import logging
+import csv
 import json
 import asyncio
-from fastapi import APIRouter, Request, Form, WebSocket, Depends, HTTPException, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+import time
+from typing import Optional
+from fastapi import APIRouter, Request, Form, File, UploadFile, WebSocket, Depends, HTTPException, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, PlainTextResponse, StreamingResponse, Response
 from fastapi.templating import Jinja2Templates
-from twilio.twiml.voice_response import VoiceResponse, Connect, Stream
 from app.config import settings
-from app.clients import TwilioClient, SupabaseClient, GroqClient, ElevenLabsClient, GoogleClient
-from app.ai import generate_text_stream
+from app.clients import TwilioClient, SupabaseClient, GroqClient, ElevenLabsClient
+from app.ai import generate_text_stream, process_text_chunk, save_generated_audio
+from app.pipeline import SpeechPipeline
+from app.persistence import PersistenceWorker, resolved
+from app.memory import MemoryIngestionWorker
+from app.campaign import CampaignDialer, InvalidCampaign, parse_contacts
+from app.sms import SmsReplyWorker, EMPTY_TWIML
+from app.control import ControlPlane, COMMANDS, command_args
+from app.approval import ApprovalQueue, ACTIONS
 from app.redis_manager import RedisManager
-from app.dep import get_twilio_client, get_supabase_client, get_groq_client, get_elevenlabs_client, get_redis_client, get_google_client #get_http_client removed
-from app.transcription import transcribe_audio_streaming
+from app.dep import get_twilio_client, get_supabase_client, get_groq_client, get_elevenlabs_client, get_redis_client, get_persistence_worker, get_control_plane, get_memory_worker, get_campaign_dialer, get_sms_worker, get_response_cache #get_http_client removed
+from app.transcription import TranscriptionSession, create_transcription_backend
+from app.vad import UtteranceDetector
+from app.conversation import Conversation, build_static_prefix
+from app.metrics import TurnTimer, metrics
+from app.response_cache import ResponseCache, script_id
+from app.tts_cache import prerender
+from app.history import TABLES, HistoryQuery, InvalidHistoryQuery, fetch_page, iter_rows
 from app.utils import split_into_sentences
 from app.logger import logger
 import uuid
 from datetime import datetime
+from urllib.parse import urlencode
 import base64
-from app.prompts import DEFAULT_SYSTEM_PROMPT, SMS_SYSTEM_PROMPT
+from app.prompts import DEFAULT_SYSTEM_PROMPT
 
 
 router = APIRouter()
@@ -35,26 +51,105 @@ async def index(request: Request):
     })
 
 @router.get("/history", response_class=HTMLResponse)
-async def call_history(request: Request, supabase_client: SupabaseClient = Depends(get_supabase_client)):
-    """Displays a basic call and SMS history."""
+async def call_history(
+    request: Request,
+    number: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    status: Optional[str] = None,
+    direction: Optional[str] = None,
+    calls_cursor: Optional[str] = None,
+    sms_cursor: Optional[str] = None,
+    supabase_client: SupabaseClient = Depends(get_supabase_client)
+):
+    """Displays call and SMS history, one page of each at a time (newest first)."""
     try:
-        calls = await supabase_client.get_all("calls")
-        sms_messages = await supabase_client.get_all("sms_messages")
-
-        # Sort by creation time (newest first) - assuming you have a 'created_at' column
-        calls.sort(key=lambda x: x.get('created_at', datetime.min), reverse=True)
-        sms_messages.sort(key=lambda x: x.get('created_at', datetime.min), reverse=True)
-
+        calls_query = HistoryQuery.parse("calls", number, since, until, status)
+        sms_query = HistoryQuery.parse("sms_messages", number, since, until, direction)
+        (calls, next_calls), (sms_messages, next_sms) = await asyncio.gather(
+            fetch_page(supabase_client, calls_query, settings.HISTORY_PAGE_SIZE, calls_cursor),
+            fetch_page(supabase_client, sms_query, settings.HISTORY_PAGE_SIZE, sms_cursor))
 
         return templates.TemplateResponse("history.html", {
             "request": request,
             "calls": calls,
-            "sms_messages": sms_messages
+            "sms_messages": sms_messages,
+            "filters": {"number": number or "", "since": since or "", "until": until or "",
+                        "status": status or "", "direction": direction or ""},
+            # Each list pages on its own; the other keeps its place
+            "older_calls_url": str(request.url.include_query_params(calls_cursor=next_calls)) if next_calls else None,
+            "older_sms_url": str(request.url.include_query_params(sms_cursor=next_sms)) if next_sms else None,
+            # Exports cover everything the filters match, not just the page shown
+            "export_calls_url": _export_url("calls", number=number, since=since, until=until, status=status),
+            "export_sms_url": _export_url("sms_messages", number=number, since=since, until=until, status=direction),
         })
+    except InvalidHistoryQuery as e:
+        return templates.TemplateResponse("error.html", {"request": request, "error_message": str(e)})
     except Exception as e:
         logger.error(f"Error retrieving history: {e}")
         return templates.TemplateResponse("error.html", {"request": request, "error_message": "Could not retrieve history."})
 
+def _export_url(table: str, **filters) -> str:
+    query = urlencode({name: value for name, value in filters.items() if value})
+    return f"/api/history/{table}/export" + (f"?{query}" if query else "")
+
+@router.get("/api/history/{table}")
+async def history_page(
+    table: str,
+    number: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    status: Optional[str] = None,
+    columns: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = settings.HISTORY_PAGE_SIZE,
+    supabase_client: SupabaseClient = Depends(get_supabase_client)
+):
+    """One page of calls or SMS messages, newest first. Pass ``next_cursor`` back
+    as ``cursor`` for the next page; ``columns`` is a comma-separated projection."""
+    if table not in TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown history table: {table}")
+    try:
+        query = HistoryQuery.parse(table, number, since, until, status, columns)
+        items, next_cursor = await fetch_page(supabase_client, query,
+                                              min(max(limit, 1), settings.HISTORY_MAX_PAGE_SIZE), cursor)
+    except InvalidHistoryQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error retrieving {table} history: {e}")
+        raise HTTPException(status_code=500, detail="Could not retrieve history")
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/api/history/{table}/export")
+async def history_export(
+    table: str,
+    number: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    status: Optional[str] = None,
+    columns: Optional[str] = None,
+    supabase_client: SupabaseClient = Depends(get_supabase_client)
+):
+    """Streams every matching row as NDJSON, fetching a batch at a time, so
+    exports of any size use constant memory."""
+    if table not in TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown history table: {table}")
+    try:
+        query = HistoryQuery.parse(table, number, since, until, status, columns)
+    except InvalidHistoryQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        try:
+            async for row in iter_rows(supabase_client, query, settings.HISTORY_EXPORT_BATCH):
+                yield json.dumps(row, default=str) + "\n"
+        except Exception as e:
+            # Headers are already sent; a truncated file plus the log is all we can do
+            logger.error(f"{table} export aborted: {e}")
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": f'attachment; filename="{table}.ndjson"'})
+
 @router.post("/make-call")
 async def make_call(
     request: Request,
@@ -83,15 +178,15 @@ async def make_call(
         })
         call_db_id = inserted_call['id']
 
-        # Store persistent state in Redis (using call.sid as the key)
-        await redis_client.hset(f"call_state:{call.sid}", mapping={
+        # Store persistent state in Redis (using call.sid as the key); hash + expiry in one transaction
+        await redis_client.hset_with_ttl(f"call_state:{call.sid}", {
             "call_db_id": str(call_db_id),  # Store as string
             "system_prompt": system_prompt,
             "instructions": instructions,
             "context": context,
+            "to_number": phone_number,  # Long-term memories are kept per number
             "human_in_loop": "false",  # Initialize human-in-loop flag
-        })
-        await redis_client.expire(f"call_state:{call.sid}", 86400) # Expire
+        }, settings.CALL_STATE_TTL_S)
 
         return templates.TemplateResponse("call_initiated.html", {"request": request, "call_sid": call.sid})
 
@@ -99,13 +194,68 @@ async def make_call(
         logger.error(f"Error making call: {e}")
         return templates.TemplateResponse("error.html", {"request": request, "error_message": str(e)})
 
+@router.post("/campaigns")
+async def create_campaign(
+    request: Request,
+    file: UploadFile = File(...),
+    system_prompt: str = Form(DEFAULT_SYSTEM_PROMPT),
+    instructions: str = Form(""),
+    context: str = Form(""),
+    twilio_client: TwilioClient = Depends(get_twilio_client),  # 503 up front if Twilio is unavailable
+    campaigns: CampaignDialer = Depends(get_campaign_dialer)
+):
+    """Starts an outbound campaign from a CSV or JSONL upload of contacts
+    (``phone_number`` plus optional per-row ``system_prompt``, ``instructions``
+    and ``context``; the form fields are the defaults)."""
+    try:
+        contacts, errors = parse_contacts(await file.read(), file.filename or "")
+    except (InvalidCampaign, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    campaign_id = await campaigns.submit(
+        contacts, {"system_prompt": system_prompt, "instructions": instructions, "context": context},
+        f"https://{request.headers['host']}")
+    return {"campaign_id": campaign_id, "contacts": len(contacts), "rejected": len(errors), "errors": errors[:20]}
+
+@router.get("/campaigns/{campaign_id}")
+async def campaign_progress(campaign_id: str, campaigns: CampaignDialer = Depends(get_campaign_dialer)):
+    """Dialing progress and call outcomes of a campaign, from any worker."""
+    progress = await campaigns.progress(campaign_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return progress
+
+@router.delete("/campaigns/{campaign_id}")
+async def cancel_campaign(campaign_id: str, campaigns: CampaignDialer = Depends(get_campaign_dialer)):
+    """Stops dialing a campaign; calls already in progress continue."""
+    if not await campaigns.progress(campaign_id):
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    await campaigns.cancel(campaign_id)
+    return {"campaign_id": campaign_id, "status": "cancelling"}
+
+@router.post("/campaigns/{campaign_id}/status")
+async def campaign_call_status(
+    campaign_id: str,
+    request: Request,
+    persistence: PersistenceWorker = Depends(get_persistence_worker),
+    campaigns: CampaignDialer = Depends(get_campaign_dialer)
+):
+    """Twilio status callback for campaign calls; relayed to the worker dialing the campaign."""
+    form_data = await request.form()
+    call_sid, call_status = form_data.get("CallSid"), form_data.get("CallStatus")
+    if call_sid and call_status:
+        if call_status != "completed":  # A completed call's row is closed by its media stream
+            persistence.update("calls", {"status": call_status}, "twilio_sid", call_sid)
+        await campaigns.publish_status(campaign_id, {"call_sid": call_sid, "call_status": call_status})
+    return Response(status_code=204)
+
 @router.post("/send-sms")
 async def send_sms(
     request: Request,
     phone_number: str = Form(...),
     message: str = Form(...),
     twilio_client: TwilioClient = Depends(get_twilio_client),
-    supabase_client: SupabaseClient = Depends(get_supabase_client)
+    supabase_client: SupabaseClient = Depends(get_supabase_client),
+    sms_worker: SmsReplyWorker = Depends(get_sms_worker)
 ):
     """Handles sending SMS messages."""
     try:
@@ -117,6 +267,7 @@ async def send_sms(
             "body": message,
             "direction": "outbound"
         })
+        await sms_worker.record_outbound(phone_number, message)  # A reply to it continues the thread
         return templates.TemplateResponse("sms_sent.html", {"request": request, "message_sid": twilio_message.sid})
 
     except Exception as e:
@@ -124,47 +275,31 @@ async def send_sms(
         return templates.TemplateResponse("error.html", {"request": request, "error_message": str(e)})
 
 @router.api_route("/incoming-sms", methods=["GET", "POST"])
-async def incoming_sms(
-    request: Request,
-    twilio_client: TwilioClient = Depends(get_twilio_client),
-    supabase_client: SupabaseClient = Depends(get_supabase_client),
-    google_client: GoogleClient = Depends(get_google_client)
-):
-    """Handles incoming SMS messages."""
+async def incoming_sms(request: Request, sms_worker: SmsReplyWorker = Depends(get_sms_worker)):
+    """Handles incoming SMS messages.
+
+    Acks Twilio straight away with empty TwiML; the reply is generated and
+    sent by the SMS worker (see ``SmsReplyWorker``).
+    """
     form_data = await request.form()
     from_number = form_data.get("From")
-    to_number = form_data.get("To")
-    message_body = form_data.get("Body")
+    message_body = form_data.get("Body") or ""
     twilio_sid = form_data.get("MessageSid")
+    if not from_number or not twilio_sid:
+        return Response(EMPTY_TWIML, media_type="application/xml")
     logger.info(f"Received SMS from {from_number}: {message_body}")
-
-    # Store incoming SMS in Supabase
-    await supabase_client.insert("sms_messages", {
-        "twilio_sid": twilio_sid,
-        "from_number": from_number,
-        "to_number": to_number,
-        "body": message_body,
-        "direction": "inbound"
-    })
-
     try:
-        # Generate AI response using the GoogleClient
-        messages = [
-            {"role": "system", "content": SMS_SYSTEM_PROMPT},  # Use the correct prompt
-            {"role": "user", "content": message_body},
-        ]
-        ai_response = await google_client.generate_text(messages=messages)
-        await supabase_client.update("sms_messages", {"response_text": ai_response}, "twilio_sid", twilio_sid)
-        await twilio_client.send_sms(from_number, ai_response)  # Use the async TwilioClient
-        logger.info(f"Sent SMS reply to {from_number}: {ai_response}")
-        return JSONResponse({"status": "Reply sent"})
+        if not await sms_worker.receive(twilio_sid, from_number, form_data.get("To"), message_body):
+            logger.info(f"Ignoring redelivered SMS {twilio_sid}")
     except Exception as e:
         logger.error(f"Error handling incoming SMS: {e}")
-        return JSONResponse({"status": "Error"}, status_code=500)
+        return Response(EMPTY_TWIML, media_type="application/xml", status_code=500)  # Twilio will retry
+    return Response(EMPTY_TWIML, media_type="application/xml")
 
 @router.api_route("/twiml", methods=["GET", "POST"])
 async def twiml(request: Request):
     """Returns TwiML to connect the call to the WebSocket stream."""
+    from twilio.twiml.voice_response import VoiceResponse, Connect  # Twilio's SDK is loaded lazily
     response = VoiceResponse()
     response.say("Connecting you to our AI assistant. Please wait.")
     connect = Connect()
@@ -176,18 +311,129 @@ async def twiml(request: Request):
 async def media_stream(
     websocket: WebSocket,
     redis_client: RedisManager = Depends(get_redis_client),
-    supabase_client: SupabaseClient = Depends(get_supabase_client),
+    persistence: PersistenceWorker = Depends(get_persistence_worker),
+    control: ControlPlane = Depends(get_control_plane),
+    memory: MemoryIngestionWorker = Depends(get_memory_worker),
+    twilio_client: TwilioClient = Depends(get_twilio_client),
     groq_client: GroqClient = Depends(get_groq_client),
-    elevenlabs_client: ElevenLabsClient = Depends(get_elevenlabs_client)
+    elevenlabs_client: ElevenLabsClient = Depends(get_elevenlabs_client),
+    response_cache: Optional[ResponseCache] = Depends(get_response_cache)
 ):
     """Handles the bi-directional media stream with Twilio."""
     await websocket.accept()
     logger.info("Twilio connected to media stream.")
 
     stream_sid = None
+    call_sid = None  # Key for call state and control commands (shared by every worker)
+    persistent_state = {}
     call_state = {}  # Local state for *this* WebSocket connection
     active_tasks = {} # Local in-memory storage for active tasks
 
+    def queue_transcription(text: str, audio: bytes = b"") -> Optional[asyncio.Future]:
+        """Queues a caller turn for Supabase (write-behind; never awaited here)."""
+        call_db_id_str = persistent_state.get("call_db_id")
+        if not call_db_id_str:
+            logger.error(f"call_db_id not found in Redis for call {call_sid}")
+            return None
+        raw_audio_url = None
+        if audio:
+            raw_audio_url = persistence.upload(audio, f"raw_audio_{stream_sid}_{uuid.uuid4()}.ulaw")
+        transcription_ref = persistence.insert("transcriptions", {
+            "call_id": int(call_db_id_str),
+            "text": text,
+            "raw_audio_path": raw_audio_url
+        })
+        call_state[stream_sid]["last_transcription_ref"] = transcription_ref
+        return transcription_ref
+
+    def stop_reply():
+        """Cancels the reply being generated and drops its queued sentences."""
+        if active_tasks[stream_sid]["active_generation_task"]:
+            active_tasks[stream_sid]["active_generation_task"].cancel()  # Cancel any previous task
+            call_state[stream_sid]["speech_pipeline"].interrupt()
+        call_state[stream_sid]["approvals"].cancel_pending()
+
+    async def start_reply(text: str, transcription_ref: asyncio.Future, timer: Optional[TurnTimer] = None):
+        stop_reply()
+        if timer is not None:
+            call_state[stream_sid]["turn_timers"].append(timer)  # Attached to the call record at the end
+        # Served from the local cache; a toggle on any worker invalidates it
+        human_in_loop = (await redis_client.get_call_state(call_sid)).get("human_in_loop") == "true"
+        approvals = call_state[stream_sid]["approvals"] if human_in_loop else None
+        active_tasks[stream_sid]["active_generation_task"] = asyncio.create_task(
+            generate_text_stream(text, groq_client, call_state[stream_sid]["speech_pipeline"],
+                                websocket, stream_sid,
+                                transcription_ref, call_state[stream_sid]["conversation"], approvals, timer,
+                                response_cache, call_state[stream_sid]["script"])
+        )
+
+    async def handle_transcripts(session: TranscriptionSession):
+        """Consumes final transcripts for this stream and starts a reply for each."""
+        async for transcript in session:
+            if not transcript.is_final:
+                logger.debug(f"Partial transcription: {transcript.text}")
+                continue
+            if not transcript.text:
+                continue
+            timer = TurnTimer(transcript.speech_ended_at)
+            timer.mark("transcript")
+            logger.info(f"Transcription: {transcript.text}")
+            try:
+                transcription_ref = queue_transcription(transcript.text, transcript.audio)
+                if transcription_ref is None:
+                    continue #Skip
+                await control.publish_transcript(call_sid, {"event": "transcript", "role": "caller",
+                                                            "text": transcript.text})
+                await start_reply(transcript.text, transcription_ref, timer)
+            except Exception as e:
+                logger.error(f"Error handling transcription for stream {stream_sid}: {e}")
+
+    async def on_segment_played(text, transcription_ref, audio_data, interrupted=False):
+        await save_generated_audio(text, transcription_ref, audio_data, persistence, websocket, stream_sid,
+                                   call_state[stream_sid]["conversation"], interrupted)
+        await control.publish_transcript(call_sid, {"event": "transcript", "role": "ai", "text": text,
+                                                    "interrupted": interrupted})
+
+    async def handle_command(command: dict):
+        """Executes a control command sent to this call from any worker."""
+        if stream_sid not in call_state:
+            return
+        name = command.get("command")
+        logger.info(f"Control command {name} for call {call_sid}")
+        if name == "toggle_human_in_loop":
+            enabled = command.get("enabled")
+            if enabled is None:
+                enabled = (await redis_client.get_call_state(call_sid)).get("human_in_loop") != "true"
+            await redis_client.update_call_state(call_sid, {"human_in_loop": str(bool(enabled)).lower()})
+            await control.publish_transcript(call_sid, {"event": "human_in_loop", "enabled": bool(enabled)})
+            if not enabled:
+                call_state[stream_sid]["approvals"].approve_pending()  # Don't leave drafts waiting for nobody
+            logger.info(f"Human-in-the-loop toggled to: {bool(enabled)} for call {call_sid}")
+        elif name == "override":
+            # Say the supervisor's text instead of whatever the AI is saying
+            stop_reply()
+            pipeline = call_state[stream_sid]["speech_pipeline"]
+            await pipeline.barge_in()
+            transcription_ref = call_state[stream_sid]["last_transcription_ref"]
+            await process_text_chunk(command.get("text", ""), pipeline, transcription_ref)
+        elif name == "inject_speech":
+            # Handled exactly as if the caller had said it
+            text = command.get("text", "").strip()
+            timer = TurnTimer()  # No caller speech, so no mouth-to-ear span
+            timer.mark("transcript")
+            transcription_ref = queue_transcription(text) if text else None
+            if transcription_ref is not None:
+                await control.publish_transcript(call_sid, {"event": "transcript", "role": "caller",
+                                                            "text": text, "injected": True})
+                await start_reply(text, transcription_ref, timer)
+        elif name == "decide":
+            # A supervisor approved, edited or rejected a drafted sentence
+            if not call_state[stream_sid]["approvals"].decide(command.get("draft_id"), command.get("action"),
+                                                              command.get("text")):
+                logger.info(f"Draft {command.get('draft_id')} for call {call_sid} was no longer pending")
+        elif name == "hangup":
+            await twilio_client.hangup(call_sid)  # Twilio then sends "stop" on this stream
+
     try:
         async for message in websocket.iter_text():
             data = json.loads(message)
@@ -195,21 +441,54 @@ async def media_stream(
 
             if event_type == "start":
                 stream_sid = data["start"]["streamSid"]
-                logger.info(f"Stream started: {stream_sid}")
+                call_sid = data["start"]["callSid"]
+                logger.info(f"Stream started: {stream_sid} (call {call_sid})")
 
-                # Retrieve ALL persistent call state from Redis
-                persistent_state = await redis_client.hgetall(f"call_state:{stream_sid}")
+                # Retrieve ALL persistent call state from Redis (and prime the local cache)
+                persistent_state = await redis_client.get_call_state(call_sid)
                 if not persistent_state:
-                    logger.error(f"Call state for stream {stream_sid} not found in Redis.")
+                    logger.error(f"Call state for call {call_sid} not found in Redis.")
                     await websocket.close(code=4000) #Close
                     return
 
+                # Persona + instructions + context (+ what we remember of a repeat caller) are assembled once per call
+                caller = persistent_state.get("to_number")
+                context = persistent_state.get("context", "")
+                memories = await memory.recall(caller)
+                if memories:
+                    context += "\n\nWhat you remember from earlier calls with this person:\n" + "\n".join(
+                        f"- {text}" for text in memories)
+                conversation = Conversation(call_sid, build_static_prefix(
+                    persistent_state["system_prompt"],
+                    persistent_state.get("instructions", ""),
+                    context), memory=memory, caller=caller)
+                await conversation.load()
+
+                transcription_buffer = bytearray()
+                transcription_session = TranscriptionSession(
+                    stream_sid, create_transcription_backend(websocket.app.state.http_client))
                 call_state[stream_sid] = {
-                    "transcription_buffer": b"",
+                    "transcription_buffer": transcription_buffer,  # Audio of the utterance in progress
+                    "transcribed_bytes": 0,  # How much of the buffer has been pushed to the session
+                    "utterance_detector": UtteranceDetector(transcription_buffer),
+                    "transcription_session": transcription_session,
+                    "speech_pipeline": SpeechPipeline(websocket, stream_sid, elevenlabs_client, on_segment_played),
+                    "conversation": conversation,
+                    "barged_in": False,  # Whether the current utterance already interrupted playback
+                    "approvals": ApprovalQueue(lambda event: control.publish_transcript(call_sid, event)),
+                    "last_transcription_ref": resolved({"id": None}),  # Override replies attach to the latest turn
+                    "turn_timers": [],  # One TurnTimer per reply started
                     "system_prompt": persistent_state["system_prompt"],
-                    "human_in_loop": persistent_state.get("human_in_loop", "false") == "true", # Get human_in_loop
+                    # Cached replies are shared by callers of the same script, so not with remembered ones
+                    "script": None if memories else script_id(persistent_state["system_prompt"],
+                                                              persistent_state.get("instructions", ""),
+                                                              persistent_state.get("context", "")),
                 }
-                active_tasks[stream_sid] = { "active_generation_task": None }
+                active_tasks[stream_sid] = {
+                    "active_generation_task": None,
+                    "transcription_task": asyncio.create_task(handle_transcripts(transcription_session)),
+                }
+                control.register(call_sid, handle_command)
 
             elif event_type == "media":
                 audio_payload = data["media"]["payload"]
@@ -219,45 +498,36 @@ async def media_stream(
                     logger.warning(f"No active call state found for stream {stream_sid}")
                     continue
 
-                # 1. Transcribe
-                transcription_text = await transcribe_audio_streaming(audio_payload, websocket.app.state.http_client)  # Use http_client from app.state
-                if transcription_text and transcription_text != "[ERROR]":
-                    logger.info(f"Transcription: {transcription_text}")
-
-                    # Get Call ID
-                    call_db_id_str = persistent_state.get("call_db_id")
-                    if not call_db_id_str:
-                        logger.error(f"call_db_id not found in Redis for stream {stream_sid}")
-                        continue #Skip
-                    call_db_id = int(call_db_id_str)
-
-                     # --- Store transcription in Supabase ---
-                    raw_audio_data = base64.b64decode(audio_payload)
-                    raw_audio_url = await supabase_client.upload_file(raw_audio_data, f"raw_audio_{stream_sid}_{uuid.uuid4()}.ulaw")
-                    transcription = await supabase_client.insert("transcriptions", {
-                        "call_id": call_db_id,
-                        "text": transcription_text,
-                        "raw_audio_path": raw_audio_url
-                    })
-                    transcription_id = transcription['id']
-
-                    # Construct user prompt using retrieved system prompt and other context.
-                    user_prompt = DEFAULT_SYSTEM_PROMPT.format(
-                        INSTRUCTIONS=persistent_state.get("instructions", ""),
-                        CONTEXT=persistent_state.get("context", ""),
-                        USER_MESSAGE=transcription_text
-                    )
-
-                    # 2. Generate and stream (with human-in-loop handling)
-                    if active_tasks[stream_sid]["active_generation_task"]:
-                        active_tasks[stream_sid]["active_generation_task"].cancel()  # Cancel any previous task
-
-                    human_in_loop = call_state[stream_sid]["human_in_loop"]
-                    active_tasks[stream_sid]["active_generation_task"] = asyncio.create_task(
-                        generate_text_stream(user_prompt, groq_client, elevenlabs_client,
-                                            supabase_client, websocket, stream_sid,
-                                            transcription_id, redis_client, human_in_loop)
-                    )
+                # 1. Stream speech to the transcription session as it is detected
+                detector = current_state["utterance_detector"]
+                session = current_state["transcription_session"]
+                utterance_audio = detector.push(base64.b64decode(audio_payload))
+                if utterance_audio is not None:
+                    session.push(utterance_audio[current_state["transcribed_bytes"]:])
+                    # The endpointer waited out the trailing silence; the caller stopped talking before it
+                    session.end_utterance(time.monotonic() - detector.trailing_silence_ms / 1000)
+                    current_state["transcribed_bytes"] = 0
+                    current_state["barged_in"] = False
+                elif detector.in_speech:
+                    session.push(bytes(detector.buffer[current_state["transcribed_bytes"]:]))
+                    current_state["transcribed_bytes"] = len(detector.buffer)
+
+                    # Barge-in: the caller is talking over the assistant, so stop it right away
+                    pipeline = current_state["speech_pipeline"]
+                    if (settings.BARGE_IN_ENABLED and not current_state["barged_in"] and pipeline.is_speaking
+                            and detector.speech_ms >= settings.BARGE_IN_MIN_SPEECH_MS):
+                        current_state["barged_in"] = True
+                        generation_task = active_tasks[stream_sid]["active_generation_task"]
+                        if generation_task:
+                            generation_task.cancel()  # Closes the upstream Groq stream
+                        current_state["approvals"].cancel_pending()
+                        await pipeline.barge_in()  # Clears Twilio's buffer and cancels ElevenLabs streams
+                        logger.info(f"Caller barged in on stream {stream_sid}")
+
+            elif event_type == "mark":
+                # Twilio has finished playing everything up to this mark
+                if stream_sid in call_state:
+                    call_state[stream_sid]["speech_pipeline"].on_mark(data["mark"]["name"])
 
             elif event_type == "stop":
                 logger.info(f"Stream stopped: {stream_sid}")
@@ -265,20 +535,20 @@ async def media_stream(
                 if current_state:
                     call_db_id_str = persistent_state.get("call_db_id")
                     if not call_db_id_str:
-                        logger.error(f"call_db_id not found in Redis for stream {stream_sid}")
+                        logger.error(f"call_db_id not found in Redis for call {call_sid}")
                     else:
 						#Update call
                         call_db_id = int(call_db_id_str)
                         now = datetime.utcnow().isoformat()
-                        await supabase_client.update("calls", {"status": "completed", "end_time": now}, "id", call_db_id)
+                        turn_timings = [timer.spans() for timer in current_state["turn_timers"]]  # Milliseconds per span
+                        persistence.update("calls", {"status": "completed", "end_time": now,
+                                                     "turn_timings": turn_timings}, "id", call_db_id)
                 break
 
             elif event_type == "toggle_human_in_loop":
                 # Toggle the human-in-the-loop flag
                 if stream_sid in call_state:
-                    call_state[stream_sid]["human_in_loop"] = not call_state[stream_sid]["human_in_loop"]
-                    await redis_client.hset(f"call_state:{stream_sid}", {"human_in_loop": str(call_state[stream_sid]["human_in_loop"]).lower()})
-                    logger.info(f"Human-in-the-loop toggled to: {call_state[stream_sid]['human_in_loop']} for stream {stream_sid}")
+                    await handle_command({"command": "toggle_human_in_loop"})
                 else:
                     logger.warning(f"Could not toggle human-in-the-loop. No active state for stream {stream_sid}")
 
@@ -289,29 +559,201 @@ async def media_stream(
         await websocket.send_json({"event": "error", "message": "An unexpected error occurred in the media stream."}) # Notify User
 
     finally:
+        if call_sid:
+            control.unregister(call_sid)
+
         if stream_sid in active_tasks:
             if active_tasks[stream_sid]["active_generation_task"]:
                 active_tasks[stream_sid]["active_generation_task"].cancel()
+            active_tasks[stream_sid]["transcription_task"].cancel()
             del active_tasks[stream_sid]  # Clean up
 
         if stream_sid in call_state:
+            call_state[stream_sid]["approvals"].cancel_pending()
+            await call_state[stream_sid]["transcription_session"].aclose()
+            await call_state[stream_sid]["speech_pipeline"].aclose()
             del call_state[stream_sid]  # Clean up
+            redis_client.forget_call_state(call_sid)
+            memory.end_call(call_sid)  # Extract whatever the last batch didn't cover
 
         await websocket.close()
 
+@router.post("/calls/{call_sid}/control")
+async def call_control(
+    call_sid: str,
+    request: Request,
+    redis_client: RedisManager = Depends(get_redis_client),
+    control: ControlPlane = Depends(get_control_plane)
+):
+    """Sends a control command (toggle_human_in_loop, override, hangup, inject_speech)
+    to a live call, whichever worker is serving its media stream."""
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Expected a JSON body")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Expected a JSON object")
+    command = body.get("command")
+    if command not in COMMANDS:
+        raise HTTPException(status_code=400, detail=f"Unknown command: {command}")
+    args = command_args(command, body)
+    if command in ("override", "inject_speech") and not str(args.get("text", "")).strip():
+        raise HTTPException(status_code=400, detail=f"{command} requires text")
+    if args.get("enabled") is not None and not isinstance(args["enabled"], bool):
+        raise HTTPException(status_code=400, detail="enabled must be a boolean")
+    if not await redis_client.get_call_state(call_sid):
+        raise HTTPException(status_code=404, detail="Call not found")
+    try:
+        await send_call_command(call_sid, command, args, redis_client, control)
+    except Exception as e:
+        logger.error(f"Error sending {command} to call {call_sid}: {e}")
+        raise HTTPException(status_code=500, detail="Error sending call command")
+    return {"call_sid": call_sid, "command": command, "status": "sent"}
+
+async def send_call_command(call_sid: str, command: str, args: dict, redis_client: RedisManager,
+                            control: ControlPlane) -> dict:
+    """Sends a command to a live call; returns the arguments sent.
+
+    A human-in-the-loop toggle is saved in the call state first, so it holds
+    even when no worker serves the stream yet (or any more).
+    """
+    if command == "toggle_human_in_loop":
+        enabled = args.get("enabled")
+        if enabled is None:
+            enabled = (await redis_client.get_call_state(call_sid)).get("human_in_loop") != "true"
+        args = {"enabled": bool(enabled)}
+        await redis_client.update_call_state(call_sid, {"human_in_loop": str(bool(enabled)).lower()})
+    await control.send(call_sid, command, **args)
+    return args
+
+def forward_transcripts(websocket: WebSocket, call_sid: str, control: ControlPlane) -> asyncio.Task:
+    """Starts relaying a call's live transcript events to a supervisor socket."""
+    async def forward():
+        try:
+            async for event in control.transcripts(call_sid):
+                await websocket.send_json(event)
+        except Exception as e:
+            logger.error(f"Transcript feed error for call {call_sid}: {e}")
+
+    return asyncio.create_task(forward())
+
+@router.websocket("/calls/{call_sid}/transcript")
+async def call_transcript(websocket: WebSocket, call_sid: str, control: ControlPlane = Depends(get_control_plane)):
+    """Live transcript feed of a call for supervisors, from whichever worker serves it."""
+    await websocket.accept()
+    forward_task = forward_transcripts(websocket, call_sid, control)
+    try:
+        while True:
+            await websocket.receive_text()  # Nothing to read; this is how a disconnect is noticed
+    except WebSocketDisconnect:
+        pass
+    finally:
+        forward_task.cancel()
+        await asyncio.gather(forward_task, return_exceptions=True)
+
+@router.websocket("/calls/{call_sid}/supervisor")
+async def call_supervisor(
+    websocket: WebSocket,
+    call_sid: str,
+    redis_client: RedisManager = Depends(get_redis_client),
+    control: ControlPlane = Depends(get_control_plane)
+):
+    """Supervisor console for a call: the live transcript and sentence drafts go out;
+    decisions ({"event": "approve" | "edit" | "reject", "draft_id", "text"}) and
+    call commands ({"event": <command>, ...}) come in. Nothing here blocks the call."""
+    await websocket.accept()
+    forward_task = forward_transcripts(websocket, call_sid, control)
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                await websocket.send_json({"event": "error", "message": "Invalid JSON."})
+                continue
+            if not isinstance(message, dict):
+                await websocket.send_json({"event": "error", "message": "Expected a JSON object."})
+                continue
+            event = message.get("event")
+            try:
+                if event in ACTIONS:
+                    await control.send(call_sid, "decide", **command_args("decide", {**message, "action": event}))
+                elif event in COMMANDS and event != "decide":
+                    await send_call_command(call_sid, event, command_args(event, message), redis_client, control)
+                else:
+                    await websocket.send_json({"event": "error", "message": f"Unknown event: {event}"})
+            except Exception as e:
+                logger.error(f"Error relaying supervisor {event} for call {call_sid}: {e}")
+                await websocket.send_json({"event": "error", "message": f"Could not send {event}."})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        forward_task.cancel()
+        await asyncio.gather(forward_task, return_exceptions=True)
+
+@router.get("/startup")
+async def startup_report(request: Request):
+    """Time each subsystem took to start, including background warm-up."""
+    return request.app.state.startup_report.as_dict()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Turn latency histograms and queue gauges in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/response-cache/metrics")
+async def response_cache_metrics():
+    """Response cache lookups, hits and hit rate per call script (this worker)."""
+    return ResponseCache.stats()
+
+@router.post("/tts-cache/phrases")
+async def prerender_phrases(
+    request: Request,
+    elevenlabs_client: ElevenLabsClient = Depends(get_elevenlabs_client)
+):
+    """Pre-renders fixed phrases into the TTS cache. Body: ``{"phrases": [...]}``."""
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Expected a JSON body")
+    phrases = payload.get("phrases") if isinstance(payload, dict) else None
+    if not isinstance(phrases, list) or not all(isinstance(phrase, str) for phrase in phrases):
+        raise HTTPException(status_code=400, detail="phrases must be a list of strings")
+    if elevenlabs_client.cache is None:
+        raise HTTPException(status_code=503, detail="TTS cache unavailable")
+    return await prerender(elevenlabs_client, request.app.state.http_client, phrases)
+
+@router.get("/tts-cache/metrics")
+async def tts_cache_metrics(elevenlabs_client: ElevenLabsClient = Depends(get_elevenlabs_client)):
+    """TTS cache lookups by tier and memory tier usage (this worker)."""
+    if elevenlabs_client.cache is None:
+        raise HTTPException(status_code=503, detail="TTS cache unavailable")
+    return elevenlabs_client.cache.stats()
+
+@router.get("/memory/metrics")
+async def memory_metrics(memory: MemoryIngestionWorker = Depends(get_memory_worker)):
+    """Queue depth, lag and throughput of background memory extraction."""
+    return memory.metrics()
+
 # New route to toggle human-in-the-loop (accessed via HTTP, not WebSocket)
 @router.post("/toggle-human-in-loop/{call_sid}")
-async def toggle_human_in_loop_http(call_sid: str, redis_client: RedisManager = Depends(get_redis_client)):
+async def toggle_human_in_loop_http(
+    call_sid: str,
+    redis_client: RedisManager = Depends(get_redis_client),
+    control: ControlPlane = Depends(get_control_plane)
+):
     """Toggles human-in-the-loop via an HTTP request."""
     try:
-        call_state = await redis_client.hgetall(f"call_state:{call_sid}")
+        call_state = await redis_client.get_call_state(call_sid)
         if not call_state:
             raise HTTPException(status_code=404, detail="Call not found")
 
         current_state = call_state.get("human_in_loop", "false") == "true"
         new_state = not current_state
-        await redis_client.hset(f"call_state:{call_sid}", {"human_in_loop": str(new_state).lower()})
+        # Saved for the call, then applied by the worker serving it, which also tells its supervisors
+        await send_call_command(call_sid, "toggle_human_in_loop", {"enabled": new_state}, redis_client, control)
         return {"call_sid": call_sid, "human_in_loop": new_state}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error toggling human-in-loop for {call_sid}: {e}")
-        raise HTTPException(status_code=500, detail="Error toggling human-in-the-loop")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Error toggling human-in-the-loop")
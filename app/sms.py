@@ -0,0 +1,213 @@
+# app/sms.py
+import asyncio
+import json
+import time
+from typing import Optional
+from app.config import settings
+from app.conversation import Conversation, build_static_prefix
+from app.persistence import PersistenceWorker
+from app.prompts import SMS_SYSTEM_PROMPT
+from app.redis_manager import RedisManager
+from app.logger import logger
+
+EMPTY_TWIML = '<?xml version="1.0" encoding="UTF-8"?><Response></Response>'
+
+_SEEN_KEY = "sms_seen:{message_sid}"
+_PENDING_KEY = "sms_pending:{number}"  # Inbound messages not answered yet
+_FIRST_KEY = "sms_first:{number}"  # When the oldest of them arrived
+_LOCK_KEY = "sms_lock:{number}"  # Held while a reply to the number is being generated
+_THREAD_KEY = "sms_thread:{number}"
+_DUE = "sms_due"  # Sorted set: number -> when its pending messages should be answered
+
+
+class SmsReplyWorker:
+    """Answers inbound SMS off the webhook path.
+
+    The webhook only calls ``receive``. That drops Twilio retries of a
+    MessageSid already seen, queues the row for Supabase, and adds the
+    message to the sender's pending list in Redis. The sender is then
+    scheduled for a reply ``coalesce_window`` after their latest message,
+    but no later than ``coalesce_max_wait`` after the first unanswered one.
+    A burst of texts therefore gets a single model call.
+
+    Reply workers on every process poll the schedule. A number is claimed
+    atomically, and a per-number lock keeps replies to one thread in order.
+    Each reply continues the number's SMS thread, which is kept as a
+    budgeted ``Conversation``. If a reply fails, its messages go back on the
+    pending list and are retried with exponential backoff.
+    """
+
+    def __init__(self, google_client_factory, twilio_client_factory, persistence: PersistenceWorker,
+                 workers: int = settings.SMS_REPLY_WORKERS,
+                 coalesce_window_ms: int = settings.SMS_COALESCE_WINDOW_MS,
+                 coalesce_max_wait_ms: int = settings.SMS_COALESCE_MAX_WAIT_MS,
+                 poll_interval_ms: int = settings.SMS_POLL_INTERVAL_MS):
+        self.google_client_factory = google_client_factory  # Provider clients are built lazily (see ClientRegistry)
+        self.twilio_client_factory = twilio_client_factory
+        self.persistence = persistence
+        self.workers = max(workers, 1)
+        self.coalesce_window = coalesce_window_ms / 1000
+        self.coalesce_max_wait = coalesce_max_wait_ms / 1000
+        self.poll_interval = poll_interval_ms / 1000
+        self.static_prefix = build_static_prefix(SMS_SYSTEM_PROMPT, "", "")
+        self.replies = 0
+        self.duplicates = 0
+        self.failures = 0
+        self._slots = asyncio.Semaphore(self.workers)
+        self._replying = set()  # Running reply tasks
+        self._poller: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._poller is None:
+            self._poller = asyncio.create_task(self._poll())
+            logger.info(f"SMS reply worker started ({self.workers} concurrent replies).")
+
+    async def close(self):
+        if self._poller is None:
+            return
+        self._poller.cancel()
+        await asyncio.gather(self._poller, return_exceptions=True)
+        await asyncio.gather(*self._replying, return_exceptions=True)  # Let claimed threads finish
+        self._poller = None
+        logger.info("SMS reply worker stopped.")
+
+    async def receive(self, message_sid: str, from_number: str, to_number: str, body: str) -> bool:
+        """Records and schedules an inbound SMS; False if the MessageSid was already handled."""
+        client = RedisManager.get_client()
+        if not await client.set(_SEEN_KEY.format(message_sid=message_sid), "1", nx=True,
+                                ex=settings.SMS_IDEMPOTENCY_TTL_S):
+            self.duplicates += 1
+            return False
+        try:
+            self.persistence.insert("sms_messages", {
+                "twilio_sid": message_sid,
+                "from_number": from_number,
+                "to_number": to_number,
+                "body": body,
+                "direction": "inbound"
+            })
+            pending, first = _PENDING_KEY.format(number=from_number), _FIRST_KEY.format(number=from_number)
+            now = time.time()
+            async with RedisManager.pipeline() as pipe:
+                results = await (pipe.rpush(pending, json.dumps({"sid": message_sid, "to": to_number, "body": body}))
+                                 .expire(pending, settings.SMS_IDEMPOTENCY_TTL_S)
+                                 .set(first, str(now), nx=True, ex=settings.SMS_IDEMPOTENCY_TTL_S)
+                                 .get(first)
+                                 .execute())
+            due = min(now + self.coalesce_window, float(results[-1] or now) + self.coalesce_max_wait)
+            await client.zadd(_DUE, {from_number: due})
+        except Exception:
+            await client.delete(_SEEN_KEY.format(message_sid=message_sid))  # Let Twilio's retry through
+            raise
+        return True
+
+    async def record_outbound(self, to_number: str, body: str):
+        """Adds an SMS we sent (e.g. from the UI) to the thread, so replies to it have context."""
+        await self._thread(to_number).add("assistant", body)
+
+    def _thread(self, number: str) -> Conversation:
+        return Conversation(f"sms:{number}", self.static_prefix, max_turns=settings.SMS_THREAD_MAX_TURNS,
+                            key=_THREAD_KEY.format(number=number), ttl=settings.SMS_THREAD_TTL_S)
+
+    async def _poll(self):
+        client = RedisManager.get_client()
+        while True:
+            try:
+                await self._slots.acquire()
+                number = await self._claim(client)
+                if number is None:
+                    self._slots.release()
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                task = asyncio.create_task(self._reply(client, number))
+                self._replying.add(task)
+                task.add_done_callback(self._replying.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._slots.release()
+                logger.error(f"SMS reply poller error: {e}")
+                await asyncio.sleep(1)
+
+    async def _claim(self, client) -> Optional[str]:
+        """Takes one number whose reply is due (and whose thread isn't busy)."""
+        for number in await client.zrangebyscore(_DUE, 0, time.time(), start=0, num=self.workers):
+            if not await client.zrem(_DUE, number):
+                continue  # Another worker got it first
+            if await client.set(_LOCK_KEY.format(number=number), "1", nx=True, ex=settings.SMS_REPLY_LOCK_TTL_S):
+                return number
+            await client.zadd(_DUE, {number: time.time() + self.coalesce_window})  # Its previous reply is still going
+        return None
+
+    async def _reply(self, client, number: str):
+        messages = []
+        try:
+            async with RedisManager.pipeline() as pipe:
+                raw, _, _ = await (pipe.lrange(_PENDING_KEY.format(number=number), 0, -1)
+                                   .delete(_PENDING_KEY.format(number=number))
+                                   .delete(_FIRST_KEY.format(number=number))
+                                   .execute())
+            messages = [json.loads(item) for item in raw]
+            if not messages:
+                return  # Already answered along with an earlier burst
+            await self._answer(number, messages)
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Error replying to SMS from {number}: {e}")
+            if messages:
+                await self._requeue(client, number, messages)
+        finally:
+            await client.delete(_LOCK_KEY.format(number=number))
+            self._slots.release()
+
+    async def _requeue(self, client, number: str, messages: list):
+        """Puts unanswered messages back ahead of newer ones and retries after a backoff."""
+        retry = [dict(message, attempts=message.get("attempts", 0) + 1) for message in messages]
+        dropped = [message["sid"] for message in retry if message["attempts"] >= settings.SMS_REPLY_MAX_ATTEMPTS]
+        if dropped:
+            logger.error(f"Giving up on SMS from {number} after {settings.SMS_REPLY_MAX_ATTEMPTS} attempts: {dropped}")
+        retry = [message for message in retry if message["attempts"] < settings.SMS_REPLY_MAX_ATTEMPTS]
+        if not retry:
+            return
+        pending = _PENDING_KEY.format(number=number)
+        attempts = max(message["attempts"] for message in retry)
+        try:
+            async with RedisManager.pipeline() as pipe:
+                await (pipe.lpush(pending, *(json.dumps(message) for message in reversed(retry)))
+                       .expire(pending, settings.SMS_IDEMPOTENCY_TTL_S)
+                       .set(_FIRST_KEY.format(number=number), str(time.time()), nx=True,
+                            ex=settings.SMS_IDEMPOTENCY_TTL_S)
+                       .zadd(_DUE, {number: time.time() + settings.SMS_REPLY_RETRY_DELAY_S * 2 ** (attempts - 1)})
+                       .execute())
+        except Exception as e:
+            logger.error(f"Could not requeue SMS from {number} {[message['sid'] for message in retry]}: {e}")
+
+    async def _answer(self, number: str, messages: list):
+        user_message = "\n".join(message["body"] for message in messages)
+        thread = self._thread(number)
+        await thread.load()
+        google_client, twilio_client = self.google_client_factory(), self.twilio_client_factory()
+        if google_client is None or twilio_client is None:
+            raise RuntimeError("Google or Twilio client unavailable")
+        ai_response = await google_client.generate_text(thread.build_messages(user_message))
+        if not ai_response:
+            raise RuntimeError("Empty model response")
+        reply = await twilio_client.send_sms(number, ai_response)
+        self.replies += 1
+        await thread.add("user", user_message)  # Only once sent; a retry starts from the same thread
+        await thread.add("assistant", ai_response)
+        for message in messages:
+            self.persistence.update("sms_messages", {"response_text": ai_response}, "twilio_sid", message["sid"])
+        self.persistence.insert("sms_messages", {
+            "twilio_sid": reply.sid,
+            "from_number": messages[-1]["to"],
+            "to_number": number,
+            "body": ai_response,
+            "direction": "outbound"
+        })
+        logger.info(f"Sent SMS reply to {number} for {len(messages)} message(s): {ai_response}")
+
+    async def metrics(self) -> dict:
+        client = RedisManager.get_client()
+        return {"scheduled": await client.zcard(_DUE), "replying": len(self._replying), "replies": self.replies,
+                "duplicates_skipped": self.duplicates, "failures": self.failures}
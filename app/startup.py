@@ -0,0 +1,41 @@
+# app/startup.py
+import time
+from contextlib import contextmanager
+from app.logger import logger
+
+
+class StartupReport:
+    """Wall time spent bringing up each subsystem, in the order they started.
+
+    Synchronous startup steps are logged together once ``lifespan`` is ready;
+    background warm-up steps are added as they finish.
+    """
+
+    def __init__(self):
+        self.timings = {}  # Subsystem -> seconds
+        self.failures = {}  # Subsystem -> error message
+
+    def record(self, name: str, seconds: float, error: Exception = None):
+        self.timings[name] = seconds
+        if error is not None:
+            self.failures[name] = str(error)
+
+    @contextmanager
+    def measure(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.record(name, time.perf_counter() - start, e)
+            raise
+        self.record(name, time.perf_counter() - start)
+
+    def log(self, title: str, names=None):
+        names = list(self.timings) if names is None else names
+        parts = [f"{name} {self.timings[name] * 1000:.0f} ms" + (" (failed)" if name in self.failures else "")
+                 for name in names if name in self.timings]
+        logger.info(f"{title}: {', '.join(parts)}")
+
+    def as_dict(self) -> dict:
+        return {"timings_ms": {name: round(seconds * 1000, 1) for name, seconds in self.timings.items()},
+                "failures": self.failures}
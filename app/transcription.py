@@ -1,30 +1,177 @@
 # app/transcription.py
-import base64
+import asyncio
+import json
+import time
+import uuid
 import httpx
-import io
-from pydub import AudioSegment  # Ensure pydub is installed
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+from app.codec import ulaw_decode, write_wav_header, WAV_HEADER_SIZE
 from app.config import settings
 from app.logger import logger
 
-async def transcribe_audio_streaming(audio_payload: str, http_client: httpx.AsyncClient) -> str:
-    """Converts u-law audio to PCM WAV and transcribes using Whisper."""
-    try:
-        ulaw_audio_bytes = base64.b64decode(audio_payload)
-        # Pydub can read u-law directly.  No need to specify format="ulaw".
-        audio = AudioSegment.from_file(io.BytesIO(ulaw_audio_bytes), format="mulaw")
-        audio = audio.set_frame_rate(8000).set_channels(1).set_sample_width(2)  # Ensure correct format
-        pcm_data = io.BytesIO()
-        audio.export(pcm_data, format="wav")
-        pcm_data.seek(0)  # Rewind
-
-        async with http_client as client:  # Use the provided client
-            response = await client.post(settings.WHISPER_API_URL, files={"file": ("audio.wav", pcm_data, "audio/wav")})
-            response.raise_for_status()  # Raise HTTP errors
-            return response.json().get("text", "").strip()
-
-    except httpx.HTTPError as e:
-        logger.error(f"Whisper API error: {e}")
-        return ""  # Return empty string on error
-    except Exception as e:
-        logger.error(f"Transcription error: {e}")
-        return ""  # Return empty string on error
\ No newline at end of file
+# Streaming WAV: the final length isn't known when the upload starts
+_UNKNOWN_DATA_SIZE = 0xFFFFFFFF - 36
+
+
+@dataclass
+class Transcript:
+    """A transcription hypothesis for one utterance."""
+    text: str
+    is_final: bool
+    audio: bytes = b""  # u-law audio of the utterance (finals only)
+    speech_ended_at: Optional[float] = None  # Monotonic time the caller stopped speaking (finals only)
+
+
+class TranscriptionBackend:
+    """Turns the audio of one utterance into partial and final hypotheses."""
+
+    async def transcribe(self, audio: AsyncIterator[bytes]) -> AsyncIterator[Transcript]:
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+
+class HttpWhisperBackend(TranscriptionBackend):
+    """Uploads audio to the Whisper endpoint as it arrives (chunked multipart).
+
+    Uses the shared, pooled http client so no connection is set up per
+    utterance. If the server answers with server-sent events (``stream=true``)
+    each segment is surfaced as a partial hypothesis.
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient, url: str = settings.WHISPER_API_URL,
+                 stream_response: bool = settings.WHISPER_STREAM_RESPONSE):
+        self.http_client = http_client
+        self.url = url
+        self.stream_response = stream_response
+
+    async def _multipart_body(self, boundary: str, audio: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        if self.stream_response:
+            yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"stream\"\r\n\r\n"
+                   f"true\r\n").encode()
+        yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"audio.wav\"\r\n"
+               f"Content-Type: audio/wav\r\n\r\n").encode()
+        header = bytearray(WAV_HEADER_SIZE)
+        write_wav_header(header, _UNKNOWN_DATA_SIZE)
+        yield bytes(header)
+        async for chunk in audio:
+            yield ulaw_decode(chunk).tobytes()
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    async def transcribe(self, audio: AsyncIterator[bytes]) -> AsyncIterator[Transcript]:
+        boundary = uuid.uuid4().hex
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        async with self.http_client.stream("POST", self.url, headers=headers,
+                                           content=self._multipart_body(boundary, audio)) as response:
+            response.raise_for_status()
+            if not response.headers.get("content-type", "").startswith("text/event-stream"):
+                body = json.loads(await response.aread())
+                yield Transcript(body.get("text", "").strip(), is_final=True)
+                return
+
+            segments = []
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    text = json.loads(data).get("text", "")
+                except (ValueError, AttributeError):
+                    text = data
+                if text.strip():
+                    segments.append(text.strip())
+                    yield Transcript(" ".join(segments), is_final=False)
+            yield Transcript(" ".join(segments), is_final=True)
+
+
+def create_transcription_backend(http_client: httpx.AsyncClient) -> TranscriptionBackend:
+    """Builds the backend selected by ``settings.TRANSCRIPTION_BACKEND``."""
+    if settings.TRANSCRIPTION_BACKEND == "http":
+        return HttpWhisperBackend(http_client)
+    raise ValueError(f"Unknown transcription backend: {settings.TRANSCRIPTION_BACKEND}")
+
+
+class TranscriptionSession:
+    """Long-lived transcription session for one media stream.
+
+    Audio is pushed incrementally while the caller speaks; each utterance is
+    streamed to the backend as it is captured and the resulting hypotheses are
+    delivered, in utterance order, by iterating the session.
+    """
+
+    def __init__(self, stream_sid: str, backend: TranscriptionBackend):
+        self.stream_sid = stream_sid
+        self.backend = backend
+        self._results: asyncio.Queue = asyncio.Queue()
+        self._audio: Optional[asyncio.Queue] = None  # Chunks of the utterance being uploaded
+        self._tasks = []
+        self._closed = False
+
+    def push(self, ulaw_audio: bytes):
+        """Adds audio to the current utterance, starting one if needed."""
+        if self._closed or not ulaw_audio:
+            return
+        if self._audio is None:
+            self._audio = asyncio.Queue()
+            previous = self._tasks[-1] if self._tasks else None
+            task = asyncio.create_task(self._run_utterance(self._audio, previous))
+            self._tasks.append(task)
+            task.add_done_callback(self._tasks.remove)
+        self._audio.put_nowait(ulaw_audio)
+
+    def end_utterance(self, speech_ended_at: Optional[float] = None):
+        """Marks the current utterance complete so the backend can finalize it.
+
+        ``speech_ended_at`` (monotonic; defaults to now) is when the caller
+        actually stopped speaking, i.e. before the endpointer's trailing silence.
+        """
+        if self._audio is not None:
+            self._audio.put_nowait(time.monotonic() if speech_ended_at is None else speech_ended_at)
+            self._audio = None
+
+    async def _run_utterance(self, audio_queue: asyncio.Queue, previous: Optional[asyncio.Task]):
+        utterance_audio = bytearray()
+        speech_ended_at = None
+
+        async def chunks():
+            nonlocal speech_ended_at
+            while isinstance(chunk := await audio_queue.get(), bytes):
+                utterance_audio.extend(chunk)
+                yield chunk
+            speech_ended_at = chunk  # The end-of-utterance marker carries the time
+
+        try:
+            async for transcript in self.backend.transcribe(chunks()):
+                if transcript.is_final:
+                    if previous is not None:
+                        await asyncio.wait([previous])  # Keep finals in utterance order
+                    transcript.audio = bytes(utterance_audio)
+                    transcript.speech_ended_at = speech_ended_at
+                await self._results.put(transcript)
+        except asyncio.CancelledError:
+            raise
+        except httpx.HTTPError as e:
+            logger.error(f"Whisper API error for stream {self.stream_sid}: {e}")
+        except Exception as e:
+            logger.error(f"Transcription error for stream {self.stream_sid}: {e}")
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[Transcript]:
+        while (transcript := await self._results.get()) is not None:
+            yield transcript
+
+    async def aclose(self):
+        """Cancels in-flight uploads and ends iteration."""
+        if self._closed:
+            return
+        self._closed = True
+        self.end_utterance()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._results.put_nowait(None)
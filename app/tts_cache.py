@@ -0,0 +1,222 @@
+# app/tts_cache.py
+import asyncio
+import hashlib
+import mmap
+import os
+import re
+import sys
+import unicodedata
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Iterable, Optional
+from app.config import settings
+from app.metrics import metrics
+from app.logger import logger
+
+_CHUNK_BYTES = 4000  # Half a second of 8 kHz mu-law per chunk handed to the pipeline
+
+TTS_CACHE_LOOKUPS = metrics.counter(
+    "tts_cache_lookups_total", "Segments looked up in the TTS audio cache, by the tier that served them.", ("tier",))
+
+
+def normalize(text: str) -> str:
+    """Text as it's synthesized: NFC, whitespace collapsed. Case and punctuation change prosody, so stay."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+class TtsCache:
+    """Synthesized audio addressed by (voice, model, output format, normalized text).
+
+    Two tiers: a per-process LRU of up to ``memory_bytes``, and files under
+    ``directory`` shared by every worker on the host. Disk hits are streamed
+    from an ``mmap`` of the file, so a phrase is held once in the page cache
+    however many workers play it; once played they're promoted into the
+    memory tier. Files are written atomically (rename), and the disk tier is
+    pruned back under ``disk_max_bytes`` by least recent use (file mtime,
+    refreshed on hits).
+    """
+
+    def __init__(self, directory: str = settings.TTS_CACHE_DIR,
+                 memory_bytes: int = settings.TTS_CACHE_MEMORY_BYTES,
+                 disk_max_bytes: int = settings.TTS_CACHE_DISK_MAX_BYTES,
+                 prune_every: int = settings.TTS_CACHE_PRUNE_EVERY_WRITES):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.prune_every = max(prune_every, 1)
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_used = 0
+        self._writes = 0
+        self._pending = set()  # Disk writes in flight
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(text: str, voice_id: str, model: str, output_format: str) -> str:
+        return hashlib.sha256("\0".join((voice_id, model, output_format, normalize(text))).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.ulaw")
+
+    def get(self, key: str) -> Optional[AsyncIterator[bytes]]:
+        """The cached audio as chunks, or None on a miss."""
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            TTS_CACHE_LOOKUPS.inc(tier="memory")
+            return _chunks(audio)
+        mapped = self._map(key)
+        if mapped is not None:
+            TTS_CACHE_LOOKUPS.inc(tier="disk")
+            return self._mapped_chunks(key, mapped)
+        TTS_CACHE_LOOKUPS.inc(tier="miss")
+        return None
+
+    def contains(self, key: str) -> bool:
+        return key in self._memory or os.path.exists(self._path(key))
+
+    def _map(self, key: str) -> Optional[mmap.mmap]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)  # Stays valid once the file is closed
+            os.utime(path)  # Recently used: survives pruning
+            return mapped
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:  # ValueError: an empty file can't be mapped
+            logger.warning(f"Unreadable TTS cache file {path}: {e}")
+            return None
+
+    async def _mapped_chunks(self, key: str, mapped: mmap.mmap) -> AsyncIterator[bytes]:
+        """Streams a disk hit straight from the page cache, then keeps it in the memory tier."""
+        with mapped:
+            for start in range(0, len(mapped), _CHUNK_BYTES):
+                yield mapped[start:start + _CHUNK_BYTES]
+            self._remember(key, mapped[:])
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_used -= len(previous)
+        self._memory[key] = audio
+        self._memory_used += len(audio)
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted)
+
+    def put(self, key: str, audio: bytes):
+        """Stores fully synthesized audio: in memory now, on disk in the background."""
+        if not audio:
+            return
+        self._remember(key, audio)
+        task = asyncio.create_task(self._persist(key, audio))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _persist(self, key: str, audio: bytes):
+        try:
+            await asyncio.to_thread(self._write, key, audio)
+        except OSError as e:
+            logger.error(f"Could not write TTS cache file for {key}: {e}")
+            return
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            await asyncio.to_thread(self.prune)
+
+    async def flush(self):
+        """Waits for pending disk writes."""
+        await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def _write(self, key: str, audio: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(audio)
+        os.replace(temporary, path)  # Readers in other workers never see a partial file
+
+    def prune(self):
+        """Deletes the least recently used files until the disk tier fits ``disk_max_bytes``."""
+        files, total = [], 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".ulaw"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # Pruned by another worker
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total <= self.disk_max_bytes:
+            return
+        for _, size, path in sorted(files):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.disk_max_bytes * 0.9:  # Some headroom, so this doesn't run on every write
+                break
+        logger.info(f"Pruned TTS cache to {total} bytes")
+
+    def stats(self) -> dict:
+        lookups = {dict(labels)["tier"]: int(value) for labels, value in TTS_CACHE_LOOKUPS.samples().items()}
+        return {"lookups": lookups, "memory_entries": len(self._memory), "memory_bytes": self._memory_used}
+
+
+async def _chunks(audio: bytes) -> AsyncIterator[bytes]:
+    for start in range(0, len(audio), _CHUNK_BYTES):
+        yield audio[start:start + _CHUNK_BYTES]
+
+
+async def prerender(elevenlabs_client, http_client, phrases: Iterable[str],
+                    concurrency: int = settings.TTS_PRERENDER_CONCURRENCY) -> dict:
+    """Synthesizes each phrase not cached yet, so calls never wait on it.
+
+    Returns how many phrases were rendered, already cached, or failed.
+    """
+    cache = elevenlabs_client.cache
+    if cache is None:
+        raise RuntimeError("The TTS cache is disabled (TTS_CACHE_ENABLED)")
+    result = {"rendered": 0, "cached": 0, "failed": 0}
+    slots = asyncio.Semaphore(max(concurrency, 1))
+
+    async def render(phrase: str):
+        if cache.contains(elevenlabs_client.cache_key(phrase)):
+            result["cached"] += 1
+            return
+        async with slots:
+            try:
+                async for _ in elevenlabs_client.stream_tts(phrase, http_client=http_client):
+                    pass  # Stored by stream_tts once complete
+                result["rendered"] += 1
+            except Exception as e:
+                result["failed"] += 1
+                logger.error(f"Could not pre-render phrase {phrase!r}: {e}")
+
+    await asyncio.gather(*(render(phrase) for phrase in {normalize(phrase) for phrase in phrases} if phrase))
+    await cache.flush()  # On disk, for every worker
+    return result
+
+
+def load_phrases(path: str) -> list:
+    """A phrase library file: one phrase per line; blank lines and # comments are skipped."""
+    with open(path, encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip() and not line.lstrip().startswith("#")]
+
+
+async def _main(path: str):
+    import httpx
+    from app.clients import ElevenLabsClient
+    async with httpx.AsyncClient(timeout=httpx.Timeout(settings.HTTP_TIMEOUT_S)) as http_client:
+        result = await prerender(ElevenLabsClient(), http_client, load_phrases(path))
+    print(result)
+
+
+if __name__ == "__main__":
+    # Deploy-time pre-rendering into the shared disk tier: python -m app.tts_cache phrases.txt
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else settings.TTS_PHRASE_LIBRARY))
@@ -1,6 +1,8 @@
 # app/utils.py
+from app.config import settings
 from app.logger import logger
 import re
+import time
 
 def split_into_sentences(text: str) -> dict:
     """Splits text into sentences, handling common abbreviations."""
@@ -13,4 +15,81 @@ def split_into_sentences(text: str) -> dict:
         complete_sentences = sentences[:-1]  # All except last
         remainder = sentences[-1]  # Last one might be incomplete
 
-    return {"complete": complete_sentences, "remainder": remainder}
\ No newline at end of file
+    return {"complete": complete_sentences, "remainder": remainder}
+
+_SENTENCE_BOUNDARY = re.compile(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<![A-Z]\.)(?<=\.|\?|\!)\s')
+_CLAUSE_BOUNDARY = re.compile(r'(?<=[,;:—])\s|(?<=--)\s')
+
+
+class SentenceAggregator:
+    """Incrementally segments an LLM token stream for TTS.
+
+    Deltas are buffered and released only at sentence boundaries, at clause
+    boundaries once a segment is long enough, or when text has been waiting
+    longer than ``max_wait_ms``. The first segment of a reply uses a smaller
+    threshold so audio can start sooner.
+    """
+
+    def __init__(self, first_segment_min_chars: int = settings.TTS_FIRST_SEGMENT_MIN_CHARS,
+                 segment_min_chars: int = settings.TTS_SEGMENT_MIN_CHARS,
+                 clause_min_chars: int = settings.TTS_CLAUSE_MIN_CHARS,
+                 max_wait_ms: int = settings.TTS_SEGMENT_MAX_WAIT_MS):
+        self.first_segment_min_chars = first_segment_min_chars
+        self.segment_min_chars = segment_min_chars
+        self.clause_min_chars = clause_min_chars
+        self.max_wait_ms = max_wait_ms
+        self.buffer = ""
+        self.segments_emitted = 0
+        self._buffer_started = None  # Monotonic time the oldest buffered text arrived
+
+    def push(self, delta: str, now: float = None) -> list:
+        """Adds a delta and returns any segments that are ready for TTS."""
+        now = time.monotonic() if now is None else now
+        if delta and not self.buffer:
+            self._buffer_started = now
+        self.buffer += delta
+
+        segments = []
+        while (cut := self._next_cut(now)) is not None:
+            segment, self.buffer = self.buffer[:cut].strip(), self.buffer[cut:].lstrip()
+            self._buffer_started = now if self.buffer else None
+            if segment:
+                segments.append(segment)
+                self.segments_emitted += 1
+        return segments
+
+    def flush(self) -> list:
+        """Returns whatever is left once the token stream has ended."""
+        segment, self.buffer, self._buffer_started = self.buffer.strip(), "", None
+        if not segment:
+            return []
+        self.segments_emitted += 1
+        return [segment]
+
+    def time_left(self, now: float = None):
+        """Seconds until buffered text is released by ``max_wait_ms`` even if no delta arrives.
+
+        None when nothing could be released that way (empty buffer, or a
+        single unfinished word). Once it's up, ``push("")`` returns the text.
+        """
+        if self._buffer_started is None or self.buffer.rfind(" ") <= 0:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(self._buffer_started + self.max_wait_ms / 1000 - now, 0)
+
+    def _next_cut(self, now: float):
+        if self.segments_emitted == 0:
+            sentence_min = clause_min = self.first_segment_min_chars
+        else:
+            sentence_min, clause_min = self.segment_min_chars, self.clause_min_chars
+
+        for match in _SENTENCE_BOUNDARY.finditer(self.buffer):
+            if match.start() >= sentence_min:
+                return match.start()
+        for match in _CLAUSE_BOUNDARY.finditer(self.buffer):
+            if match.start() >= clause_min:
+                return match.start()
+        if self._buffer_started is not None and (now - self._buffer_started) * 1000 >= self.max_wait_ms:
+            cut = self.buffer.rfind(" ")  # Never cut inside a word
+            return cut if cut > 0 else None
+        return None
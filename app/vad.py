@@ -0,0 +1,82 @@
+# app/vad.py
+from collections import deque
+from typing import Optional
+from app.codec import SAMPLE_RATE, rms
+from app.config import settings
+
+BYTES_PER_MS = SAMPLE_RATE // 1000  # One mu-law byte per sample
+
+
+class UtteranceDetector:
+    """Energy-based endpointing over inbound Twilio media frames.
+
+    Frames are appended to ``buffer`` from speech onset until enough trailing
+    silence (or the maximum utterance length) is seen, at which point ``push``
+    returns the whole utterance as mu-law bytes.
+    """
+
+    def __init__(self, buffer: Optional[bytearray] = None,
+                 energy_threshold: int = settings.VAD_ENERGY_THRESHOLD,
+                 min_speech_ms: int = settings.VAD_MIN_SPEECH_MS,
+                 silence_ms: int = settings.VAD_SILENCE_MS,
+                 max_utterance_ms: int = settings.VAD_MAX_UTTERANCE_MS,
+                 preroll_ms: int = settings.VAD_PREROLL_MS):
+        self.buffer = buffer if buffer is not None else bytearray()
+        self.energy_threshold = energy_threshold
+        self.min_speech_ms = min_speech_ms
+        self.silence_ms = silence_ms
+        self.max_utterance_ms = max_utterance_ms
+        self.preroll_bytes = preroll_ms * BYTES_PER_MS
+        self.in_speech = False
+        self.speech_ms = 0  # Voiced audio in the current utterance (used for barge-in)
+        self.trailing_silence_ms = 0  # Silence that closed the last utterance (speech ended this long ago)
+        self._pending = deque()  # Frames seen before onset is confirmed (pre-roll)
+        self._pending_bytes = 0
+        self._voiced_ms = 0
+        self._trailing_silence_ms = 0
+
+    def push(self, ulaw_frame: bytes) -> Optional[bytes]:
+        """Feeds one media frame; returns a complete utterance when one ends."""
+        frame_ms = len(ulaw_frame) // BYTES_PER_MS
+        voiced = rms(ulaw_frame) >= self.energy_threshold
+
+        if not self.in_speech:
+            self._pending.append(ulaw_frame)
+            self._pending_bytes += len(ulaw_frame)
+            self._voiced_ms = self._voiced_ms + frame_ms if voiced else 0
+            # Keep the pre-roll window plus the frames of a possible onset
+            while self._pending_bytes > self.preroll_bytes + self._voiced_ms * BYTES_PER_MS:
+                self._pending_bytes -= len(self._pending.popleft())
+            if self._voiced_ms >= self.min_speech_ms:
+                self.in_speech = True
+                self.speech_ms = self._voiced_ms
+                self._trailing_silence_ms = 0
+                for frame in self._pending:
+                    self.buffer.extend(frame)
+                self._pending.clear()
+                self._pending_bytes = 0
+            return None
+
+        self.buffer.extend(ulaw_frame)
+        if voiced:
+            self.speech_ms += frame_ms
+        self._trailing_silence_ms = 0 if voiced else self._trailing_silence_ms + frame_ms
+        if (self._trailing_silence_ms >= self.silence_ms
+                or len(self.buffer) >= self.max_utterance_ms * BYTES_PER_MS):
+            trailing_silence_ms = self._trailing_silence_ms
+            utterance = self.flush()
+            self.trailing_silence_ms = trailing_silence_ms
+            return utterance
+        return None
+
+    def flush(self) -> Optional[bytes]:
+        """Returns any in-progress utterance and resets the detector."""
+        utterance = bytes(self.buffer) if self.in_speech and self.buffer else None
+        self.buffer.clear()
+        self.in_speech = False
+        self.speech_ms = 0
+        self._pending.clear()
+        self._pending_bytes = 0
+        self._voiced_ms = 0
+        self._trailing_silence_ms = 0
+        return utterance
@@ -0,0 +1,575 @@
+# app/vector_store.py
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langgraph.store.base import (
+    BaseStore, GetOp, IndexConfig, Item, ListNamespacesOp, Op, PutOp, Result, SearchItem, SearchOp,
+    ensure_embeddings, get_text_at_path, tokenize_path,
+)
+from app.config import settings
+from app.logger import logger
+
+try:
+    import hnswlib
+except ImportError:  # Exact numpy search is used instead
+    hnswlib = None
+
+_SEP = "\x1f"  # Joins namespace labels in the items table
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    vector BLOB,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS items_expiry ON items (expires_at) WHERE expires_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS items_recency ON items (namespace, updated_at);
+CREATE TABLE IF NOT EXISTS namespace_versions (
+    namespace TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS embeddings (
+    hash TEXT PRIMARY KEY,
+    vector BLOB NOT NULL
+);
+"""
+
+
+def _ns_text(namespace: Tuple[str, ...]) -> str:
+    return _SEP.join(namespace)
+
+
+def _ns_tuple(text: str) -> Tuple[str, ...]:
+    return tuple(text.split(_SEP)) if text else ()
+
+
+def _timestamp(seconds: float) -> datetime:
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+
+class _NamespaceIndex:
+    """Nearest-neighbour index over one namespace's (unit-length) vectors.
+
+    HNSW via hnswlib when installed; otherwise an exact inner-product scan,
+    which is still only a few milliseconds for a single caller's memories.
+    """
+
+    def __init__(self, dims: int):
+        self.dims = dims
+        self.labels: Dict[str, int] = {}
+        self.keys: Dict[int, str] = {}
+        self._next_label = 0
+        if hnswlib is not None:
+            self._hnsw = hnswlib.Index(space="ip", dim=dims)
+            self._hnsw.init_index(max_elements=1024, ef_construction=settings.MEMORY_HNSW_EF_CONSTRUCTION,
+                                  M=settings.MEMORY_HNSW_M, allow_replace_deleted=True)
+        else:
+            self._hnsw = None
+            self._matrix = np.empty((0, dims), dtype=np.float32)
+            self._row_labels: List[int] = []  # Label of each matrix row
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add(self, key: str, vector: np.ndarray):
+        self.remove(key)
+        label = self._next_label
+        self._next_label += 1
+        self.labels[key], self.keys[label] = label, key
+        if self._hnsw is not None:
+            if len(self.labels) > self._hnsw.get_max_elements():
+                self._hnsw.resize_index(self._hnsw.get_max_elements() * 2)
+            self._hnsw.add_items(vector[None, :], [label], replace_deleted=True)
+        else:
+            self._matrix = np.vstack([self._matrix, vector[None, :]])
+            self._row_labels.append(label)
+
+    def add_many(self, keys: List[str], vectors: np.ndarray):
+        """Bulk-loads vectors for keys not yet in the index (one multithreaded insert)."""
+        if not keys:
+            return
+        labels = list(range(self._next_label, self._next_label + len(keys)))
+        self._next_label += len(keys)
+        for key, label in zip(keys, labels):
+            self.labels[key], self.keys[label] = label, key
+        if self._hnsw is not None:
+            if len(self.labels) > self._hnsw.get_max_elements():
+                self._hnsw.resize_index(max(len(self.labels), self._hnsw.get_max_elements() * 2))
+            self._hnsw.add_items(vectors, labels)
+        else:
+            self._matrix = np.vstack([self._matrix, vectors])
+            self._row_labels.extend(labels)
+
+    def remove(self, key: str):
+        label = self.labels.pop(key, None)
+        if label is None:
+            return
+        del self.keys[label]
+        if self._hnsw is not None:
+            self._hnsw.mark_deleted(label)
+        else:
+            row = self._row_labels.index(label)
+            self._matrix = np.delete(self._matrix, row, axis=0)
+            del self._row_labels[row]
+
+    def save(self, base: str, version: int):
+        """Writes an HNSW index and its key map next to the database."""
+        self._hnsw.save_index(f"{base}.bin")
+        with open(f"{base}.json", "w") as f:
+            json.dump({"version": version, "dims": self.dims, "next_label": self._next_label,
+                       "labels": self.labels}, f)
+
+    @classmethod
+    def load(cls, base: str, dims: int, version: int) -> Optional["_NamespaceIndex"]:
+        """Loads a saved HNSW index if it is for this namespace version."""
+        try:
+            with open(f"{base}.json") as f:
+                meta = json.load(f)
+            if meta["version"] != version or meta["dims"] != dims:
+                return None
+            index = cls.__new__(cls)
+            index.dims = dims
+            index.labels = meta["labels"]
+            index.keys = {label: key for key, label in index.labels.items()}
+            index._next_label = meta["next_label"]
+            index._hnsw = hnswlib.Index(space="ip", dim=dims)
+            index._hnsw.load_index(f"{base}.bin", allow_replace_deleted=True)
+            return index
+        except (OSError, ValueError, KeyError, RuntimeError):
+            return None
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        k = min(k, len(self.labels))
+        if k <= 0:
+            return []
+        if self._hnsw is not None:
+            self._hnsw.set_ef(max(settings.MEMORY_HNSW_EF_SEARCH, k))
+            labels, distances = self._hnsw.knn_query(vector[None, :], k=k)
+            return [(self.keys[int(label)], 1.0 - float(distance)) for label, distance in zip(labels[0], distances[0])]
+        scores = self._matrix @ vector
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.keys[self._row_labels[row]], float(scores[row])) for row in top]
+
+
+class _EmbeddingCache:
+    """Content-hash embedding cache: an in-process LRU over a SQLite table."""
+
+    def __init__(self, conn: sqlite3.Connection, model_id: str, size: int):
+        self.conn = conn
+        self.model_id = model_id
+        self.size = size
+        self._lru: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def hash(self, kind: str, text: str) -> str:
+        # Models may embed documents and queries differently, so the kind is part of the key
+        return hashlib.sha256(f"{self.model_id}\0{kind}\0{text}".encode()).hexdigest()
+
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        missing = []
+        for digest in hashes:
+            if digest in self._lru:
+                self._lru.move_to_end(digest)
+                found[digest] = self._lru[digest]
+            else:
+                missing.append(digest)
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE hash IN ({','.join('?' * len(chunk))})", chunk)
+            for digest, blob in rows:
+                found[digest] = self._remember(digest, np.frombuffer(blob, dtype=np.float32))
+        self.hits += len(found)
+        self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, vectors: Dict[str, np.ndarray]):
+        self.conn.executemany("INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)",
+                              [(digest, vector.tobytes()) for digest, vector in vectors.items()])
+        for digest, vector in vectors.items():
+            self._remember(digest, vector)
+
+    def _remember(self, digest: str, vector: np.ndarray) -> np.ndarray:
+        self._lru[digest] = vector
+        self._lru.move_to_end(digest)
+        while len(self._lru) > self.size:
+            self._lru.popitem(last=False)
+        return vector
+
+
+class PersistentVectorStore(BaseStore):
+    """LangGraph store persisted in SQLite with per-namespace ANN search.
+
+    A drop-in for ``InMemoryStore`` that survives restarts and can be shared
+    by the workers of a host (SQLite WAL). Items may expire (``ttl_s``, or a
+    ``PutOp.ttl`` in minutes) and each namespace keeps at most
+    ``max_items_per_namespace``, evicting the least recently updated. Vector
+    indexes are built per namespace on first search, so a search only touches
+    that caller's memories. Every write bumps a per-namespace version, so an
+    index another process has since changed is rebuilt; large HNSW indexes
+    are saved beside the database and reloaded instead of rebuilt. Embeddings are cached by content hash. Each item
+    gets one vector, embedded from its indexed fields joined together.
+    """
+
+    supports_ttl = True
+
+    def __init__(self, path: str = settings.MEMORY_STORE_PATH, *, index: Optional[IndexConfig] = None,
+                 ttl_s: Optional[float] = settings.MEMORY_TTL_S,
+                 max_items_per_namespace: int = settings.MEMORY_MAX_ITEMS_PER_NAMESPACE,
+                 embedding_cache_size: int = settings.MEMORY_EMBEDDING_CACHE_SIZE):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_items_per_namespace = max_items_per_namespace
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._indexes: Dict[str, _NamespaceIndex] = {}
+        self._versions: Dict[str, int] = {}  # Namespace version each index reflects
+        self._saved_versions: Dict[str, int] = {}  # Version of each index's file on disk
+        self._index_dir = f"{path}.hnsw"
+        self._last_sweep = 0.0
+        self.index_config = None
+        self.embeddings = None
+        if index:
+            self.index_config = dict(index)
+            self.embeddings = ensure_embeddings(index["embed"])
+            self.dims = index["dims"]
+            self._fields = [(field, tokenize_path(field)) for field in index.get("fields") or ["$"]]
+            model_id = index["embed"] if isinstance(index["embed"], str) else type(self.embeddings).__name__
+            self.embedding_cache = _EmbeddingCache(self._conn, f"{model_id}:{self.dims}", embedding_cache_size)
+
+    # --- BaseStore interface ---
+
+    def batch(self, ops: Iterable[Op]) -> List[Result]:
+        ops = list(ops)
+        documents, queries = self._texts_to_embed(ops)
+        vectors = self._embed(documents, queries) if documents or queries else {}
+        return self._apply(ops, vectors)
+
+    async def abatch(self, ops: Iterable[Op]) -> List[Result]:
+        ops = list(ops)
+        documents, queries = self._texts_to_embed(ops)
+        vectors = {}
+        if documents or queries:
+            # Cache lookups hit SQLite; keep them (and the writes below) off the event loop
+            missing_documents, missing_queries, vectors = await asyncio.to_thread(
+                self._cached_vectors, documents, queries)
+            fresh = {}
+            if missing_documents:
+                embedded = await self.embeddings.aembed_documents(missing_documents)
+                fresh.update(zip((("doc", text) for text in missing_documents), embedded))
+            for text in missing_queries:
+                fresh[("query", text)] = await self.embeddings.aembed_query(text)
+            vectors.update(await asyncio.to_thread(self._store_vectors, fresh))
+        return await asyncio.to_thread(self._apply, ops, vectors)
+
+    # --- Embedding ---
+
+    def _item_text(self, value: dict, fields: Optional[list]) -> str:
+        paths = self._fields if fields is None else [(field, tokenize_path(field)) for field in fields]
+        texts = []
+        for field, path in paths:
+            texts.extend(get_text_at_path(value, path) if field != "$" else [json.dumps(value, sort_keys=True)])
+        return "\n".join(text for text in texts if text)
+
+    def _texts_to_embed(self, ops: List[Op]) -> Tuple[List[str], List[str]]:
+        if self.embeddings is None:
+            return [], []
+        documents, queries = [], []
+        for op in ops:
+            if isinstance(op, PutOp) and op.value is not None and op.index is not False:
+                text = self._item_text(op.value, op.index if isinstance(op.index, list) else None)
+                if text:
+                    documents.append(text)
+            elif isinstance(op, SearchOp) and op.query:
+                queries.append(op.query)
+        return list(dict.fromkeys(documents)), list(dict.fromkeys(queries))
+
+    def _cached_vectors(self, documents: List[str], queries: List[str]):
+        with self._lock:
+            keys = [("doc", text) for text in documents] + [("query", text) for text in queries]
+            hashes = {key: self.embedding_cache.hash(*key) for key in keys}
+            found = self.embedding_cache.get_many(list(hashes.values()))
+        vectors = {key: found[digest] for key, digest in hashes.items() if digest in found}
+        missing_documents = [text for text in documents if ("doc", text) not in vectors]
+        missing_queries = [text for text in queries if ("query", text) not in vectors]
+        return missing_documents, missing_queries, vectors
+
+    def _store_vectors(self, fresh: Dict[Tuple[str, str], List[float]]) -> Dict[Tuple[str, str], np.ndarray]:
+        vectors = {key: self._normalize(vector) for key, vector in fresh.items()}
+        with self._lock:
+            self.embedding_cache.put_many({self.embedding_cache.hash(*key): vector for key, vector in vectors.items()})
+        return vectors
+
+    def _embed(self, documents: List[str], queries: List[str]) -> Dict[Tuple[str, str], np.ndarray]:
+        missing_documents, missing_queries, vectors = self._cached_vectors(documents, queries)
+        fresh = {}
+        if missing_documents:
+            embedded = self.embeddings.embed_documents(missing_documents)
+            fresh.update(zip((("doc", text) for text in missing_documents), embedded))
+        for text in missing_queries:
+            fresh[("query", text)] = self.embeddings.embed_query(text)
+        vectors.update(self._store_vectors(fresh))
+        return vectors
+
+    def _normalize(self, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)[:self.dims]  # Matryoshka-style models truncate cleanly
+        if vector.shape[0] != self.dims:
+            raise ValueError(f"Embedding has {vector.shape[0]} dimensions; the store expects {self.dims}")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    # --- Storage ---
+
+    def _apply(self, ops: List[Op], vectors: Dict[Tuple[str, str], np.ndarray]) -> List[Result]:
+        with self._lock:
+            now = time.time()
+            if now - self._last_sweep > settings.MEMORY_SWEEP_INTERVAL_S:
+                self.sweep(now)
+            writes = any(isinstance(op, PutOp) for op in ops)
+            self._conn.execute("BEGIN IMMEDIATE" if writes else "BEGIN")
+            try:
+                results = self._apply_ops(ops, vectors, now)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                self._indexes.clear()  # May hold vectors of the rolled-back writes
+                raise
+            self._conn.execute("COMMIT")
+            return results
+
+    def _apply_ops(self, ops: List[Op], vectors: Dict[Tuple[str, str], np.ndarray], now: float) -> List[Result]:
+        results = []
+        written = set()  # Namespaces to check against the size cap once the puts are done
+        for op in ops:
+            if isinstance(op, GetOp):
+                results.append(self._get(op, now))
+            elif isinstance(op, PutOp):
+                self._put(op, vectors, now)
+                written.add(_ns_text(op.namespace))
+                results.append(None)
+            elif isinstance(op, SearchOp):
+                results.append(self._search(op, vectors, now))
+            elif isinstance(op, ListNamespacesOp):
+                results.append(self._list_namespaces(op, now))
+            else:
+                raise ValueError(f"Unknown store operation: {type(op)}")
+        for namespace in written:
+            self._evict(namespace)
+            self._bump(namespace)
+        return results
+
+    def _get(self, op: GetOp, now: float) -> Optional[Item]:
+        row = self._conn.execute(
+            "SELECT key, value, created_at, updated_at FROM items WHERE namespace = ? AND key = ?"
+            " AND (expires_at IS NULL OR expires_at > ?)", (_ns_text(op.namespace), op.key, now)).fetchone()
+        if row is None:
+            return None
+        key, value, created_at, updated_at = row
+        return Item(value=json.loads(value), key=key, namespace=op.namespace,
+                    created_at=_timestamp(created_at), updated_at=_timestamp(updated_at))
+
+    def _put(self, op: PutOp, vectors: Dict[Tuple[str, str], np.ndarray], now: float):
+        namespace = _ns_text(op.namespace)
+        index = self._indexes.get(namespace)
+        if op.value is None:
+            self._conn.execute("DELETE FROM items WHERE namespace = ? AND key = ?", (namespace, op.key))
+            if index is not None:
+                index.remove(op.key)
+            return
+
+        vector = None
+        if self.embeddings is not None and op.index is not False:
+            text = self._item_text(op.value, op.index if isinstance(op.index, list) else None)
+            vector = vectors.get(("doc", text))
+        ttl_minutes = getattr(op, "ttl", None)
+        ttl_s = ttl_minutes * 60 if ttl_minutes is not None else self.ttl_s
+        self._conn.execute(
+            "INSERT INTO items (namespace, key, value, vector, created_at, updated_at, expires_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, vector = excluded.vector,"
+            " updated_at = excluded.updated_at, expires_at = excluded.expires_at",
+            (namespace, op.key, json.dumps(op.value), vector.tobytes() if vector is not None else None,
+             now, now, now + ttl_s if ttl_s else None))
+        if index is not None:
+            if vector is not None:
+                index.add(op.key, vector)
+            else:
+                index.remove(op.key)
+
+    def _evict(self, namespace: str):
+        count = self._conn.execute("SELECT COUNT(*) FROM items WHERE namespace = ?", (namespace,)).fetchone()[0]
+        excess = count - self.max_items_per_namespace
+        if excess <= 0:
+            return
+        keys = [key for (key,) in self._conn.execute(
+            "SELECT key FROM items WHERE namespace = ? ORDER BY updated_at LIMIT ?", (namespace, excess))]
+        self._conn.executemany("DELETE FROM items WHERE namespace = ? AND key = ?", [(namespace, key) for key in keys])
+        index = self._indexes.get(namespace)
+        if index is not None:
+            for key in keys:
+                index.remove(key)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Deletes expired items; returns how many were removed."""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = self._conn.execute(
+                "SELECT namespace, key FROM items WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)).fetchall()
+            self._conn.execute("DELETE FROM items WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            for namespace, key in expired:
+                if namespace in self._indexes:
+                    self._indexes[namespace].remove(key)
+            for namespace in {namespace for namespace, _ in expired}:
+                self._bump(namespace)
+            self._last_sweep = now
+        if expired:
+            logger.info(f"Memory store swept {len(expired)} expired items.")
+        return len(expired)
+
+    def _namespaces(self, prefix: Tuple[str, ...]) -> List[str]:
+        text = _ns_text(prefix)
+        if not prefix:
+            return [ns for (ns,) in self._conn.execute("SELECT DISTINCT namespace FROM items")]
+        return [ns for (ns,) in self._conn.execute(
+            "SELECT DISTINCT namespace FROM items WHERE namespace = ? OR substr(namespace, 1, ?) = ?",
+            (text, len(text) + 1, text + _SEP))]
+
+    def _version(self, namespace: str) -> int:
+        row = self._conn.execute("SELECT version FROM namespace_versions WHERE namespace = ?", (namespace,)).fetchone()
+        return row[0] if row else 0
+
+    def _bump(self, namespace: str):
+        """Records a change to a namespace (inside the writing transaction)."""
+        current = self._version(namespace)
+        if namespace in self._indexes and self._versions.get(namespace) != current:
+            del self._indexes[namespace]  # Another process wrote since it was built; rebuild on next search
+        self._conn.execute(
+            "INSERT INTO namespace_versions (namespace, version) VALUES (?, 1)"
+            " ON CONFLICT (namespace) DO UPDATE SET version = version + 1", (namespace,))
+        if namespace in self._indexes:
+            self._versions[namespace] = current + 1
+
+    def _index_base(self, namespace: str) -> str:
+        return os.path.join(self._index_dir, hashlib.sha1(namespace.encode()).hexdigest())
+
+    def _namespace_index(self, namespace: str, now: float) -> _NamespaceIndex:
+        index = self._indexes.get(namespace)
+        version = self._version(namespace)
+        if index is not None and self._versions.get(namespace) == version:
+            return index
+        index = None
+        if hnswlib is not None:
+            index = _NamespaceIndex.load(self._index_base(namespace), self.dims, version)
+        if index is None:
+            index = _NamespaceIndex(self.dims)
+            rows = self._conn.execute(
+                "SELECT key, vector FROM items WHERE namespace = ? AND vector IS NOT NULL"
+                " AND (expires_at IS NULL OR expires_at > ?)", (namespace, now))
+            keys, blobs = [], []
+            for key, blob in rows:
+                keys.append(key)
+                blobs.append(blob)
+            index.add_many(keys, np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(keys), self.dims))
+            if hnswlib is not None and len(index) >= settings.MEMORY_HNSW_PERSIST_MIN_ITEMS:
+                self._save_index(namespace, index, version)
+        else:
+            self._saved_versions[namespace] = version
+        self._indexes[namespace] = index
+        self._versions[namespace] = version
+        return index
+
+    def _save_index(self, namespace: str, index: _NamespaceIndex, version: int):
+        try:
+            os.makedirs(self._index_dir, exist_ok=True)
+            index.save(self._index_base(namespace), version)
+            self._saved_versions[namespace] = version
+        except OSError as e:
+            logger.warning(f"Could not save memory index for {namespace!r}: {e}")
+
+    @staticmethod
+    def _matches(value: dict, filter: Optional[dict]) -> bool:
+        return not filter or all(value.get(field) == expected for field, expected in filter.items())
+
+    def _search(self, op: SearchOp, vectors: Dict[Tuple[str, str], np.ndarray], now: float) -> List[SearchItem]:
+        namespaces = self._namespaces(op.namespace_prefix)
+        wanted = op.limit + op.offset
+        if op.query and self.embeddings is not None:
+            query = vectors[("query", op.query)]
+            candidates = []
+            for namespace in namespaces:
+                # Oversample when filtering, since filtered-out neighbours don't count
+                k = wanted * 4 if op.filter else wanted
+                candidates.extend((score, namespace, key)
+                                  for key, score in self._namespace_index(namespace, now).search(query, k))
+            candidates.sort(key=lambda candidate: -candidate[0])
+            results = []
+            for score, namespace, key in candidates:
+                row = self._conn.execute(
+                    "SELECT value, created_at, updated_at FROM items WHERE namespace = ? AND key = ?"
+                    " AND (expires_at IS NULL OR expires_at > ?)", (namespace, key, now)).fetchone()
+                if row is None or not self._matches(value := json.loads(row[0]), op.filter):
+                    continue
+                results.append(SearchItem(namespace=_ns_tuple(namespace), key=key, value=value,
+                                          created_at=_timestamp(row[1]), updated_at=_timestamp(row[2]), score=score))
+                if len(results) >= wanted:
+                    break
+            return results[op.offset:]
+
+        # No query: most recently updated first
+        results = []
+        placeholders = ",".join("?" * len(namespaces))
+        rows = self._conn.execute(
+            f"SELECT namespace, key, value, created_at, updated_at FROM items WHERE namespace IN ({placeholders})"
+            " AND (expires_at IS NULL OR expires_at > ?) ORDER BY updated_at DESC", (*namespaces, now))
+        for namespace, key, value, created_at, updated_at in rows:
+            value = json.loads(value)
+            if self._matches(value, op.filter):
+                results.append(SearchItem(namespace=_ns_tuple(namespace), key=key, value=value,
+                                          created_at=_timestamp(created_at), updated_at=_timestamp(updated_at)))
+                if len(results) >= wanted:
+                    break
+        return results[op.offset:]
+
+    def _list_namespaces(self, op: ListNamespacesOp, now: float) -> List[Tuple[str, ...]]:
+        namespaces = {_ns_tuple(ns) for (ns,) in self._conn.execute(
+            "SELECT DISTINCT namespace FROM items WHERE expires_at IS NULL OR expires_at > ?", (now,))}
+
+        def matches(namespace: Tuple[str, ...], condition) -> bool:
+            path = tuple(condition.path)
+            if len(path) > len(namespace):
+                return False
+            part = namespace[:len(path)] if condition.match_type == "prefix" else namespace[len(namespace) - len(path):]
+            return all(expected == "*" or expected == actual for expected, actual in zip(path, part))
+
+        selected = {namespace[:op.max_depth] if op.max_depth is not None else namespace
+                    for namespace in namespaces
+                    if all(matches(namespace, condition) for condition in op.match_conditions or ())}
+        return sorted(selected)[op.offset:op.offset + op.limit]
+
+    def close(self):
+        """Saves large indexes changed since they were loaded, then closes the database."""
+        with self._lock:
+            for namespace, index in self._indexes.items():
+                version = self._versions[namespace]
+                if (hnswlib is not None and len(index) >= settings.MEMORY_HNSW_PERSIST_MIN_ITEMS
+                        and self._saved_versions.get(namespace) != version):
+                    self._save_index(namespace, index, version)
+            self._conn.close()
@@ -0,0 +1,70 @@
+# benchmarks/bench_codec.py
+"""Micro-benchmark: in-process mu-law -> WAV codec vs. the old pydub/ffmpeg path.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_codec [--frames 500] [--frame-bytes 160]
+
+The pydub comparison is skipped when pydub (and ffmpeg) are not installed.
+"""
+import argparse
+import io
+import os
+import time
+
+from app.codec import ulaw_decode, ulaw_encode, ulaw_to_wav
+
+
+def _pydub_to_wav(ulaw: bytes) -> bytes:
+    from pydub import AudioSegment
+    audio = AudioSegment.from_file(io.BytesIO(ulaw), format="mulaw")
+    audio = audio.set_frame_rate(8000).set_channels(1).set_sample_width(2)
+    out = io.BytesIO()
+    audio.export(out, format="wav")
+    return out.getvalue()
+
+
+def _rate(fn, frames: list, min_seconds: float = 1.0) -> float:
+    """Returns frames/sec for ``fn`` over ``frames``, repeating for at least ``min_seconds``."""
+    processed = 0
+    start = time.perf_counter()
+    while True:
+        for frame in frames:
+            fn(frame)
+        processed += len(frames)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return processed / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=500, help="distinct frames in the working set")
+    parser.add_argument("--frame-bytes", type=int, default=160, help="bytes per frame (160 = one 20 ms Twilio frame)")
+    args = parser.parse_args()
+
+    frames = [os.urandom(args.frame_bytes) for _ in range(args.frames)]
+    pcm_frames = [ulaw_decode(frame) for frame in frames]
+
+    results = {
+        "codec ulaw_to_wav": _rate(ulaw_to_wav, frames),
+        "codec ulaw_decode": _rate(ulaw_decode, frames),
+        "codec ulaw_encode": _rate(ulaw_encode, pcm_frames),
+    }
+    try:
+        _pydub_to_wav(frames[0])
+    except Exception as e:  # pydub or ffmpeg missing
+        print(f"Skipping pydub baseline: {e}")
+    else:
+        results["pydub from_file/export"] = _rate(_pydub_to_wav, frames[:20], min_seconds=3.0)
+
+    print(f"{'path':<26}{'frames/sec':>14}")
+    for name, rate in results.items():
+        print(f"{name:<26}{rate:>14,.0f}")
+    if "pydub from_file/export" in results:
+        speedup = results["codec ulaw_to_wav"] / results["pydub from_file/export"]
+        print(f"ulaw_to_wav speedup over pydub: {speedup:,.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# benchmarks/bench_memory.py
+"""Recall latency of the persistent memory store at increasing sizes.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_memory [--sizes 10000,100000,1000000] [--dims 1536] [--callers 1]
+
+Memories are spread over ``--callers`` namespaces (``("memories", <number>)``)
+and every search targets one of them, so ``--callers 1`` (the default) is
+the worst case where a single caller owns the whole store. Embeddings come
+from a deterministic in-process fake, so the timings are the store's own
+(SQLite + ANN index), with the query embedding already cached as it would
+be for repeated recall. "first" is the first search after the memories were
+written, which builds that namespace's index; "reopen" is the first search
+after a restart, which loads the saved index instead (namespaces of at least
+``MEMORY_HNSW_PERSIST_MIN_ITEMS`` memories, with hnswlib installed).
+
+At 1M memories x 1536 dims the store needs roughly 12 GB of disk and 6 GB of
+RAM for the index; pass a smaller ``--dims`` to try the size on a laptop.
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langgraph.store.base import PutOp
+
+from app import vector_store
+from app.vector_store import PersistentVectorStore
+
+
+class _FakeEmbeddings(Embeddings):
+    """Random unit vectors seeded by the text, so equal texts embed equally."""
+
+    def __init__(self, dims: int):
+        self.dims = dims
+
+    def _vector(self, text: str) -> list:
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dims, dtype=np.float32).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def _percentile(samples: list, q: float) -> float:
+    return float(np.percentile(samples, q)) * 1000
+
+
+def _run(size: int, dims: int, callers: int, queries: int, batch: int, directory: str) -> dict:
+    path = os.path.join(directory, f"memories_{size}.sqlite3")
+    index = {"dims": dims, "embed": _FakeEmbeddings(dims), "fields": ["content"]}
+    store = PersistentVectorStore(path, index=index, ttl_s=None, max_items_per_namespace=size,
+                                  embedding_cache_size=queries)
+    start = time.perf_counter()
+    for offset in range(0, size, batch):
+        store.batch([PutOp(("memories", f"+1555{i % callers:07d}"), f"m{i}", {"content": f"memory {i}"})
+                     for i in range(offset, min(offset + batch, size))])
+    build_s = time.perf_counter() - start
+    store.close()
+
+    # Reopen so the first search pays for building the namespace's index
+    store = PersistentVectorStore(path, index=index, ttl_s=None, max_items_per_namespace=size,
+                                  embedding_cache_size=queries)
+    texts = [f"what did they say about {i}" for i in range(queries)]
+    for text in texts:
+        store.search(("warm-up",), query=text, limit=1)  # Caches the query embeddings only
+    namespace = ("memories", "+15550000000")
+    start = time.perf_counter()
+    store.search(namespace, query=texts[0], limit=5)
+    first_ms = (time.perf_counter() - start) * 1000
+
+    samples = []
+    for text in texts:
+        start = time.perf_counter()
+        store.search(namespace, query=text, limit=5)
+        samples.append(time.perf_counter() - start)
+    store.close()
+
+    store = PersistentVectorStore(path, index=index, ttl_s=None, max_items_per_namespace=size,
+                                  embedding_cache_size=queries)
+    start = time.perf_counter()
+    store.search(namespace, query=texts[0], limit=5)
+    reopen_ms = (time.perf_counter() - start) * 1000
+    store.close()
+    return {"size": size, "build_s": build_s, "first_ms": first_ms, "reopen_ms": reopen_ms,
+            "p50_ms": _percentile(samples, 50), "p95_ms": _percentile(samples, 95), "p99_ms": _percentile(samples, 99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated store sizes")
+    parser.add_argument("--dims", type=int, default=1536, help="embedding dimensions")
+    parser.add_argument("--callers", type=int, default=1, help="namespaces the memories are spread over")
+    parser.add_argument("--queries", type=int, default=200, help="timed searches per size")
+    parser.add_argument("--batch", type=int, default=5000, help="memories written per store batch")
+    parser.add_argument("--dir", default=None, help="where to create the stores (default: a temp dir)")
+    args = parser.parse_args()
+
+    print(f"ANN backend: {'hnswlib' if vector_store.hnswlib is not None else 'numpy (exact)'}, "
+          f"dims={args.dims}, callers={args.callers}")
+    print(f"{'memories':>10}{'write s':>10}{'first ms':>10}{'reopen ms':>11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        for size in (int(size) for size in args.sizes.split(",")):
+            result = _run(size, args.dims, args.callers, args.queries, args.batch, directory)
+            print(f"{result['size']:>10,}{result['build_s']:>10.1f}{result['first_ms']:>10.1f}{result['reopen_ms']:>11.1f}"
+                  f"{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# benchmarks/fakes.py
+"""Local stand-ins for the external services the voice pipeline talks to.
+
+Each fake is a small FastAPI app that can be served with uvicorn, e.g.:
+
+    uvicorn benchmarks.fakes:whisper_app --port 9000
+    uvicorn benchmarks.fakes:supabase_app --port 54321
+
+or all together, with their latencies set on the command line:
+
+    python -m benchmarks.fakes [--groq-tokens-per-s 50] [--tts-first-byte-ms 150] ...
+
+and selected by pointing the matching setting (``WHISPER_API_URL``,
+``SUPABASE_URL``, ``GROQ_BASE_URL``, ``ELEVENLABS_API_BASE_URL``) at it.
+Latencies live on each app's ``state`` and default to roughly what the real
+services show from a nearby region.
+"""
+import argparse
+import asyncio
+import json
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+WAV_HEADER_SIZE = 44
+PCM_BYTES_PER_SECOND = 16000  # 8 kHz, 16-bit mono
+ULAW_BYTES_PER_SECOND = 8000
+
+whisper_app = FastAPI(title="Fake Whisper")
+whisper_app.state.latency_ms = 150  # After the upload completes
+
+
+@whisper_app.post("/v1/audio/transcriptions")
+async def fake_transcription(request: Request):
+    """Accepts a (possibly chunked) multipart WAV upload and returns a canned transcript.
+
+    The text reports the uploaded duration so callers can check that whole
+    utterances, not fragments, were sent. With ``stream=true`` the answer is
+    delivered as server-sent events, one segment per second of audio.
+    """
+    form = await request.form()
+    audio = await form["file"].read()
+    await asyncio.sleep(whisper_app.state.latency_ms / 1000)
+    seconds = max(len(audio) - WAV_HEADER_SIZE, 0) / PCM_BYTES_PER_SECOND
+    words = [f"word{i}" for i in range(max(1, int(seconds)))]
+    if form.get("stream") != "true":
+        return JSONResponse({"text": " ".join(words), "duration": seconds})
+
+    async def events():
+        for word in words:
+            yield f"data: {json.dumps({'text': word})}\n\n"
+            await asyncio.sleep(0)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+supabase_app = FastAPI(title="Fake Supabase (PostgREST + Storage)")
+supabase_app.state.tables = {}  # table name -> list of rows
+supabase_app.state.objects = {}  # "bucket/path" -> bytes
+
+
+def _matches(row: dict, filters: dict) -> bool:
+    for column, condition in filters.items():
+        op, _, value = condition.partition(".")
+        if op == "eq" and str(row.get(column)) != value:
+            return False
+    return True
+
+
+def _filters(request: Request) -> dict:
+    reserved = {"select", "order", "limit", "offset"}
+    return {k: v for k, v in request.query_params.items() if k not in reserved}
+
+
+@supabase_app.post("/rest/v1/{table}")
+async def fake_insert(table: str, request: Request):
+    body = await request.json()
+    rows = body if isinstance(body, list) else [body]
+    stored = supabase_app.state.tables.setdefault(table, [])
+    inserted = []
+    for row in rows:
+        record = {"id": len(stored) + 1, **row}
+        stored.append(record)
+        inserted.append(record)
+    return JSONResponse(inserted, status_code=201)
+
+
+@supabase_app.patch("/rest/v1/{table}")
+async def fake_update(table: str, request: Request):
+    data = await request.json()
+    filters = _filters(request)
+    updated = []
+    for row in supabase_app.state.tables.get(table, []):
+        if _matches(row, filters):
+            row.update(data)
+            updated.append(row)
+    return JSONResponse(updated)
+
+
+@supabase_app.get("/rest/v1/{table}")
+async def fake_select(table: str, request: Request):
+    rows = [row for row in supabase_app.state.tables.get(table, []) if _matches(row, _filters(request))]
+    if "limit" in request.query_params:
+        rows = rows[:int(request.query_params["limit"])]
+    return JSONResponse(rows)
+
+
+@supabase_app.post("/storage/v1/object/{bucket}/{path:path}")
+async def fake_upload(bucket: str, path: str, request: Request):
+    supabase_app.state.objects[f"{bucket}/{path}"] = await request.body()
+    return JSONResponse({"Key": f"{bucket}/{path}"})
+
+
+@supabase_app.get("/storage/v1/object/public/{bucket}/{path:path}")
+async def fake_download(bucket: str, path: str):
+    data = supabase_app.state.objects.get(f"{bucket}/{path}")
+    if data is None:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    return Response(data, media_type="application/octet-stream")
+
+
+groq_app = FastAPI(title="Fake Groq (OpenAI-compatible chat completions)")
+groq_app.state.first_token_ms = 200
+groq_app.state.tokens_per_second = 50
+groq_app.state.reply = ("Thanks for calling, I can help with that. Let me pull up the details for you, "
+                        "it will only take a moment. Is there anything else you would like me to check?")
+
+
+@groq_app.post("/openai/v1/chat/completions")
+async def fake_chat_completion(request: Request):
+    """Streams a canned reply as server-sent events, one word per token, at
+    ``tokens_per_second`` after ``first_token_ms``."""
+    body = await request.json()
+    words = groq_app.state.reply.split(" ")[:body.get("max_tokens") or None]
+    model = body.get("model", "fake")
+
+    def chunk(delta: dict, finish_reason=None) -> str:
+        return "data: " + json.dumps({
+            "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}],
+        }) + "\n\n"
+
+    async def events():
+        await asyncio.sleep(groq_app.state.first_token_ms / 1000)
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(1 / groq_app.state.tokens_per_second)
+            yield chunk({"role": "assistant", "content": word if i == 0 else f" {word}"})
+        yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    if not body.get("stream"):
+        return JSONResponse({"error": {"message": "Only streaming completions are faked"}}, status_code=400)
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+elevenlabs_app = FastAPI(title="Fake ElevenLabs")
+elevenlabs_app.state.first_byte_ms = 150
+elevenlabs_app.state.ms_per_char = 60  # Speech length per character of text
+elevenlabs_app.state.realtime_factor = 4.0  # Audio is generated this much faster than it plays
+elevenlabs_app.state.chunk_ms = 200
+
+
+@elevenlabs_app.post("/v1/text-to-speech/{voice_id}/stream")
+async def fake_tts_stream(voice_id: str, request: Request):
+    """Streams mu-law 8 kHz audio for the text in chunks of ``chunk_ms``
+    (low-level noise, so it's never mistaken for the caller's speech)."""
+    body = await request.json()
+    state = elevenlabs_app.state
+    total = int(len(body.get("text", "")) * state.ms_per_char * ULAW_BYTES_PER_SECOND / 1000)
+    chunk_bytes = state.chunk_ms * ULAW_BYTES_PER_SECOND // 1000
+    audio = bytes([0xFE, 0x7E]) * (chunk_bytes // 2)
+
+    async def chunks():
+        await asyncio.sleep(state.first_byte_ms / 1000)
+        for offset in range(0, total, chunk_bytes):
+            if offset:
+                await asyncio.sleep(state.chunk_ms / 1000 / state.realtime_factor)
+            yield audio[:min(chunk_bytes, total - offset)]
+
+    return StreamingResponse(chunks(), media_type="audio/basic")
+
+
+async def serve(apps: dict, host: str = "127.0.0.1"):
+    """Serves each app ({port: app}) with uvicorn on one event loop."""
+    import uvicorn
+    servers = [uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+               for port, app in apps.items()]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve every fake service at once.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--whisper-port", type=int, default=9000)
+    parser.add_argument("--supabase-port", type=int, default=54321)
+    parser.add_argument("--groq-port", type=int, default=9001)
+    parser.add_argument("--elevenlabs-port", type=int, default=9002)
+    parser.add_argument("--whisper-latency-ms", type=float, default=whisper_app.state.latency_ms)
+    parser.add_argument("--groq-first-token-ms", type=float, default=groq_app.state.first_token_ms)
+    parser.add_argument("--groq-tokens-per-s", type=float, default=groq_app.state.tokens_per_second)
+    parser.add_argument("--tts-first-byte-ms", type=float, default=elevenlabs_app.state.first_byte_ms)
+    parser.add_argument("--tts-realtime-factor", type=float, default=elevenlabs_app.state.realtime_factor)
+    args = parser.parse_args()
+
+    whisper_app.state.latency_ms = args.whisper_latency_ms
+    groq_app.state.first_token_ms = args.groq_first_token_ms
+    groq_app.state.tokens_per_second = args.groq_tokens_per_s
+    elevenlabs_app.state.first_byte_ms = args.tts_first_byte_ms
+    elevenlabs_app.state.realtime_factor = args.tts_realtime_factor
+    asyncio.run(serve({args.whisper_port: whisper_app, args.supabase_port: supabase_app,
+                       args.groq_port: groq_app, args.elevenlabs_port: elevenlabs_app}, args.host))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+# benchmarks/load_test.py
+"""Offline load test of the voice pipeline: N simulated Twilio calls at once.
+
+Run from the repository root (Linux; needs Redis at ``--redis-url``):
+
+    python -m benchmarks.load_test [--calls 1,5,10,20] [--turns 3] [--audio caller.ulaw]
+
+The app is started with uvicorn against the local stand-ins in
+``benchmarks.fakes`` (Whisper, Groq, ElevenLabs, Supabase), each in its own
+process. Every simulated call gets a call row and Redis call state as
+``/make-call`` would create them. It then opens ``/media-stream`` like Twilio
+does and, for each turn, replays the caller audio in real time (20 ms
+frames, followed by silence). A turn's latency runs from the caller's last
+frame of speech to the first frame of the reply, so it includes the
+endpointer's trailing silence (``VAD_SILENCE_MS``). Twilio's "mark" echoes are
+sent once the reply's audio would have finished playing.
+
+``--audio`` is raw 8 kHz mu-law, as Twilio records it. The default is a
+synthesized 1.5 s tone. Each concurrency level reports these figures:
+
+- client-side turn latency percentiles;
+- the server's own mouth-to-ear p95, from ``/metrics``;
+- event-loop lag p99 and max (bucket upper bounds);
+- the app's CPU use and RSS growth per call.
+
+The capacity is the largest level whose p95 turn latency stays within
+``--slo-ms`` with every turn answered.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+import numpy as np
+import websockets
+
+from app.codec import SAMPLE_RATE, ulaw_encode
+
+FRAME_BYTES = 160  # 20 ms
+FRAME_S = 0.02
+ULAW_SILENCE = bytes([0xFF]) * FRAME_BYTES
+_SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+
+
+def _tone(seconds: float = 1.5, hz: float = 220.0) -> bytes:
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return ulaw_encode((np.sin(2 * np.pi * hz * t) * 8000).astype(np.int16))
+
+
+def _frames(audio: bytes) -> list:
+    audio += ULAW_SILENCE[:(-len(audio)) % FRAME_BYTES]
+    return [audio[i:i + FRAME_BYTES] for i in range(0, len(audio), FRAME_BYTES)]
+
+
+def _percentile(samples: list, q: float) -> float:
+    return float(np.percentile(samples, q)) * 1000 if samples else float("nan")
+
+
+class _Proc:
+    """CPU seconds and RSS of a process, from /proc."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+
+    def cpu_s(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks  # utime + stime
+
+    def rss_mb(self) -> float:
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+
+def _parse_metrics(text: str) -> dict:
+    """Prometheus text -> {(name, labels): value}."""
+    samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match:
+            samples[(match.group(1), match.group(2) or "")] = float(match.group(3))
+    return samples
+
+
+def _histogram_quantile(before: dict, after: dict, name: str, q: float, labels: str = "") -> float:
+    """Upper bound of the bucket holding quantile ``q`` of what was observed in between, in ms."""
+    buckets = []
+    for (sample, sample_labels), value in after.items():
+        if sample != f"{name}_bucket" or not sample_labels.startswith(labels):
+            continue
+        bound = re.search(r'le="([^"]+)"', sample_labels).group(1)
+        buckets.append((float(bound), value - before.get((sample, sample_labels), 0.0)))
+    buckets.sort()
+    if not buckets or buckets[-1][1] == 0:
+        return float("nan")
+    target = q * buckets[-1][1]
+    return next(bound for bound, count in buckets if count >= target) * 1000
+
+
+class _Call:
+    """One simulated Twilio media stream."""
+
+    def __init__(self, url: str, call_sid: str, frames: list, turns: int, reply_gap_s: float, timeout_s: float):
+        self.url = url
+        self.call_sid = call_sid
+        self.stream_sid = f"MZ{uuid.uuid4().hex}"
+        self.frames = frames
+        self.turns = turns
+        self.reply_gap = reply_gap_s
+        self.timeout = timeout_s
+        self.latencies = []
+        self.unanswered = 0
+        self._first_media = None  # Set by the receiver once a reply starts
+        self._last_media = 0.0
+        self._played_until = 0.0  # When the audio sent so far would finish playing
+
+    async def run(self):
+        async with websockets.connect(self.url, max_size=None) as ws:
+            receiver = asyncio.create_task(self._receive(ws))
+            try:
+                await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+                await ws.send(json.dumps({"event": "start", "streamSid": self.stream_sid,
+                                          "start": {"streamSid": self.stream_sid, "callSid": self.call_sid,
+                                                    "mediaFormat": {"encoding": "audio/x-mulaw",
+                                                                    "sampleRate": 8000, "channels": 1}}}))
+                for _ in range(self.turns):
+                    await self._turn(ws)
+                await ws.send(json.dumps({"event": "stop", "streamSid": self.stream_sid,
+                                          "stop": {"callSid": self.call_sid}}))
+            finally:
+                receiver.cancel()
+                await asyncio.gather(receiver, return_exceptions=True)
+
+    async def _send_frame(self, ws, frame: bytes, due: float):
+        await asyncio.sleep(max(due - time.monotonic(), 0))
+        await ws.send(json.dumps({"event": "media", "streamSid": self.stream_sid,
+                                  "media": {"payload": base64.b64encode(frame).decode("ascii")}}))
+
+    async def _turn(self, ws):
+        self._first_media = None
+        start = time.monotonic()
+        for i, frame in enumerate(self.frames):
+            await self._send_frame(ws, frame, start + i * FRAME_S)
+        speech_end = time.monotonic()
+        # Like a phone line, keep sending silence until the reply has played out
+        i = 0
+        while True:
+            now = time.monotonic()
+            if self._first_media is None and now - speech_end > self.timeout:
+                self.unanswered += 1
+                return
+            if (self._first_media is not None and now - self._last_media > self.reply_gap
+                    and now >= self._played_until):
+                break
+            await self._send_frame(ws, ULAW_SILENCE, speech_end + i * FRAME_S)
+            i += 1
+        self.latencies.append(self._first_media - speech_end)
+
+    async def _receive(self, ws):
+        async for message in ws:
+            data = json.loads(message)
+            event = data.get("event")
+            now = time.monotonic()
+            if event == "media":
+                if self._first_media is None:
+                    self._first_media = now
+                self._last_media = now
+                # Twilio plays frames back to back from when the first one arrived
+                self._played_until = max(self._played_until, now) + FRAME_S
+            elif event == "mark":
+                # Echoed once everything before it has played
+                asyncio.create_task(self._echo_mark(ws, data["mark"], self._played_until - now))
+            elif event == "clear":
+                self._played_until = now
+
+    async def _echo_mark(self, ws, mark: dict, delay: float):
+        await asyncio.sleep(max(delay, 0))
+        try:
+            await ws.send(json.dumps({"event": "mark", "streamSid": self.stream_sid, "mark": mark}))
+        except websockets.ConnectionClosed:
+            pass
+
+
+async def _seed_call(http: httpx.AsyncClient, redis, supabase_url: str) -> str:
+    """Creates the call row and Redis call state ``/make-call`` would (Twilio itself isn't involved)."""
+    call_sid = f"CA{uuid.uuid4().hex}"
+    response = await http.post(f"{supabase_url}/rest/v1/calls", json=[{
+        "twilio_sid": call_sid, "from_number": "+15550000000", "to_number": "+15551234567", "status": "initiated"}])
+    response.raise_for_status()
+    await redis.hset(f"call_state:{call_sid}", mapping={
+        "call_db_id": str(response.json()[0]["id"]),
+        "system_prompt": "You are a helpful phone assistant.",
+        "instructions": "Keep answers short.",
+        "context": "",
+        "to_number": "+15551234567",
+        "human_in_loop": "false",
+    })
+    await redis.expire(f"call_state:{call_sid}", 3600)
+    return call_sid
+
+
+async def _run_level(calls: int, args, frames: list, app_url: str, supabase_url: str, proc: _Proc, redis) -> dict:
+    async with httpx.AsyncClient(timeout=10.0) as http:
+        call_sids = [await _seed_call(http, redis, supabase_url) for _ in range(calls)]
+        before = _parse_metrics((await http.get(f"{app_url}/metrics")).text)
+        cpu_start, rss_start, wall_start = proc.cpu_s(), proc.rss_mb(), time.monotonic()
+        rss_peak = rss_start
+
+        async def sample_rss():
+            nonlocal rss_peak
+            while True:
+                rss_peak = max(rss_peak, proc.rss_mb())
+                await asyncio.sleep(0.5)
+
+        ws_url = app_url.replace("http", "ws", 1) + "/media-stream"
+        simulated = [_Call(ws_url, sid, frames, args.turns, args.reply_gap_ms / 1000, args.turn_timeout_s)
+                     for sid in call_sids]
+        sampler = asyncio.create_task(sample_rss())
+        results = await asyncio.gather(*(call.run() for call in simulated), return_exceptions=True)
+        sampler.cancel()
+        cpu_s, wall_s = proc.cpu_s() - cpu_start, time.monotonic() - wall_start
+        after = _parse_metrics((await http.get(f"{app_url}/metrics")).text)
+
+    latencies = [latency for call in simulated for latency in call.latencies]
+    return {
+        "calls": calls,
+        "failed": sum(isinstance(result, Exception) for result in results),
+        "unanswered": sum(call.unanswered for call in simulated),
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "p99_ms": _percentile(latencies, 99),
+        "server_p95_ms": _histogram_quantile(before, after, "voice_turn_span_seconds", 0.95, 'span="mouth_to_ear"'),
+        "lag_p99_ms": _histogram_quantile(before, after, "event_loop_lag_seconds", 0.99),
+        "lag_max_ms": _histogram_quantile(before, after, "event_loop_lag_seconds", 1.0),
+        "cpu_pct": 100 * cpu_s / wall_s,
+        "cpu_ms_per_call_s": 1000 * cpu_s / (calls * wall_s),
+        "rss_mb_per_call": (rss_peak - rss_start) / calls,
+    }
+
+
+async def _wait_until_up(url: str, process: subprocess.Popen, timeout_s: float = 30.0):
+    deadline = time.monotonic() + timeout_s
+    async with httpx.AsyncClient(timeout=1.0) as http:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode}")
+            try:
+                await http.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout_s:.0f}s")
+
+
+async def _main(args):
+    import aioredis
+
+    host = "127.0.0.1"
+    ports = {name: args.base_port + i for i, name in enumerate(("app", "whisper", "supabase", "groq", "elevenlabs"))}
+    urls = {name: f"http://{host}:{port}" for name, port in ports.items()}
+    env = {
+        **os.environ,
+        "WHISPER_API_URL": f"{urls['whisper']}/v1/audio/transcriptions",
+        "SUPABASE_URL": urls["supabase"],
+        "GROQ_BASE_URL": urls["groq"],
+        "ELEVENLABS_API_BASE_URL": f"{urls['elevenlabs']}/v1",
+        "REDIS_URL": args.redis_url,
+        "HTTP2_ENABLED": "false",  # The stand-ins speak HTTP/1.1 only
+        "MEMORY_STORE_PATH": os.path.join(args.workdir, "load_test_memory.sqlite3"),
+    }
+    for name in ("GROQ_API_KEY", "ELEVENLABS_API_KEY", "TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_NUMBER",
+                 "VOICE_ID", "GOOGLE_API_KEY", "SUPABASE_KEY", "SUPABASE_BUCKET"):
+        env.setdefault(name, "load-test")
+    for name in ("TTS_CACHE_ENABLED", "RESPONSE_CACHE_ENABLED"):
+        env.setdefault(name, "false")  # Measure the provider path; set them to load-test the caches
+
+    fakes = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fakes", "--host", host,
+        "--whisper-port", str(ports["whisper"]), "--supabase-port", str(ports["supabase"]),
+        "--groq-port", str(ports["groq"]), "--elevenlabs-port", str(ports["elevenlabs"]),
+        "--whisper-latency-ms", str(args.whisper_latency_ms), "--groq-first-token-ms", str(args.groq_first_token_ms),
+        "--groq-tokens-per-s", str(args.groq_tokens_per_s), "--tts-first-byte-ms", str(args.tts_first_byte_ms),
+        "--tts-realtime-factor", str(args.tts_realtime_factor)], env=env)
+    app = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", host,
+                            "--port", str(ports["app"]), "--log-level", "warning"], env=env)
+    redis = aioredis.from_url(args.redis_url, decode_responses=True)
+    try:
+        for name in ("whisper", "supabase", "groq", "elevenlabs"):
+            await _wait_until_up(urls[name] + "/docs", fakes)
+        await _wait_until_up(urls["app"] + "/startup", app)
+
+        audio = open(args.audio, "rb").read() if args.audio else _tone()
+        frames = _frames(audio)  # The silence that follows ends the utterance
+        proc = _Proc(app.pid)
+        print(f"caller audio {len(audio) / SAMPLE_RATE:.1f}s, {args.turns} turns per call, "
+              f"SLO p95 <= {args.slo_ms:.0f} ms, app RSS at start {proc.rss_mb():.0f} MB")
+        print(f"{'calls':>6}{'failed':>7}{'unans.':>7}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}{'srv p95':>8}"
+              f"{'lag p99':>8}{'lag max':>8}{'CPU %':>7}{'CPU ms/call-s':>14}{'MB/call':>8}")
+        capacity = 0
+        for calls in (int(calls) for calls in args.calls.split(",")):
+            r = await _run_level(calls, args, frames, urls["app"], urls["supabase"], proc, redis)
+            print(f"{r['calls']:>6}{r['failed']:>7}{r['unanswered']:>7}{r['p50_ms']:>8.0f}{r['p95_ms']:>8.0f}"
+                  f"{r['p99_ms']:>8.0f}{r['server_p95_ms']:>8.0f}{r['lag_p99_ms']:>8.1f}{r['lag_max_ms']:>8.1f}"
+                  f"{r['cpu_pct']:>7.0f}{r['cpu_ms_per_call_s']:>14.1f}{r['rss_mb_per_call']:>8.2f}")
+            if r["failed"] or r["unanswered"] or not r["p95_ms"] <= args.slo_ms:
+                break
+            capacity = calls
+        print(f"capacity: {capacity} concurrent calls within the SLO" if capacity
+              else "capacity: the SLO was not met at the lowest level")
+    finally:
+        await redis.close()
+        for process in (app, fakes):
+            process.terminate()
+            process.wait(timeout=15)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", default="1,5,10,20,40", help="comma-separated concurrency levels, in order")
+    parser.add_argument("--turns", type=int, default=3, help="caller turns per call")
+    parser.add_argument("--audio", default=None, help="caller utterance as raw 8 kHz mu-law (default: a tone)")
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="p95 turn latency the capacity is judged by")
+    parser.add_argument("--reply-gap-ms", type=float, default=1500.0,
+                        help="no reply audio for this long means the reply has ended")
+    parser.add_argument("--turn-timeout-s", type=float, default=10.0, help="a turn without a reply by then fails")
+    parser.add_argument("--base-port", type=int, default=18000, help="app port; the fakes use the next four")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15", help="Redis the app under test uses")
+    parser.add_argument("--workdir", default=".", help="where the app's memory store is created")
+    parser.add_argument("--whisper-latency-ms", type=float, default=150.0)
+    parser.add_argument("--groq-first-token-ms", type=float, default=200.0)
+    parser.add_argument("--groq-tokens-per-s", type=float, default=50.0)
+    parser.add_argument("--tts-first-byte-ms", type=float, default=150.0)
+    parser.add_argument("--tts-realtime-factor", type=float, default=4.0)
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()